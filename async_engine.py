@@ -0,0 +1,423 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import argparse
+import asyncio
+import time
+
+import bulk_data_opt
+from bulk_data_opt import (
+    cleanup_temp_dataset, create_clients, create_target_dataset, dataset_locations, dataset_logger, dataset_summary,
+    delete_source_dataset, discover_tables, load_region_inventory, prepare_backup_dataset,
+    prepare_temp_dataset, preview_table_ids, print_run_summary, run_journaled, validate_copy
+)
+from copy_engine import (
+    OPERATION_COPY, CopyReport, CopyResult, CopyStats, CopyTask, check_existing_copy, operation_for, resubmit_throttled, submit_job
+)
+from job_tracker import shared_tracker
+from metrics import MigrationMetrics
+from progress import shared_progress, show_progress
+from migration_journal import MigrationJournal
+from rate_control import MAX_THROTTLE_RETRIES, shared_controller
+
+# Table steps (copy, backup or move of one table) in progress at once, across all datasets
+ASYNC_MAX_TABLES = 10000
+
+# Threads that run blocking client calls (metadata lookups, submissions, journal writes)
+BLOCKING_CALL_WORKERS = 32
+
+
+class AsyncCopyEngine:
+    """Runs copy jobs as coroutines instead of one blocked thread per job
+
+    A global semaphore caps the table steps in progress, the shared
+    SubmissionController still decides how many jobs are submitted at once,
+    and completions arrive through JobTracker callbacks, so waiting for ten
+    thousand jobs costs no threads at all. Blocking client calls run on a
+    small thread pool.
+    """
+
+    def __init__(self, max_tables=ASYNC_MAX_TABLES, workers=BLOCKING_CALL_WORKERS, tracker=None, controller=None):
+        self.semaphore = asyncio.Semaphore(max_tables)
+        self.tracker = tracker or shared_tracker()
+        self.controller = controller or shared_controller()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bq-call")
+        self._slots = asyncio.Condition()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def blocking(self, fn, *args, **kwargs):
+        """Run a blocking call on the engine's thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def wait_for_job(self, client, job):
+        """Wait until the tracker sees the job finish and return the finished job"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def finished(finished_job):
+            # Runs on the tracker thread
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(finished_job))
+
+        self.tracker.track(client, job, callback=finished)
+        return await future
+
+    async def acquire_slot(self):
+        async with self._slots:
+            await self._slots.wait_for(self.controller.try_acquire)
+
+    async def release_slot(self, throttled=False):
+        self.controller.release(throttled)
+        async with self._slots:
+            # Wake only as many waiters as there are free slots
+            self._slots.notify(max(1, self.controller.free_slots()))
+
+    async def submit_and_wait(self, client, task, location, operation_type, log=print, on_retry=None, job_id=None,
+                              on_slot=None):
+        """Coroutine version of copy_engine.submit_and_wait"""
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            await self.acquire_slot()
+            if on_slot is not None:
+                on_slot()
+            throttled = False
+            try:
+                copy_job = await self.blocking(
+                    submit_job, client, task, location, operation_type, self.controller, job_id, log, on_retry
+                )
+                # A job taken over from an earlier run may already be done
+                finished = copy_job if copy_job.state == "DONE" else await self.wait_for_job(client, copy_job)
+                try:
+                    return finished.result()
+                except Exception as e:
+                    if not resubmit_throttled(e, attempt, task, log):
+                        raise
+                    throttled = True
+            finally:
+                await self.release_slot(throttled)
+            self.controller.on_throttled()
+            if on_retry is not None:
+                on_retry()
+            await asyncio.sleep(self.controller.backoff_delay(attempt))
+
+    async def run_copy_job(self, client, task, step="copy", location=None, log=print,
+                           operation_type=OPERATION_COPY, stats=None, incremental=False, metrics=None, run_id=None):
+        """Coroutine version of copy_engine.run_copy_job, with the same fallback and reporting"""
+        async with self.semaphore:
+            return await self._run_copy_job(
+                client, task, step, location, log, operation_type, stats, incremental, metrics, run_id
+            )
+
+    async def _run_copy_job(self, client, task, step, location, log, operation_type, stats, incremental, metrics,
+                            run_id=None):
+        report = CopyReport(task, step, operation_type, log, stats, metrics)
+        try:
+            if incremental and await self.blocking(check_existing_copy, client, task, log):
+                return report.unchanged()
+            job_id = report.submitting(run_id)
+            await self.submit_and_wait(
+                client, task, location, operation_type, log, report.retried, job_id, report.slot_acquired
+            )
+            return report.succeeded()
+        except Exception as e:
+            if not report.falls_back(e):
+                return report.failed(e)
+        return await self._run_copy_job(
+            client, task, step, location, log, OPERATION_COPY, stats, False, metrics, run_id
+        )
+
+
+async def run_journaled_async(engine, journal, dataset, step, table, coroutine_fn, log=print, metrics=None, entry=None):
+    """Coroutine version of run_journaled for table steps"""
+    progress = shared_progress()
+    if journal.is_done(dataset, step, table):
+        log(f"Skipping {step} of table {table}: already completed in a previous run")
+        progress.table_step_finished(dataset, step, table, entry, resumed=True)
+        return True
+    started = time.monotonic()
+    try:
+        if metrics is None:
+            result = await coroutine_fn()
+        else:
+            with metrics.step(dataset, step, table, entry.num_bytes, entry.num_rows) as record:
+                result = await coroutine_fn()
+                if result is False:
+                    record["status"] = "failed"
+    except Exception:
+        progress.table_step_finished(dataset, step, table, entry, ok=False)
+        raise
+    if result is not False:
+        details = result._asdict() if isinstance(result, CopyResult) else {}
+        await engine.blocking(
+            journal.record, dataset, step, table, seconds=round(time.monotonic() - started, 3), **details
+        )
+    progress.table_step_finished(dataset, step, table, entry, ok=result is not False)
+    return result
+
+
+async def migrate_dataset_async(engine, us_client, eu_client, source_dataset, journal, preloaded_tables=None,
+                                metrics=None, locations=None):
+    """Coroutine version of bulk_data_opt.migrate_dataset: same steps, journal and summary, without partition copies"""
+    log = dataset_logger(source_dataset)
+    log(f"{'=' * 80}")
+    log(f"Processing dataset: {source_dataset}")
+    log(f"{'=' * 80}")
+    summary = dataset_summary(source_dataset)
+
+    # Steps 0 and 1, shared with bulk_data_opt.migrate_dataset: copying starts with the first page of tables
+    pages = await engine.blocking(
+        discover_tables, us_client, eu_client, source_dataset, journal, summary, preloaded_tables, log, locations
+    )
+    if pages is None:
+        return summary
+
+    project = us_client.project
+    # Copy job IDs derive from it, so a restart reattaches to the jobs a crashed run left behind
+    run_id = await engine.blocking(journal.run_id)
+    backup_dataset = f"{source_dataset}_old"
+    temp_eu_dataset = f"{source_dataset}_EU"
+    # Every table listed so far, in listing order, and their IDs
+    tables = []
+    table_ids = []
+    results = {}
+    failed = {}
+    skipped = set()
+
+    async def step(name, awaitable):
+        # Same bookkeeping as TaskGraph: an exception marks the step failed, False is a soft failure
+        try:
+            results[name] = await awaitable
+            return results[name]
+        except Exception as e:
+            failed[name] = e
+            log(f"Task {name} failed: {e}")
+            return None
+
+    def dataset_step(name, fn):
+        return step(name, engine.blocking(run_journaled, journal, source_dataset, name, fn, None, log, metrics))
+
+    def table_step(name, table, job):
+        return step(f"{name}:{table.table_id}", run_journaled_async(
+            engine, journal, source_dataset, name, table.table_id, job, log, metrics, table
+        ))
+
+    def completed(*names):
+        # Like a TaskGraph `requires` edge: the steps ran and none of them raised or returned False
+        return all(name not in failed and name not in skipped and results.get(name) is not False for name in names)
+
+    def skip(name, dependency):
+        skipped.add(name)
+        log(f"Skipping {name}: dependency {dependency} did not complete")
+        return None
+
+    keep_tables = bulk_data_opt.INCREMENTAL_COPY or journal.is_done(source_dataset, "prepare_temp")
+    prepare_temp = asyncio.ensure_future(dataset_step(
+        "prepare_temp", partial(prepare_temp_dataset, eu_client, temp_eu_dataset, log, keep_tables=keep_tables)
+    ))
+    prepare_backup = asyncio.ensure_future(dataset_step(
+        "prepare_backup", partial(prepare_backup_dataset, us_client, backup_dataset, log)
+    ))
+
+    # Step 3: Copy all tables from source to temporary EU dataset
+    async def copy(table):
+        await prepare_temp
+        if not completed("prepare_temp"):
+            return skip(f"copy:{table.table_id}", "prepare_temp")
+        task = CopyTask(
+            table.table_id,
+            f"{project}.{source_dataset}.{table.table_id}",
+            f"{project}.{temp_eu_dataset}.{table.table_id}",
+            table.table_type,
+            table.num_bytes
+        )
+        return await table_step("copy", table, lambda: engine.run_copy_job(
+            eu_client, task, "copy", "US", log,  # Source data is in US
+            incremental=bulk_data_opt.INCREMENTAL_COPY,
+            metrics=metrics,
+            run_id=run_id
+        ))
+
+    # Step 6: Back up all tables (snapshot, clone or full copy depending on BACKUP_MODE)
+    async def backup(table):
+        await prepare_backup
+        if not completed("prepare_backup"):
+            return skip(f"backup:{table.table_id}", "prepare_backup")
+        task = CopyTask(
+            table.table_id,
+            f"{project}.{source_dataset}.{table.table_id}",
+            f"{project}.{backup_dataset}.{table.table_id}",
+            table.table_type,
+            table.num_bytes
+        )
+        return await table_step("backup", table, lambda: engine.run_copy_job(
+            us_client, task, "backup", None, log,
+            operation_type=operation_for(bulk_data_opt.BACKUP_MODE, table.table_type),
+            incremental=bulk_data_opt.INCREMENTAL_COPY,
+            metrics=metrics,
+            run_id=run_id
+        ))
+
+    copies = {}
+    backups = []
+
+    async def enumerate_tables():
+        # Start each page's copies and backups while the next page is read
+        while True:
+            page = await engine.blocking(next, pages, None)
+            if page is None:
+                return
+            for table in page:
+                tables.append(table)
+                table_ids.append(table.table_id)
+                copies[table.table_id] = asyncio.ensure_future(copy(table))
+                backups.append(asyncio.ensure_future(backup(table)))
+
+    await step("inventory", enumerate_tables())
+
+    # Step 4: Validate the copy
+    await asyncio.gather(*copies.values())
+    copied = [table_id for table_id in table_ids if copies[table_id].result()]
+    if not completed("inventory"):
+        skip("validate", "inventory")
+    elif completed("prepare_temp"):
+        await dataset_step("validate", lambda: validate_copy(
+            us_client, source_dataset, eu_client, temp_eu_dataset, table_ids,
+            [table_id for table_id in table_ids if table_id not in copied], log
+        ))
+    else:
+        skip("validate", "prepare_temp")
+
+    # Step 7: Delete original dataset (only once the copy is validated and every backup succeeded)
+    await asyncio.gather(*backups)
+    backup_names = [f"backup:{table_id}" for table_id in table_ids]
+    if completed("validate", *backup_names):
+        await dataset_step("delete_source", partial(delete_source_dataset, us_client, source_dataset, log))
+    else:
+        skip("delete_source", "validate or a backup")
+
+    # Step 8: Create final dataset with original name in EU (the name is only free once the source is gone)
+    if completed("delete_source"):
+        await dataset_step("create_target", partial(create_target_dataset, eu_client, source_dataset, log))
+    else:
+        skip("create_target", "delete_source")
+
+    # Step 9: Move all tables from temporary to final dataset (clone or full copy, see MOVE_MODE)
+    move_stats = CopyStats()
+
+    async def move(table):
+        if table.table_id not in copied:
+            log(f"Skipping move of table {table.table_id}: it was not copied to EU")
+            results[f"move:{table.table_id}"] = False
+            return False
+        task = CopyTask(
+            table.table_id,
+            f"{project}.{temp_eu_dataset}.{table.table_id}",
+            f"{project}.{source_dataset}.{table.table_id}",
+            table.table_type,
+            table.num_bytes
+        )
+        return await table_step("move", table, lambda: engine.run_copy_job(
+            eu_client, task, "move", log=log,
+            operation_type=operation_for(bulk_data_opt.MOVE_MODE, table.table_type),
+            stats=move_stats,
+            incremental=bulk_data_opt.INCREMENTAL_COPY,
+            metrics=metrics,
+            run_id=run_id
+        ))
+
+    if completed("create_target"):
+        await asyncio.gather(*[move(table) for table in tables])
+        # Step 10: Clean up temporary EU dataset; until every move succeeded it holds the only EU copy
+        if completed(*[f"move:{table_id}" for table_id in table_ids]):
+            await dataset_step("cleanup_temp", partial(cleanup_temp_dataset, eu_client, temp_eu_dataset, log))
+        else:
+            skip("cleanup_temp", "a table move")
+    else:
+        skip("cleanup_temp", "create_target")
+
+    for line in move_stats.describe():
+        log(f"Step 9 {line}")
+
+    summary.update(copied=len(copied), failed_tables=[t for t in table_ids if t not in copied])
+    if summary["failed_tables"]:
+        log(f"{len(summary['failed_tables'])} tables failed to copy: {preview_table_ids(summary['failed_tables'])}")
+
+    if "inventory" in failed:
+        summary["detail"] = f"error listing tables: {failed['inventory']}"
+        return summary
+    for name in ("prepare_temp", "validate", "delete_source", "create_target", "cleanup_temp"):
+        if name in failed:
+            summary["detail"] = f"{name} failed: {failed[name]}"
+            return summary
+        if name in skipped:
+            summary["detail"] = f"{name} skipped"
+            return summary
+
+    log(f"Migration completed successfully for dataset: {source_dataset}!")
+    log(f"Backup dataset kept as: {backup_dataset} (US location)")
+    log(f"New dataset: {source_dataset} (EU location)")
+    await engine.blocking(journal.record, source_dataset, "complete")
+    summary["status"] = "migrated"
+    return summary
+
+
+async def migrate_datasets_async(max_tables=ASYNC_MAX_TABLES, clients=None):
+    """Migrate every configured dataset concurrently, one coroutine per dataset"""
+    try:
+        us_client, eu_client = clients or create_clients(pool_size=BLOCKING_CALL_WORKERS + 1)
+        print("Successfully initialized BigQuery clients")
+    except Exception as e:
+        print(f"Error initializing BigQuery clients: {e}")
+        return
+
+    journal = MigrationJournal(bulk_data_opt.MIGRATION_JOURNAL)
+    metrics = MigrationMetrics(bulk_data_opt.MIGRATION_METRICS, bulk_data_opt.PROMETHEUS_METRICS)
+    engine = AsyncCopyEngine(max_tables)
+    progress = shared_progress()
+    display = None
+    try:
+        source_datasets = bulk_data_opt.SOURCE_DATASETS
+        locations = await engine.blocking(dataset_locations, us_client)
+        inventories = await engine.blocking(load_region_inventory, us_client, source_datasets)
+        print(f"Migrating {len(source_datasets)} datasets with up to {max_tables} tables in progress")
+        progress.start(source_datasets)
+        if bulk_data_opt.SHOW_PROGRESS:
+            display = show_progress(bulk_data_opt.PROGRESS_INTERVAL)
+
+        async def migrate_one(source_dataset):
+            summary = await migrate_dataset_async(
+                engine, us_client, eu_client, source_dataset, journal, inventories.pop(source_dataset, None), metrics,
+                locations
+            )
+            progress.dataset_finished(summary)
+            return summary
+
+        results = await asyncio.gather(*[
+            migrate_one(source_dataset) for source_dataset in source_datasets
+        ], return_exceptions=True)
+    finally:
+        engine.close()
+        if display is not None:
+            display.stop()
+
+    summaries = []
+    for source_dataset, result in zip(source_datasets, results):
+        if isinstance(result, Exception):
+            dataset_logger(source_dataset)(f"Unexpected error during migration: {result}")
+            result = dataset_summary(source_dataset, detail=str(result))
+        summaries.append(result)
+
+    print_run_summary(summaries, metrics)
+    print("\nAll datasets processing completed!")
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Migrate BigQuery datasets from US to EU with the asyncio engine. Unlike bulk_data_opt.py it "
+                    "copies large partitioned tables in one job per table (PARTITION_COPY is ignored) and does not "
+                    "log the expected duration of each step."
+    )
+    parser.add_argument("--max-tables", type=int, default=ASYNC_MAX_TABLES,
+                        help="table steps in progress at once across all datasets")
+    args = parser.parse_args()
+    asyncio.run(migrate_datasets_async(args.max_tables))
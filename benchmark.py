@@ -0,0 +1,172 @@
+from contextlib import redirect_stdout
+import argparse
+import asyncio
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import async_engine
+import bulk_data_opt
+import job_tracker
+import metadata_cache
+import rate_control
+from fake_bigquery import FakeBigQuery
+from metadata_cache import CachedClient
+
+# Simulated estate: datasets, tables per dataset and the median table size (sizes are log-normal)
+BENCH_DATASETS = 8
+BENCH_TABLES = 25
+BENCH_MEDIAN_TABLE_BYTES = 200 * 1024 ** 2
+
+# Concurrency settings compared by default: copy jobs in flight per dataset x datasets in parallel
+BENCH_IN_FLIGHT = [5, 20, 50]
+BENCH_WORKERS = [1, 4]
+
+# The simulated jobs finish in milliseconds, so the pacing meant for real BigQuery is scaled down too
+BENCH_POLL_INTERVAL = 0.02
+BENCH_SUBMIT_RATE = 500.0
+BENCH_SUBMIT_BURST = 100
+
+
+def build_backend(args):
+    """A fake BigQuery project holding the simulated US datasets"""
+    backend = FakeBigQuery(
+        project=bulk_data_opt.PROJECT_ID,
+        job_latency=args.job_latency,
+        api_latency=args.api_latency,
+        quota_error_rate=args.quota_error_rate,
+        failure_rate=args.failure_rate,
+        concurrent_job_limit=args.concurrent_job_limit,
+        seed=args.seed
+    )
+    sizes = random.Random(args.seed)
+    datasets = [f"bench_dataset_{index:03d}" for index in range(args.datasets)]
+    for dataset_id in datasets:
+        backend.add_dataset(dataset_id, "US")
+        for index in range(args.tables):
+            num_bytes = int(sizes.lognormvariate(0, 1.5) * args.median_table_bytes)
+            backend.add_table(dataset_id, f"table_{index:04d}", num_rows=num_bytes // 100, num_bytes=num_bytes)
+    return backend, datasets
+
+
+def reset_shared_state(poll_interval):
+    """Fresh tracker, cache and controller, so one configuration cannot warm up the next"""
+    job_tracker._shared_tracker = job_tracker.JobTracker(poll_interval=poll_interval)
+    metadata_cache._shared_cache = None
+    rate_control._shared_controller = rate_control.SubmissionController(
+        rate=BENCH_SUBMIT_RATE, burst=BENCH_SUBMIT_BURST
+    )
+
+
+def run_configuration(args, in_flight, workers, engine="threads"):
+    """Migrate a fresh simulated estate with one concurrency setting and return its measurements"""
+    backend, datasets = build_backend(args)
+    reset_shared_state(args.poll_interval)
+    workdir = tempfile.mkdtemp(prefix="bq_migration_bench_")
+    overrides = {
+        "SOURCE_DATASETS": datasets,
+        "MAX_IN_FLIGHT_JOBS": in_flight,
+        "MIGRATION_JOURNAL": os.path.join(workdir, "journal.jsonl"),
+        "MIGRATION_METRICS": os.path.join(workdir, "metrics.jsonl"),
+        "PROMETHEUS_METRICS": os.path.join(workdir, "metrics.prom"),
+    }
+    saved = {name: getattr(bulk_data_opt, name) for name in overrides}
+    for name, value in overrides.items():
+        setattr(bulk_data_opt, name, value)
+    clients = (CachedClient(backend.client("US")), CachedClient(backend.client("EU")))
+
+    started = time.monotonic()
+    try:
+        with redirect_stdout(io.StringIO()):
+            if engine == "async":
+                summaries = asyncio.run(async_engine.migrate_datasets_async(clients=clients)) or []
+            else:
+                summaries = bulk_data_opt.migrate_datasets_with_backup(workers, clients=clients) or []
+    finally:
+        for name, value in saved.items():
+            setattr(bulk_data_opt, name, value)
+        shutil.rmtree(workdir, ignore_errors=True)
+    elapsed = time.monotonic() - started
+
+    # A dataset that reports failed tables did not fully migrate, whatever its status says
+    migrated = sum(1 for summary in summaries if summary["status"] == "migrated" and not summary.get("failed_tables"))
+    tables = len(datasets) * args.tables
+    return {
+        "engine": engine,
+        "in_flight": in_flight,
+        "workers": workers,
+        "seconds": elapsed,
+        "migrated": migrated,
+        "datasets_per_hour": migrated / elapsed * 3600,
+        "calls_per_table": backend.api_calls() / tables,
+        "calls": backend.calls,
+    }
+
+
+def print_report(results):
+    print(f"{'engine':>7} {'in flight':>9} {'workers':>7} {'seconds':>8} {'migrated':>8} {'datasets/h':>11} {'calls/table':>11}")
+    for result in results:
+        print(f"{result['engine']:>7} {result['in_flight']:>9} {result['workers']:>7} {result['seconds']:>8.2f} "
+              f"{result['migrated']:>8} {result['datasets_per_hour']:>11.0f} {result['calls_per_table']:>11.2f}")
+
+
+def check_thresholds(results, args):
+    """Return the list of regressions against the configured limits"""
+    problems = []
+    for result in results:
+        setting = f"{result['engine']} engine, in flight {result['in_flight']}, workers {result['workers']}"
+        if result["migrated"] < args.datasets:
+            problems.append(f"{setting}: only {result['migrated']} of {args.datasets} datasets migrated")
+        if args.max_calls_per_table is not None and result["calls_per_table"] > args.max_calls_per_table:
+            problems.append(f"{setting}: {result['calls_per_table']:.2f} API calls per table "
+                            f"(limit {args.max_calls_per_table})")
+        if args.min_datasets_per_hour is not None and result["datasets_per_hour"] < args.min_datasets_per_hour:
+            problems.append(f"{setting}: {result['datasets_per_hour']:.0f} datasets/hour "
+                            f"(minimum {args.min_datasets_per_hour})")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the migration orchestration against a simulated BigQuery")
+    parser.add_argument("--datasets", type=int, default=BENCH_DATASETS)
+    parser.add_argument("--tables", type=int, default=BENCH_TABLES, help="tables per dataset")
+    parser.add_argument("--median-table-bytes", type=int, default=BENCH_MEDIAN_TABLE_BYTES)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=BENCH_IN_FLIGHT)
+    parser.add_argument("--workers", type=int, nargs="+", default=BENCH_WORKERS)
+    parser.add_argument("--engine", choices=["threads", "async", "both"], default="threads",
+                        help="orchestration to measure: thread pools, the asyncio engine or both")
+    parser.add_argument("--job-latency", type=float, default=0.05, help="fixed seconds per simulated job")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="share of submissions throttled")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of copy jobs that fail")
+    parser.add_argument("--concurrent-job-limit", type=int, default=None, help="running jobs allowed per project")
+    parser.add_argument("--poll-interval", type=float, default=BENCH_POLL_INTERVAL)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-calls-per-table", type=float, default=None,
+                        help="fail when any setting needs more API calls per table")
+    parser.add_argument("--min-datasets-per-hour", type=float, default=None,
+                        help="fail when any setting migrates fewer datasets per hour")
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.engine in ("threads", "both"):
+        for workers in args.workers:
+            for in_flight in args.in_flight:
+                results.append(run_configuration(args, in_flight, workers))
+    if args.engine in ("async", "both"):
+        # One setting only: the asyncio engine has no per-dataset job limit or dataset workers
+        results.append(run_configuration(args, max(args.in_flight), max(args.workers), "async"))
+    print_report(results)
+
+    problems = check_thresholds(results, args)
+    for problem in problems:
+        print(f"REGRESSION: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
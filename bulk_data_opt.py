@@ -1,7 +1,34 @@
 from google.api_core.exceptions import NotFound, Forbidden
 from google.cloud import bigquery
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import namedtuple
+from functools import partial
+import argparse
+import itertools
+import os
+import threading
 import time
 
+from client_factory import ClientFactory
+from copy_engine import (
+    OPERATION_COPY, CopyResult, CopyStats, CopyTask, destination_exists, operation_for, run_copy_job
+)
+from discovery import discover_datasets, list_project_datasets, load_manifest
+from inventory import dataset_inventory_pages, region_inventory
+from job_tracker import shared_tracker
+from metadata_cache import shared_cache
+from metrics import METRICS_PATH, PROMETHEUS_PATH, MigrationMetrics
+from partition_copy import copy_partition, list_partitions, partition_task, prepare_destination, should_split
+from planner import past_throughput, plan_dataset_seconds, plan_step
+from progress import progress_paused, shared_progress, show_progress
+from rate_control import shared_controller
+from readiness import wait_for_dataset_deleted, wait_for_dataset_ready
+from migration_journal import JOURNAL_PATH, MigrationJournal
+from scheduling import estimate_job_seconds, format_duration, largest_first, lpt_makespan
+from sweeper import SWEEP_MIN_AGE_HOURS, migration_labels, sweep_orphans
+from task_graph import TaskGraph
+from validation import validate_dataset_copy
+
 # Configuration
 PROJECT_ID = "hrbot-220907"
 SOURCE_DATASETS = [
@@ -14,284 +41,1105 @@ SOURCE_DATASETS = [
 
 SERVICE_ACCOUNT_JSON = "/home/kraj/Ti/iLab/pyPro/table-dump-api/poc/location_migrate/bq_migrate/gc_auth_qa.json"
 
+# Maximum number of table copy jobs running at the same time (per dataset)
+MAX_IN_FLIGHT_JOBS = 20
+
+# Number of datasets migrated in parallel
+DATASET_WORKERS = 4
+
+# How Step 6 backs up tables: "snapshot" (zero-copy, read-only), "clone" (zero-copy, writable)
+# or "copy" (full physical copy). Tables that cannot be snapshotted always get a full copy.
+BACKUP_MODE = "snapshot"
+
+# How Step 9 moves tables from the temporary EU dataset into the final one. Both live in EU,
+# so "clone" is a metadata-only operation; "copy" rewrites every byte.
+MOVE_MODE = "clone"
+
+# Keep destination tables that already match their source (row count, size, modified time,
+# schema) and only copy the ones that are missing or differ
+INCREMENTAL_COPY = True
+
+# Journal of completed steps; a rerun skips everything recorded here and resumes the rest
+MIGRATION_JOURNAL = JOURNAL_PATH
+
+# Per-step and per-job timings (JSON lines) and run totals (Prometheus text format)
+MIGRATION_METRICS = METRICS_PATH
+PROMETHEUS_METRICS = PROMETHEUS_PATH
+
+# Read the inventory of every source dataset with one region-wide INFORMATION_SCHEMA query
+# up front. Off by default: that query blocks every dataset until it finished, while each
+# dataset's own paged inventory query lets its copies start with the first page
+REGION_INVENTORY = False
+
+# Parallel get_table calls used to look up table sizes when no inventory query is possible
+METADATA_WORKERS = 16
+
+# Copy large partitioned tables with one job per partition (see partition_copy.py), so a
+# failure only repeats one partition and a single huge table does not hold one job slot for hours
+PARTITION_COPY = True
+
+# Tables read per inventory or tables.list page; copying starts as soon as the first page is in
+TABLE_PAGE_SIZE = 1000
+
+# Table IDs shown when a log line lists the tables of a dataset
+TABLE_ID_PREVIEW = 10
+
+# Show run progress: redrawn live on a terminal, as periodic log lines otherwise
+SHOW_PROGRESS = True
+# Seconds between progress updates (None: every second live, every minute in logs)
+PROGRESS_INTERVAL = None
+
+# The parts of a source table the migration needs; also what the journal stores per table.
+# Sizes and partitioning column have defaults so inventories journaled before they were recorded still load.
+TableEntry = namedtuple(
+    "TableEntry", ["table_id", "table_type", "num_bytes", "num_rows", "partitioning"], defaults=[0, 0, None]
+)
+
+# Serialises output lines coming from parallel dataset workers
+_print_lock = threading.Lock()
 
-def check_dataset_exists(client, dataset_name, location=None):
+
+def dataset_logger(dataset_name):
+    """Return a print-like function that prefixes every line with the dataset name"""
+    def log(message=""):
+        with _print_lock, progress_paused():
+            for line in str(message).splitlines() or [""]:
+                print(f"[{dataset_name}] {line}")
+    return log
+
+
+def check_dataset_exists(client, dataset_name, location=None, log=print):
     """Check if dataset exists and return its location"""
     try:
         dataset_ref = client.dataset(dataset_name)
         dataset = client.get_dataset(dataset_ref)
         actual_location = dataset.location
-        print(f"Dataset '{dataset_name}' exists in location: {actual_location}")
+        log(f"Dataset '{dataset_name}' exists in location: {actual_location}")
 
         if location and actual_location.upper() != location.upper():
-            print(f"Warning: Dataset is in {actual_location}, expected {location}")
+            log(f"Warning: Dataset is in {actual_location}, expected {location}")
 
         return True, actual_location
     except NotFound:
-        print(f"Dataset '{dataset_name}' not found")
+        log(f"Dataset '{dataset_name}' not found")
         return False, None
     except Forbidden as e:
-        print(f"Permission denied for dataset '{dataset_name}': {e}")
+        log(f"Permission denied for dataset '{dataset_name}': {e}")
         return False, None
     except Exception as e:
-        print(f"Error checking dataset '{dataset_name}': {e}")
+        log(f"Error checking dataset '{dataset_name}': {e}")
         return False, None
 
 
-def migrate_datasets_with_backup():
-    # Initialize clients with explicit credentials
+def partitioning_of(table):
+    """Partitioning column of a bigquery.Table ("_PARTITIONTIME" for ingestion time), None if unpartitioned"""
+    time_partitioning = getattr(table, "time_partitioning", None)
+    if time_partitioning is not None:
+        return time_partitioning.field or "_PARTITIONTIME"
+    range_partitioning = getattr(table, "range_partitioning", None)
+    if range_partitioning is not None:
+        return range_partitioning.field
+    return None
+
+
+def describe_tables(client, dataset_name, listed_tables, max_workers=METADATA_WORKERS, log=print):
+    """Build inventory entries with table sizes, fetching table metadata in parallel"""
+    def describe(table):
+        try:
+            details = client.get_table(f"{client.project}.{dataset_name}.{table.table_id}")
+            return TableEntry(
+                table.table_id, table.table_type, details.num_bytes or 0, details.num_rows or 0, partitioning_of(details)
+            )
+        except Exception as e:
+            # An unknown size only costs scheduling quality, never the migration itself
+            log(f"Could not read size of table {table.table_id}: {e}")
+            return TableEntry(table.table_id, table.table_type)
+
+    if not listed_tables:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(listed_tables)))) as executor:
+        return list(executor.map(describe, listed_tables))
+
+
+def inventory_pages(client, dataset_name, preloaded=None, log=print, page_size=TABLE_PAGE_SIZE):
+    """Step 1: Tables of a dataset with their sizes, one page of TableEntry records at a time
+
+    Pages come from the inventory query, or from tables.list plus one
+    get_table per table if the query fails; a preloaded region inventory is a
+    single page. Only the compact entries are kept, never the API's row or
+    table objects, so memory stays flat however many tables the dataset has.
+    """
+    if preloaded is not None:
+        yield [
+            TableEntry(table.table_id, table.table_type, table.num_bytes, table.num_rows, table.partitioning)
+            for table in preloaded
+        ]
+        return
     try:
-        us_client = bigquery.Client.from_service_account_json(
-            SERVICE_ACCOUNT_JSON, location="US"
-        )
-        eu_client = bigquery.Client.from_service_account_json(
-            SERVICE_ACCOUNT_JSON, location="EU"
-        )
-        print("Successfully initialized BigQuery clients")
+        pages = dataset_inventory_pages(client, client.project, dataset_name, "US", page_size)
     except Exception as e:
-        print(f"Error initializing BigQuery clients: {e}")
+        log(f"Inventory query failed, listing tables instead: {e}")
+        # The cached client would hold the whole listing; page through the API directly
+        listing = getattr(client, "uncached", client).list_tables(dataset_name, page_size=page_size)
+        for page in listing.pages:
+            yield describe_tables(client, dataset_name, list(page), log=log)
         return
+    for page in pages:
+        yield [
+            TableEntry(table.table_id, table.table_type, table.num_bytes, table.num_rows, table.partitioning)
+            for table in page
+        ]
 
-    # Process each dataset in the list
-    for source_dataset in SOURCE_DATASETS:
-        print(f"\n{'=' * 80}")
-        print(f"Processing dataset: {source_dataset}")
-        print(f"{'=' * 80}")
 
-        # Step 0: Check if source dataset exists with detailed debugging
-        print("Checking source dataset...")
-        exists, actual_location = check_dataset_exists(us_client, source_dataset, "US")
+def read_inventory(client, dataset_name, preloaded=None, log=print):
+    """Step 1: Every table of a dataset with its size, as one list"""
+    return [table for page in inventory_pages(client, dataset_name, preloaded, log) for table in page]
 
-        if not exists:
-            # Try with EU client as well to see if it exists elsewhere
-            print("Checking with EU client...")
-            exists_eu, actual_location_eu = check_dataset_exists(eu_client, source_dataset)
 
-            if exists_eu:
-                print(f"Dataset found in EU location. Skipping migration as it's already in target location.")
-                continue
-            else:
-                print(f"Dataset '{source_dataset}' not found in any accessible location. Skipping.")
-                continue
+def preview_table_ids(table_ids, limit=TABLE_ID_PREVIEW):
+    """The first few table IDs and how many more there are, for log lines"""
+    shown = ", ".join(table_ids[:limit])
+    if len(table_ids) > limit:
+        shown += f" and {len(table_ids) - limit} more"
+    return shown
 
-        # Verify it's actually in US location
-        if actual_location and actual_location.upper() != "US":
-            print(f"Dataset is in {actual_location}, not US. Skipping migration.")
-            continue
 
-        # Generate dataset names for backup and temporary EU
-        backup_dataset = f"{source_dataset}_old"
-        temp_eu_dataset = f"{source_dataset}_EU"
+def log_expected_makespan(tables, label, mode, slots, log=print):
+    """Log the predicted wall-clock time of one step and return it in seconds"""
+    durations = [
+        estimate_job_seconds(table.num_bytes, operation_for(mode, table.table_type)) for table in tables
+    ]
+    expected = lpt_makespan(durations, slots)
+    total_bytes = sum(table.num_bytes for table in tables)
+    log(f"{label}: {len(tables)} tables, {total_bytes / 1024 ** 3:.2f} GiB, "
+        f"expected {format_duration(expected)} with {slots} jobs in flight")
+    return expected
 
-        # Step 1: Get list of tables from source dataset
-        try:
-            tables = list(us_client.list_tables(source_dataset))
-            if not tables:
-                print(f"No tables found in source dataset '{source_dataset}'")
-                # Create empty datasets in EU for consistency
-                try:
-                    target_dataset_ref = eu_client.dataset(source_dataset)
-                    target_dataset = bigquery.Dataset(target_dataset_ref)
-                    target_dataset.location = "EU"
-                    eu_client.create_dataset(target_dataset)
-                    print(f"Created empty dataset '{source_dataset}' in EU location")
-                except Exception as e:
-                    print(f"Error creating empty dataset in EU: {e}")
-                continue
 
-            print(f"Found {len(tables)} tables in source dataset")
-            table_ids = [table.table_id for table in tables]
-            print(f"Table IDs: {table_ids}")
-        except Exception as e:
-            print(f"Error listing tables: {e}")
-            continue
+def run_journaled(journal, dataset, step, fn, table=None, log=print, metrics=None, entry=None):
+    """Run one step unless the journal already has it, and record it when it succeeds
 
-        # Step 2: Create temporary EU dataset (handle existing dataset)
-        temp_eu_dataset_ref = eu_client.dataset(temp_eu_dataset)
-        try:
-            eu_client.get_dataset(temp_eu_dataset_ref)
-            print(f"Temporary EU dataset '{temp_eu_dataset}' already exists")
-
-            # Check if it has tables
-            eu_tables = list(eu_client.list_tables(temp_eu_dataset))
-            if eu_tables:
-                print(f"Temporary EU dataset has tables. Deleting and recreating...")
-                eu_client.delete_dataset(temp_eu_dataset_ref, delete_contents=True)
-                # Add delay to ensure deletion completes
-                time.sleep(5)
-                temp_eu_dataset_obj = bigquery.Dataset(temp_eu_dataset_ref)
-                temp_eu_dataset_obj.location = "EU"
-                eu_client.create_dataset(temp_eu_dataset_obj)
-                print(f"Temporary EU dataset '{temp_eu_dataset}' recreated in EU location")
-            else:
-                print(f"Temporary EU dataset is empty. Using existing dataset.")
-        except NotFound:
-            # Create temporary EU dataset if it doesn't exist
+    Steps report a soft failure by returning False; anything else (or no
+    return value) counts as completed. Steps found in the journal return True.
+    A CopyResult returned by a copy step is journaled with it, so planning
+    can tell full copies from snapshots, clones and skipped tables. With
+    metrics given, the step's timing is recorded, with the size of the table
+    entry for table steps.
+    """
+    progress = shared_progress()
+    if journal.is_done(dataset, step, table):
+        log(f"Skipping {step}{f' of table {table}' if table else ''}: already completed in a previous run")
+        progress.table_step_finished(dataset, step, table, entry, resumed=True)
+        return True
+    started = time.monotonic()
+    try:
+        if metrics is None:
+            result = fn()
+        else:
+            num_bytes, num_rows = (entry.num_bytes, entry.num_rows) if entry else (0, 0)
+            with metrics.step(dataset, step, table, num_bytes, num_rows) as record:
+                result = fn()
+                if result is False:
+                    record["status"] = "failed"
+    except Exception:
+        progress.table_step_finished(dataset, step, table, entry, ok=False)
+        raise
+    if result is not False:
+        details = result._asdict() if isinstance(result, CopyResult) else {}
+        journal.record(dataset, step, table, seconds=round(time.monotonic() - started, 3), **details)
+    progress.table_step_finished(dataset, step, table, entry, ok=result is not False)
+    return result
+
+
+def prepare_temp_dataset(eu_client, temp_eu_dataset, log=print, keep_tables=False):
+    """Step 2: Create temporary EU dataset (handle existing dataset)
+
+    With keep_tables (resumed or incremental runs), tables already copied by an
+    earlier run are kept and re-checked table by table in Step 3.
+    """
+    temp_eu_dataset_ref = eu_client.dataset(temp_eu_dataset)
+    try:
+        eu_client.get_dataset(temp_eu_dataset_ref)
+        log(f"Temporary EU dataset '{temp_eu_dataset}' already exists")
+        if keep_tables:
+            log(f"Keeping the tables already copied to '{temp_eu_dataset}'")
+            return
+
+        # Check if it has tables
+        eu_tables = list(eu_client.list_tables(temp_eu_dataset))
+        if eu_tables:
+            log(f"Temporary EU dataset has tables. Deleting and recreating...")
+            eu_client.delete_dataset(temp_eu_dataset_ref, delete_contents=True)
+            # Poll until the deletion is visible instead of sleeping a fixed time
+            wait_for_dataset_deleted(eu_client, temp_eu_dataset_ref, log=log)
             temp_eu_dataset_obj = bigquery.Dataset(temp_eu_dataset_ref)
             temp_eu_dataset_obj.location = "EU"
+            temp_eu_dataset_obj.labels = migration_labels("temp")
             eu_client.create_dataset(temp_eu_dataset_obj)
-            print(f"Temporary EU dataset '{temp_eu_dataset}' created in EU location")
-        except Exception as e:
-            print(f"Error handling temporary EU dataset: {e}")
-            continue
+            log(f"Temporary EU dataset '{temp_eu_dataset}' recreated in EU location")
+        else:
+            log(f"Temporary EU dataset is empty. Using existing dataset.")
+    except NotFound:
+        # Create temporary EU dataset if it doesn't exist
+        temp_eu_dataset_obj = bigquery.Dataset(temp_eu_dataset_ref)
+        temp_eu_dataset_obj.location = "EU"
+        temp_eu_dataset_obj.labels = migration_labels("temp")
+        eu_client.create_dataset(temp_eu_dataset_obj)
+        log(f"Temporary EU dataset '{temp_eu_dataset}' created in EU location")
 
-        # Step 3: Copy all tables from source to temporary EU dataset
-        print("Copying tables to EU location...")
-        successful_copies = 0
-        for table in tables:
-            source_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
-            temp_eu_table_id = f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}"
-            print(f"Preparing to copy {source_table_id} to {temp_eu_table_id}")
 
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
+def validate_copy(us_client, source_dataset, eu_client, temp_eu_dataset, table_ids, failed_tables=(), log=print):
+    """Step 4: Validate the copy, raise if any table failed to copy or any copy differs from its source
 
-            # Execute the copy job
-            try:
-                copy_job = eu_client.copy_table(
-                    source_table_id,
-                    temp_eu_table_id,
-                    location="US",  # Source data is in US
-                    job_config=job_config
-                )
+    Every listed table is checked, so one missing from the temporary dataset
+    is a mismatch too. Row counts, sizes and schemas are compared with one
+    metadata query on each side. Raising keeps Step 7 from deleting the source.
+    """
+    if failed_tables:
+        if len(failed_tables) == len(table_ids):
+            log("No tables were successfully copied. Skipping further steps for this dataset.")
+        raise RuntimeError(f"{len(failed_tables)} tables were not copied to EU: {preview_table_ids(failed_tables)}")
 
-                print(f"Copying table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully copied to EU")
-                successful_copies += 1
-            except Exception as e:
-                print(f"Error copying table {table.table_id}: {e}")
-                continue
+    log("Validating the copy...")
+    mismatches = validate_dataset_copy(
+        us_client, source_dataset, eu_client, temp_eu_dataset, table_ids, project=us_client.project, log=log
+    )
+    if mismatches:
+        raise RuntimeError(f"{len(mismatches)} tables differ from their source: {preview_table_ids(sorted(mismatches))}")
+    log(f"All {len(table_ids)} tables validated (rows, size and schema)")
 
-        if successful_copies == 0:
-            print("No tables were successfully copied. Skipping further steps for this dataset.")
-            continue
 
-        # Step 4: Validate the copy
-        print("Validating the copy...")
+def prepare_backup_dataset(us_client, backup_dataset, log=print):
+    """Step 5: Create backup of original dataset"""
+    backup_dataset_ref = us_client.dataset(backup_dataset)
+    try:
+        us_client.get_dataset(backup_dataset_ref)
+        log(f"Backup dataset '{backup_dataset}' already exists in US location")
+    except NotFound:
         try:
-            eu_tables = list(eu_client.list_tables(temp_eu_dataset))
-            if len(eu_tables) != len(tables):
-                print(f"Validation warning: Expected {len(tables)} tables, found {len(eu_tables)}")
-                # Continue anyway, but log warning
-            else:
-                eu_table_ids = [table.table_id for table in eu_tables]
-                if set(table_ids) != set(eu_table_ids):
-                    print(f"Validation warning: Table lists don't match exactly")
-                else:
-                    print("All tables successfully copied and validated")
+            backup_dataset_obj = bigquery.Dataset(backup_dataset_ref)
+            backup_dataset_obj.location = "US"
+            backup_dataset_obj.labels = migration_labels("backup")
+            us_client.create_dataset(backup_dataset_obj)
+            log(f"Backup dataset '{backup_dataset}' created in US location")
         except Exception as e:
-            print(f"Error during validation: {e}")
-            # Continue with migration despite validation error
+            log(f"Error creating backup dataset: {e}")
+            # Continue with migration even if backup fails
+            return False
 
-        # Step 5: Create backup of original dataset
-        backup_dataset_ref = us_client.dataset(backup_dataset)
-        try:
-            us_client.get_dataset(backup_dataset_ref)
-            print(f"Backup dataset '{backup_dataset}' already exists in US location")
-        except NotFound:
-            try:
-                backup_dataset_obj = bigquery.Dataset(backup_dataset_ref)
-                backup_dataset_obj.location = "US"
-                us_client.create_dataset(backup_dataset_obj)
-                print(f"Backup dataset '{backup_dataset}' created in US location")
-            except Exception as e:
-                print(f"Error creating backup dataset: {e}")
-                # Continue with migration even if backup fails
 
-        # Step 6: Copy all tables to backup dataset
-        print("Creating backup of original dataset...")
-        for table in tables:
-            source_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
-            backup_table_id = f"{PROJECT_ID}.{backup_dataset}.{table.table_id}"
+def delete_source_dataset(us_client, source_dataset, log=print):
+    """Step 7: Delete original dataset"""
+    log(f"Deleting original dataset '{source_dataset}'...")
+    try:
+        source_dataset_ref = us_client.dataset(source_dataset)
+        us_client.delete_dataset(source_dataset_ref, delete_contents=True)
+        log(f"Original dataset '{source_dataset}' deleted")
+    except Exception as e:
+        log(f"Error deleting original dataset: {e}")
+        # Continue even if deletion fails
+        return False
+    # The EU dataset in Step 8 reuses this name, so wait until it is released; the deletion itself
+    # succeeded, so a slow release must not stop the step from being journaled
+    try:
+        wait_for_dataset_deleted(us_client, source_dataset_ref, log=log)
+    except TimeoutError as e:
+        log(f"Warning: {e}")
 
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
 
-            # Execute the copy job
-            try:
-                copy_job = us_client.copy_table(
-                    source_table_id,
-                    backup_table_id,
-                    job_config=job_config
-                )
+def create_target_dataset(eu_client, source_dataset, log=print):
+    """Step 8: Create final dataset with original name in EU"""
+    target_dataset_ref = eu_client.dataset(source_dataset)
+    try:
+        eu_client.get_dataset(target_dataset_ref)
+        log(f"Target dataset '{source_dataset}' already exists in EU location")
+    except NotFound:
+        target_dataset = bigquery.Dataset(target_dataset_ref)
+        target_dataset.location = "EU"
+        eu_client.create_dataset(target_dataset)
+        wait_for_dataset_ready(eu_client, target_dataset_ref, log=log)
+        log(f"Target dataset '{source_dataset}' created in EU location")
 
-                print(f"Backing up table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully backed up")
-            except Exception as e:
-                print(f"Error backing up table {table.table_id}: {e}")
-                # Continue with next table
 
-        # Step 7: Delete original dataset (only if we have successful copies)
-        if successful_copies > 0:
-            print(f"Deleting original dataset '{source_dataset}'...")
-            try:
-                source_dataset_ref = us_client.dataset(source_dataset)
-                us_client.delete_dataset(source_dataset_ref, delete_contents=True)
-                print(f"Original dataset '{source_dataset}' deleted")
-            except Exception as e:
-                print(f"Error deleting original dataset: {e}")
-                # Continue even if deletion fails
+def cleanup_temp_dataset(eu_client, temp_eu_dataset, log=print):
+    """Step 10: Clean up temporary EU dataset"""
+    log(f"Cleaning up temporary EU dataset '{temp_eu_dataset}'...")
+    try:
+        eu_client.delete_dataset(eu_client.dataset(temp_eu_dataset), delete_contents=True)
+        log(f"Temporary EU dataset '{temp_eu_dataset}' deleted")
+    except Exception as e:
+        log(f"Error deleting temporary EU dataset: {e}")
+        return False
+
+
+def dataset_summary(source_dataset, status="failed", detail=""):
+    """The per-dataset result reported at the end of a run"""
+    return {"dataset": source_dataset, "status": status, "detail": detail, "copied": 0, "failed_tables": [],
+            "bytes": 0}
+
+
+def recover_deleted_source(source_dataset, journal, log=print):
+    """True if a missing source was deleted by a run that stopped before journaling Step 7, which is journaled now
+
+    Step 7 only runs once the inventory is read and the copy is validated, so
+    with both in the journal the validated copy in the temp dataset is the data.
+    """
+    if not (journal.is_done(source_dataset, "inventory") and journal.is_done(source_dataset, "validate")):
+        return False
+    log("Source dataset is gone after its copy was validated, resuming after deletion of the original dataset")
+    journal.record(source_dataset, "delete_source", recovered=True)
+    return True
+
+
+def check_source(us_client, eu_client, source_dataset, journal, summary, log=print, locations=None):
+    """Step 0: True if the source dataset is in US and still has to be migrated
+
+    locations is {dataset_id: location} from a dataset listing of the project;
+    without it the dataset is looked up through the US and the EU client.
+    When it returns False, summary says why.
+    """
+    if journal.is_done(source_dataset, "complete"):
+        log("Dataset already migrated according to the journal. Skipping.")
+        summary.update(status="skipped", detail="already migrated (journal)")
+        return False
+
+    # Once the source is deleted it only exists in the journal, so Step 0 no longer applies
+    source_deleted = journal.is_done(source_dataset, "delete_source")
+    if source_deleted:
+        log("Resuming after deletion of the original dataset")
+        exists, actual_location = True, "US"
+    elif locations is not None:
+        # Step 0: The project listing already says where the dataset is (and it lists every location)
+        actual_location = locations.get(source_dataset)
+        if actual_location is None and recover_deleted_source(source_dataset, journal, log):
+            return True
+        if actual_location is None:
+            log(f"Dataset '{source_dataset}' not found in project {us_client.project}. Skipping.")
+            summary.update(status="skipped", detail="not found")
+            return False
+        exists = True
+        log(f"Dataset '{source_dataset}' exists in location: {actual_location}")
+    else:
+        # Step 0: Check if source dataset exists with detailed debugging
+        log("Checking source dataset...")
+        exists, actual_location = check_dataset_exists(us_client, source_dataset, "US", log=log)
+
+    if not exists and recover_deleted_source(source_dataset, journal, log):
+        return True
+    if not exists:
+        # Try with EU client as well to see if it exists elsewhere
+        log("Checking with EU client...")
+        exists_eu, actual_location_eu = check_dataset_exists(eu_client, source_dataset, log=log)
+
+        if exists_eu:
+            log(f"Dataset found in EU location. Skipping migration as it's already in target location.")
+            summary.update(status="skipped", detail="already in EU location")
+            return False
         else:
-            print(f"Skipping deletion of original dataset due to copy failures")
+            log(f"Dataset '{source_dataset}' not found in any accessible location. Skipping.")
+            summary.update(status="skipped", detail="not found")
+            return False
+
+    # Verify it's actually in US location
+    if actual_location and actual_location.upper() == "EU" and locations is not None:
+        log(f"Dataset found in EU location. Skipping migration as it's already in target location.")
+        summary.update(status="skipped", detail="already in EU location")
+        return False
+    if actual_location and actual_location.upper() != "US":
+        log(f"Dataset is in {actual_location}, not US. Skipping migration.")
+        summary.update(status="skipped", detail=f"located in {actual_location}")
+        return False
+    return True
 
-        # Step 8: Create final dataset with original name in EU
+
+def create_empty_target(eu_client, source_dataset, journal, summary, log=print):
+    """A source dataset without tables: create the empty EU dataset for consistency"""
+    log(f"No tables found in source dataset '{source_dataset}'")
+    try:
         target_dataset_ref = eu_client.dataset(source_dataset)
-        try:
-            eu_client.get_dataset(target_dataset_ref)
-            print(f"Target dataset '{source_dataset}' already exists in EU location")
-        except NotFound:
-            try:
-                target_dataset = bigquery.Dataset(target_dataset_ref)
-                target_dataset.location = "EU"
-                eu_client.create_dataset(target_dataset)
-                print(f"Target dataset '{source_dataset}' created in EU location")
-            except Exception as e:
-                print(f"Error creating target dataset: {e}")
-                continue
+        target_dataset = bigquery.Dataset(target_dataset_ref)
+        target_dataset.location = "EU"
+        eu_client.create_dataset(target_dataset)
+        log(f"Created empty dataset '{source_dataset}' in EU location")
+        journal.record(source_dataset, "complete")
+        summary.update(status="migrated", detail="no tables, empty dataset created in EU")
+    except Exception as e:
+        log(f"Error creating empty dataset in EU: {e}")
+        summary["detail"] = f"error creating empty dataset in EU: {e}"
 
-        # Step 9: Copy all tables from temporary to final dataset
-        print("Moving tables to final dataset...")
-        for table in tables:
-            temp_eu_table_id = f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}"
-            target_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
 
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
+def log_inventory(source_dataset, journal, tables, summary, recorded=False, log=print):
+    """Report the complete table list of a dataset and journal it unless it came from the journal"""
+    summary["bytes"] = sum(table.num_bytes for table in tables)
+    log(f"Found {len(tables)} tables in source dataset ({summary['bytes'] / 1024 ** 3:.2f} GiB)")
+    log(f"Table IDs: {preview_table_ids([table.table_id for table in tables])}")
+    if not recorded:
+        journal.record(source_dataset, "inventory", tables=[list(table) for table in tables])
+
+
+def discover_tables(us_client, eu_client, source_dataset, journal, summary, preloaded_tables=None, log=print,
+                    locations=None):
+    """Steps 0 and 1: check the source dataset and return its tables as an iterator of pages
+
+    The first page is read here: None is returned when there is nothing
+    (more) to migrate, an empty dataset included; summary then says why. The
+    other pages are read as the iterator is consumed (see listed_pages).
+    When resuming, the journaled inventory is the only page.
+    """
+    if not check_source(us_client, eu_client, source_dataset, journal, summary, log, locations):
+        return None
+
+    # Step 1: Get list of tables from source dataset (or from the journal when resuming)
+    inventory = journal.get(source_dataset, "inventory")
+    try:
+        if inventory:
+            log(f"Resuming with {len(inventory['tables'])} tables recorded in the journal")
+            pages = iter([[TableEntry(*entry) for entry in inventory["tables"]]])
+        else:
+            pages = inventory_pages(us_client, source_dataset, preloaded_tables, log=log)
+        first_page = next(pages, [])
+    except Exception as e:
+        log(f"Error listing tables: {e}")
+        summary["detail"] = f"error listing tables: {e}"
+        return None
+    if not first_page:
+        create_empty_target(eu_client, source_dataset, journal, summary, log)
+        return None
+    return listed_pages(
+        source_dataset, journal, summary, itertools.chain([first_page], pages), recorded=bool(inventory), log=log
+    )
+
+
+def listed_pages(source_dataset, journal, summary, pages, recorded=False, log=print):
+    """Yield each page of tables largest first, and report the inventory once the last page is read
+
+    Every page is added to the run progress. After the last one the complete
+    table list is logged and, unless it came from the journal, journaled.
+    """
+    tables = []
+    for number, page in enumerate(pages, start=1):
+        # Within a page the biggest tables go first; across pages the schedulers' priorities take over
+        page = largest_first(page)
+        tables.extend(page)
+        shared_progress().tables_listed(source_dataset, page)
+        yield page
+        log(f"Scheduled {len(page)} tables from page {number} ({len(tables)} so far)")
+    log_inventory(source_dataset, journal, tables, summary, recorded, log)
+
 
-            # Execute the copy job
+def migrate_dataset(us_client, eu_client, source_dataset, journal, preloaded_tables=None, metrics=None,
+                    locations=None):
+    """Run the full migration for one dataset, resuming from the journal, and return its summary"""
+    log = dataset_logger(source_dataset)
+    log(f"{'=' * 80}")
+    log(f"Processing dataset: {source_dataset}")
+    log(f"{'=' * 80}")
+    summary = dataset_summary(source_dataset)
+
+    # Steps 0 and 1: the first page decides whether there is anything to copy, the rest stream in while it copies
+    pages = discover_tables(us_client, eu_client, source_dataset, journal, summary, preloaded_tables, log, locations)
+    if pages is None:
+        return summary
+
+    # Tables are addressed in the project the clients work in
+    project = us_client.project
+    # Copy job IDs derive from it, so a restart reattaches to the jobs a crashed run left behind
+    run_id = journal.run_id()
+
+    # Generate dataset names for backup and temporary EU
+    backup_dataset = f"{source_dataset}_old"
+    temp_eu_dataset = f"{source_dataset}_EU"
+
+    # Every table listed so far, in listing order, and the same by table ID
+    tables = []
+    entries = {}
+
+    def journaled(step, fn, table=None):
+        return partial(run_journaled, journal, source_dataset, step, fn, table, log, metrics, entries.get(table))
+
+    # Steps 2-10 run as a task graph: each table's EU copy and backup are
+    # independent, only the source deletion waits for all of them. The graph
+    # grows while it runs: the copies and backups of a page are added as soon
+    # as the page is read, the steps that need every table once all are read.
+    graph = TaskGraph(max_workers=MAX_IN_FLIGHT_JOBS, log=log)
+    keep_tables = INCREMENTAL_COPY or journal.is_done(source_dataset, "prepare_temp")
+    graph.add("prepare_temp", journaled(
+        "prepare_temp", partial(prepare_temp_dataset, eu_client, temp_eu_dataset, log, keep_tables=keep_tables)
+    ))
+    graph.add("prepare_backup", journaled(
+        "prepare_backup", partial(prepare_backup_dataset, us_client, backup_dataset, log)
+    ))
+
+    # Partitions of large partitioned source tables, listed once and shared by every step
+    partition_lists = {}
+
+    def source_partitions(table):
+        if table.table_id not in partition_lists:
             try:
-                copy_job = eu_client.copy_table(
-                    temp_eu_table_id,
-                    target_table_id,
-                    job_config=job_config
+                partition_lists[table.table_id] = list_partitions(
+                    us_client, f"{project}.{source_dataset}.{table.table_id}", "US"
                 )
+            except Exception as e:
+                log(f"Could not list partitions of table {table.table_id}, copying it in one job: {e}")
+                partition_lists[table.table_id] = []
+        return partition_lists[table.table_id]
+
+    def add_table_copy(step, table, client, task, location, copy_job, after, operation_type=OPERATION_COPY,
+                       stats=None, ready=None):
+        """Add the node running copy_job for one table, or one node per partition for large partitioned tables
+
+        Returns the name dependents wait for. A partitioned copy first creates
+        the destination, then copies (and journals) each partition on its own;
+        the table node succeeds once every partition is there. ready() decides
+        at run time whether the table is copied at all.
+        """
+        name = f"{step}:{table.table_id}"
+        partitions = []
+        if (PARTITION_COPY and should_split(table, operation_type)
+                and not journal.is_done(source_dataset, step, table.table_id)):
+            partitions = source_partitions(table)
+        if len(partitions) < 2:
+            return graph.add(name, journaled(step, copy_job, table.table_id), after=after, priority=table.num_bytes)
+
+        prepare_name = f"{name}:prepare"
 
-                print(f"Moving table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully moved to final dataset")
+        def prepare():
+            if ready is not None and not ready():
+                return "skipped"
+            try:
+                # Partitions an interrupted run already copied are in the destination and will not be copied
+                # again, so the destination is kept; the identical-copy check would see it as different and drop it
+                resumed = [
+                    partition for partition in partition_tables if journal.is_done(source_dataset, step, partition)
+                ]
+                if resumed and not destination_exists(client, task):
+                    log(f"Table {task.destination_table_id} is gone, copying all partitions of {table.table_id} again")
+                    journal.discard(source_dataset, [step], tables=resumed)
+                    resumed = []
+                incremental = INCREMENTAL_COPY and not resumed
+                return "copy" if prepare_destination(client, task, incremental, log) else "unchanged"
             except Exception as e:
-                print(f"Error moving table {table.table_id}: {e}")
+                log(f"Error creating {task.destination_table_id} for a partitioned copy: {e}")
+                return "failed"
+
+        def copy_one(one_task):
+            state = graph.results.get(prepare_name)
+            if state == "unchanged":
+                return CopyResult(None, False)
+            return state == "copy" and copy_partition(
+                client, one_task, step, location, log, stats, metrics, run_id=run_id
+            )
+
+        def finish():
+            ok = finish_partitions()
+            shared_progress().table_step_finished(source_dataset, step, table.table_id, table, ok)
+            return ok
+
+        def finish_partitions():
+            if journal.is_done(source_dataset, step, table.table_id):
+                return True
+            if graph.results.get(prepare_name) not in ("copy", "unchanged"):
+                return False
+            failed = [partition for partition in partition_names if graph.results.get(partition) is False]
+            if failed:
+                log(f"{len(failed)} of {len(partition_names)} partitions of table {table.table_id} failed, "
+                    f"a rerun copies only those")
+                return False
+            log(f"All {len(partition_names)} partitions of table {table.table_id} copied")
+            # Journal the summed time of the partition copies, including those of an interrupted run, so
+            # past_throughput() sees the table's real transfer time
+            partition_entries = [journal.get(source_dataset, step, partition) for partition in partition_tables]
+            transferred = [entry for entry in partition_entries if entry and entry.get("transferred")]
+            seconds = sum(entry.get("seconds") or 0 for entry in transferred)
+            job_times = [entry.get("job_seconds") for entry in transferred]
+            job_seconds = round(sum(job_times), 3) if transferred and None not in job_times else None
+            journal.record(
+                source_dataset, step, table.table_id, seconds=round(seconds, 3),
+                **CopyResult(OPERATION_COPY if transferred else None, bool(transferred), job_seconds)._asdict()
+            )
+            return True
+
+        graph.add(prepare_name, prepare, after=after, priority=table.num_bytes)
+        partition_names = []
+        partition_tables = []
+        for partition in partitions:
+            one_task = partition_task(task, partition)
+            partition_tables.append(one_task.table_id)
+            partition_names.append(graph.add(
+                f"{step}:{one_task.table_id}",
+                journaled(step, partial(copy_one, one_task), one_task.table_id),
+                after=[prepare_name],
+                priority=partition.num_bytes
+            ))
+        log(f"Table {table.table_id} will be copied as {len(partitions)} partitions")
+        return graph.add(name, finish, after=partition_names, priority=table.num_bytes)
+
+    # Step 3: Copy all tables from source to temporary EU dataset
+    # Step 6: Back up all tables (snapshot, clone or full copy depending on BACKUP_MODE)
+    copy_steps = []
+    backup_steps = []
+
+    def add_copy_and_backup(table):
+        source_table_id = f"{project}.{source_dataset}.{table.table_id}"
+        temp_eu_table_id = f"{project}.{temp_eu_dataset}.{table.table_id}"
+        backup_table_id = f"{project}.{backup_dataset}.{table.table_id}"
+
+        copy_task = CopyTask(table.table_id, source_table_id, temp_eu_table_id, table.table_type, table.num_bytes)
+        copy_steps.append(add_table_copy(
+            "copy", table, eu_client, copy_task, "US",  # Source data is in US
+            partial(
+                run_copy_job, eu_client, copy_task, "copy", "US", log,
+                incremental=INCREMENTAL_COPY,
+                metrics=metrics,
+                run_id=run_id
+            ),
+            after=["prepare_temp"]
+        ))
+        backup_task = CopyTask(table.table_id, source_table_id, backup_table_id, table.table_type, table.num_bytes)
+        backup_operation = operation_for(BACKUP_MODE, table.table_type)
+        backup_steps.append(add_table_copy(
+            "backup", table, us_client, backup_task, None,
+            partial(
+                run_copy_job, us_client, backup_task, "backup", None, log,
+                operation_type=backup_operation,
+                incremental=INCREMENTAL_COPY,
+                metrics=metrics,
+                run_id=run_id
+            ),
+            after=["prepare_backup"],
+            operation_type=backup_operation
+        ))
+
+    def copied_tables():
+        return [table.table_id for table in tables if graph.results.get(f"copy:{table.table_id}")]
+
+    def failed_copies():
+        return [table.table_id for table in tables if not graph.results.get(f"copy:{table.table_id}")]
+
+    # Step 9: Move all tables from temporary to final dataset (clone or full copy, see MOVE_MODE)
+    move_stats = CopyStats()
+
+    def move_table(task):
+        if not graph.results.get(f"copy:{task.table_id}"):
+            log(f"Skipping move of table {task.table_id}: it was not copied to EU")
+            return False
+        return run_copy_job(
+            eu_client, task, "move", log=log,
+            operation_type=operation_for(MOVE_MODE, task.table_type),
+            stats=move_stats,
+            incremental=INCREMENTAL_COPY,
+            metrics=metrics,
+            run_id=run_id
+        )
+
+    def add_final_steps():
+        # Step 4: Validate the copy
+        graph.add(
+            "validate",
+            journaled("validate", lambda: validate_copy(
+                us_client, source_dataset, eu_client, temp_eu_dataset, [table.table_id for table in tables],
+                failed_copies(), log
+            )),
+            after=copy_steps
+        )
+
+        # Step 7: Delete original dataset (only once the copy is validated and every backup succeeded)
+        graph.add(
+            "delete_source",
+            journaled("delete_source", partial(delete_source_dataset, us_client, source_dataset, log)),
+            after=["validate"],
+            requires=backup_steps
+        )
+
+        # Step 8: Create final dataset with original name in EU (the name is only free once the source is gone)
+        graph.add(
+            "create_target",
+            journaled("create_target", partial(create_target_dataset, eu_client, source_dataset, log)),
+            requires=["delete_source"]
+        )
+
+        # Step 9: Move every table that was copied
+        move_steps = []
+        for table in tables:
+            temp_eu_table_id = f"{project}.{temp_eu_dataset}.{table.table_id}"
+            target_table_id = f"{project}.{source_dataset}.{table.table_id}"
+            move_task = CopyTask(table.table_id, temp_eu_table_id, target_table_id, table.table_type, table.num_bytes)
+            move_steps.append(add_table_copy(
+                "move", table, eu_client, move_task, None,
+                partial(move_table, move_task),
+                after=["create_target", f"copy:{table.table_id}"],
+                operation_type=operation_for(MOVE_MODE, table.table_type),
+                stats=move_stats,
+                ready=partial(graph.results.get, f"copy:{table.table_id}")
+            ))
+
+        # Step 10: Clean up temporary EU dataset; until every move succeeded it holds the only EU copy
+        graph.add(
+            "cleanup_temp",
+            journaled("cleanup_temp", partial(cleanup_temp_dataset, eu_client, temp_eu_dataset, log)),
+            requires=move_steps
+        )
+
+    # Expected duration of each bulk step under largest-first scheduling, known once every table is listed
+    expected = {}
+
+    def enumerate_tables():
+        """Step 1 as a graph node: schedule each page's tables as it arrives, then the remaining steps"""
+        for page in pages:
+            for table in page:
+                tables.append(table)
+                entries[table.table_id] = table
+                add_copy_and_backup(table)
+        add_final_steps()
+        expected.update(
+            copy=log_expected_makespan(tables, "Step 3", "copy", MAX_IN_FLIGHT_JOBS, log),
+            backup=log_expected_makespan(tables, "Step 6", BACKUP_MODE, MAX_IN_FLIGHT_JOBS, log),
+            move=log_expected_makespan(tables, "Step 9", MOVE_MODE, MAX_IN_FLIGHT_JOBS, log),
+        )
+
+    graph.add("inventory", enumerate_tables)
+
+    graph.run()
+
+    for step, label in (("copy", "Step 3"), ("backup", "Step 6"), ("move", "Step 9")):
+        # Every node of the step, including the partition copies of partitioned tables
+        names = [name for name in graph.timings if name.startswith(f"{step}:")]
+        if names and step in expected:
+            log(f"{label} took {format_duration(graph.span(names))} "
+                f"(expected {format_duration(expected[step])})")
+
+    for line in move_stats.describe():
+        log(f"Step 9 {line}")
+
+    copied = set(copied_tables())
+    summary.update(copied=len(copied), failed_tables=[t.table_id for t in tables if t.table_id not in copied])
+    if summary["failed_tables"]:
+        log(f"{len(summary['failed_tables'])} tables failed to copy: {preview_table_ids(summary['failed_tables'])}")
+
+    if "inventory" in graph.failed:
+        summary["detail"] = f"error listing tables: {graph.failed['inventory']}"
+        return summary
+    for name in ("prepare_temp", "validate", "delete_source", "create_target", "cleanup_temp"):
+        if name in graph.failed:
+            summary["detail"] = f"{name} failed: {graph.failed[name]}"
+            return summary
+        if name in graph.skipped:
+            summary["detail"] = f"{name} skipped"
+            return summary
+
+    log(f"Migration completed successfully for dataset: {source_dataset}!")
+    log(f"Backup dataset kept as: {backup_dataset} (US location)")
+    log(f"New dataset: {source_dataset} (EU location)")
+    journal.record(source_dataset, "complete")
+    summary["status"] = "migrated"
+    return summary
+
+
+def create_client_factory(max_workers=DATASET_WORKERS, pool_size=None):
+    """Factory for every client of the run: one credential load, one HTTP connection pool"""
+    # Enough connections for every thread that may call the API at once:
+    # copy workers of all datasets, metadata lookups and the job tracker
+    pool_size = pool_size or max_workers * MAX_IN_FLIGHT_JOBS + METADATA_WORKERS + 1
+    factory = ClientFactory(SERVICE_ACCOUNT_JSON, project=PROJECT_ID, pool_size=pool_size)
+    # Load the key file now so a bad one stops the run here; clients are built on first use
+    factory.session()
+    return factory
+
+
+def create_clients(max_workers=DATASET_WORKERS, pool_size=None):
+    """US and EU clients sharing credentials, one HTTP connection pool and one metadata cache"""
+    factory = create_client_factory(max_workers, pool_size)
+    return factory.client("US"), factory.client("EU")
+
+
+def dataset_locations(client, log=print):
+    """{dataset_id: location} of every dataset in the client's project from one listing, None if it fails"""
+    try:
+        return {ref.dataset_id: ref.location for ref in list_project_datasets(client, client.project)}
+    except Exception as e:
+        log(f"Listing datasets failed, each dataset will be looked up on its own: {e}")
+        return None
+
+
+def load_region_inventory(us_client, datasets=None):
+    """Step 1 for every dataset at once: one query instead of one listing per dataset"""
+    if not REGION_INVENTORY:
+        return {}
+    try:
+        inventories = region_inventory(us_client, us_client.project, "US", datasets or SOURCE_DATASETS)
+        print(f"Inventory: {sum(len(tables) for tables in inventories.values())} tables "
+              f"in {len(inventories)} datasets")
+        return inventories
+    except Exception as e:
+        print(f"Region inventory query failed, each dataset will query its own: {e}")
+        return {}
+
+
+def plan_migration(max_in_flight=MAX_IN_FLIGHT_JOBS, max_workers=DATASET_WORKERS):
+    """Print what a migration run would do and how long it should take, without changing anything
+
+    Only metadata is read. Job durations are estimated from the throughput
+    journaled by earlier runs, or from the defaults in scheduling.py. Large
+    partitioned tables are planned as one job per partition, as they run.
+    Incremental copies may skip tables, so the figures are an upper bound.
+    """
+    try:
+        us_client, eu_client = create_clients(max_workers)
+    except Exception as e:
+        print(f"Error initializing BigQuery clients: {e}")
+        return
+
+    journal = MigrationJournal(MIGRATION_JOURNAL)
+    rates = past_throughput(journal)
+    for step in ("copy", "backup", "move"):
+        if step in rates:
+            print(f"Past {step} throughput: {rates[step] / 1024 ** 2:.1f} MiB/s per job")
+        else:
+            print(f"No past {step} throughput in the journal, using default estimates")
+    inventories = load_region_inventory(us_client)
+    locations = dataset_locations(us_client)
+
+    dataset_seconds = []
+    totals = {"copy": 0, "backup": 0, "move": 0, "jobs": 0}
+    print(f"\n{'=' * 80}")
+    print(f"Migration plan ({max_in_flight} jobs in flight per dataset, {max_workers} datasets in parallel):")
+    for source_dataset in SOURCE_DATASETS:
+        if journal.is_done(source_dataset, "complete"):
+            print(f"  {source_dataset}: already migrated (journal)")
+            continue
+        preloaded = inventories.get(source_dataset)
+        if preloaded is None:
+            if locations is not None:
+                exists, location = source_dataset in locations, locations.get(source_dataset)
+            else:
+                exists, location = check_dataset_exists(us_client, source_dataset, log=lambda message: None)
+            if not exists or (location or "").upper() != "US":
+                print(f"  {source_dataset}: skipped ({'not found' if not exists else f'located in {location}'})")
                 continue
+        tables = read_inventory(us_client, source_dataset, preloaded, log=print)
+        partition_lists = {}
+
+        def pending_partitions(step, table, operation_type):
+            # Large partitioned tables run one job per partition, as in migrate_dataset()
+            if not (PARTITION_COPY and should_split(table, operation_type)):
+                return None
+            if table.table_id not in partition_lists:
+                try:
+                    partition_lists[table.table_id] = list_partitions(
+                        us_client, f"{us_client.project}.{source_dataset}.{table.table_id}", "US"
+                    )
+                except Exception as e:
+                    print(f"Could not list partitions of table {table.table_id}, planning it as one job: {e}")
+                    partition_lists[table.table_id] = []
+            partitions = partition_lists[table.table_id]
+            if len(partitions) < 2:
+                return None
+            return [
+                partition for partition in partitions
+                if not journal.is_done(source_dataset, step, f"{table.table_id}${partition.partition_id}")
+            ]
+
+        plans = {}
+        for step, mode in (("copy", "copy"), ("backup", BACKUP_MODE), ("move", MOVE_MODE)):
+            # Tables journaled as done by an interrupted run are not copied again
+            pending = [table for table in tables if not journal.is_done(source_dataset, step, table.table_id)]
+            plans[step] = plan_step(pending, mode, rates.get(step), partial(pending_partitions, step))
+            totals[step] += plans[step]["bytes"]
+            totals["jobs"] += plans[step]["jobs"]
+        seconds = plan_dataset_seconds(plans["copy"], plans["backup"], plans["move"], max_in_flight)
+        dataset_seconds.append(seconds)
+
+        print(f"  {source_dataset}: {len(tables)} tables, "
+              f"{sum(table.num_bytes for table in tables) / 1024 ** 3:.2f} GiB, ~{format_duration(seconds)}")
+        for step, label in (("copy", "Step 3 copy to EU"), ("backup", "Step 6 backup"), ("move", "Step 9 move")):
+            print(f"    {label}: {plans[step]['jobs']} jobs, {plans[step]['bytes'] / 1024 ** 3:.2f} GiB copied")
+
+    print(f"Total: {totals['jobs']} jobs; GiB copied: {totals['copy'] / 1024 ** 3:.2f} to EU, "
+          f"{totals['backup'] / 1024 ** 3:.2f} backup, {totals['move'] / 1024 ** 3:.2f} final move")
+    print(f"Estimated wall-clock time: {format_duration(lpt_makespan(dataset_seconds, max_workers))}")
 
-        # Step 10: Clean up temporary EU dataset
-        print(f"Cleaning up temporary EU dataset '{temp_eu_dataset}'...")
-        try:
-            eu_client.delete_dataset(temp_eu_dataset_ref, delete_contents=True)
-            print(f"Temporary EU dataset '{temp_eu_dataset}' deleted")
-        except Exception as e:
-            print(f"Error deleting temporary EU dataset: {e}")
 
-        print(f"Migration completed successfully for dataset: {source_dataset}!")
-        print(f"Backup dataset kept as: {backup_dataset} (US location)")
-        print(f"New dataset: {source_dataset} (EU location)")
+def print_run_summary(summaries, metrics, datasets=None):
+    """Per-dataset results, in the order the datasets were configured, followed by the run totals"""
+    print(f"\n{'=' * 80}")
+    print("Migration summary:")
+    order = {name: index for index, name in enumerate(datasets or SOURCE_DATASETS)}
+    for summary in sorted(summaries, key=lambda item: order.get(item["dataset"], len(order))):
+        line = f"  {summary['dataset']}: {summary['status']}"
+        if summary["copied"] or summary["failed_tables"]:
+            line += (f" ({summary['copied']} tables copied, {len(summary['failed_tables'])} failed, "
+                     f"{summary['bytes'] / 1024 ** 3:.2f} GiB)")
+        if summary["detail"]:
+            line += f" - {summary['detail']}"
+        print(line)
+    print(shared_tracker().summary())
+    print(shared_cache().summary())
+    print(shared_controller().summary())
+    for line in metrics.summary():
+        print(line)
+    try:
+        metrics.write_prometheus()
+        print(f"Metrics written to {MIGRATION_METRICS} and {PROMETHEUS_METRICS}")
+    except Exception as e:
+        print(f"Error writing Prometheus metrics: {e}")
+
+
+def migrate_datasets_with_backup(max_workers=DATASET_WORKERS, clients=None, datasets=None, locations=None,
+                                 journal_path=None):
+    """Migrate every configured dataset; clients is an optional (us_client, eu_client) pair to use instead
 
+    datasets and locations replace SOURCE_DATASETS and the dataset listing of
+    the project, e.g. with the results of a discovery manifest.
+    """
+    # Initialize clients with explicit credentials
+    try:
+        us_client, eu_client = clients or create_clients(max_workers)
+        print("Successfully initialized BigQuery clients")
+    except Exception as e:
+        print(f"Error initializing BigQuery clients: {e}")
+        return
+
+    datasets = datasets or SOURCE_DATASETS
+    journal = MigrationJournal(journal_path or MIGRATION_JOURNAL)
+    metrics = MigrationMetrics(MIGRATION_METRICS, PROMETHEUS_METRICS)
+    # Step 0 for every dataset at once: one listing instead of a lookup per dataset and client
+    if locations is None:
+        locations = dataset_locations(us_client)
+    inventories = load_region_inventory(us_client, datasets)
+
+    # Process datasets in parallel, each worker handles one dataset end to end
+    print(f"Migrating {len(datasets)} datasets with {max_workers} workers")
+    shared_progress().start(datasets)
+    display = show_progress(PROGRESS_INTERVAL) if SHOW_PROGRESS else None
+    summaries = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        def migrate_one(source_dataset):
+            # Taken out of the region inventory when the dataset starts, so it is freed once its copies are set up
+            return migrate_dataset(
+                us_client, eu_client, source_dataset, journal, inventories.pop(source_dataset, None), metrics,
+                locations
+            )
+
+        futures = {
+            executor.submit(migrate_one, source_dataset): source_dataset
+            for source_dataset in datasets
+        }
+        for future in as_completed(futures):
+            source_dataset = futures[future]
+            try:
+                summaries.append(future.result())
+            except Exception as e:
+                dataset_logger(source_dataset)(f"Unexpected error during migration: {e}")
+                summaries.append(dataset_summary(source_dataset, detail=str(e)))
+            shared_progress().dataset_finished(summaries[-1])
+
+    if display is not None:
+        display.stop()
+    print_run_summary(summaries, metrics, datasets)
     print("\nAll datasets processing completed!")
+    return summaries
+
+
+def project_journal_path(project):
+    """Journal file of one project in a manifest run, next to MIGRATION_JOURNAL (which PROJECT_ID uses)"""
+    if project == PROJECT_ID:
+        return MIGRATION_JOURNAL
+    root, extension = os.path.splitext(MIGRATION_JOURNAL)
+    return f"{root}.{project}{extension}"
+
+
+def migrate_projects(manifest, max_workers=DATASET_WORKERS):
+    """Migrate every dataset a discovery manifest selects, one project after the other
+
+    Datasets are discovered across all projects in parallel; each project then
+    gets its own US and EU clients (sharing one credential load and connection
+    pool) and its own journal file, and its datasets are migrated in parallel.
+    """
+    try:
+        factory = create_client_factory(max_workers)
+    except Exception as e:
+        print(f"Error initializing BigQuery clients: {e}")
+        return
+
+    datasets, skipped = discover_datasets(factory.client(), manifest)
+    for ref in skipped:
+        print(f"  {ref.project}.{ref.dataset_id}: skipped (located in {ref.location})")
+    projects = {}
+    for ref in datasets:
+        projects.setdefault(ref.project, []).append(ref)
+
+    summaries = {}
+    for project, refs in projects.items():
+        print(f"\n{'#' * 80}")
+        print(f"Project {project}: {len(refs)} datasets")
+        print(f"{'#' * 80}")
+        summaries[project] = migrate_datasets_with_backup(
+            max_workers,
+            clients=(factory.client("US", project), factory.client("EU", project)),
+            datasets=[ref.dataset_id for ref in refs],
+            locations={ref.dataset_id: ref.location for ref in refs},
+            journal_path=project_journal_path(project)
+        ) or []
+
+    print(f"\n{'#' * 80}")
+    for project, results in summaries.items():
+        migrated = sum(1 for summary in results if summary["status"] == "migrated")
+        print(f"Project {project}: {migrated} of {len(results)} datasets migrated")
+    return summaries
+
+
+def sweep_projects(projects, dry_run=True, min_age_hours=SWEEP_MIN_AGE_HOURS, min_bytes=0, max_bytes=None):
+    """Sweep orphaned temp and backup datasets from each project, reading the journal of its runs"""
+    try:
+        factory = create_client_factory()
+    except Exception as e:
+        print(f"Error initializing BigQuery clients: {e}")
+        return
+    results = {}
+    for project in projects:
+        journal = MigrationJournal(project_journal_path(project))
+        results[project] = sweep_orphans(
+            factory.client(project=project), journal, project, dry_run, min_age_hours, min_bytes, max_bytes
+        )
+    return results
 
 
 if __name__ == "__main__":
-    migrate_datasets_with_backup()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Migrate BigQuery datasets from US to EU")
+    parser.add_argument("--plan", action="store_true", help="only print the migration plan, change nothing")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT_JOBS, help="copy jobs in flight per dataset")
+    parser.add_argument("--workers", type=int, default=DATASET_WORKERS, help="datasets migrated in parallel")
+    parser.add_argument("--manifest", help="JSON manifest of projects and dataset patterns to migrate, see discovery.py")
+    parser.add_argument("--project", action="append", default=[],
+                        help="project whose datasets are discovered and migrated (repeatable)")
+    parser.add_argument("--include", action="append", default=[], help="dataset name pattern to migrate (repeatable)")
+    parser.add_argument("--exclude", action="append", default=[], help="dataset name pattern to leave out (repeatable)")
+    parser.add_argument("--no-progress", action="store_true", help="do not show the progress of the run")
+    parser.add_argument("--progress-interval", type=float,
+                        help="seconds between progress updates (default: 1 on a terminal, 60 otherwise)")
+    parser.add_argument("--sweep-orphans", action="store_true",
+                        help="list temp and backup datasets left behind by failed runs instead of migrating")
+    parser.add_argument("--delete", action="store_true",
+                        help="with --sweep-orphans: delete the orphaned datasets (default: only list them)")
+    parser.add_argument("--min-age-hours", type=float, default=SWEEP_MIN_AGE_HOURS,
+                        help="with --sweep-orphans: leave datasets changed more recently than this")
+    parser.add_argument("--min-bytes", type=int, default=0, help="with --sweep-orphans: leave smaller datasets")
+    parser.add_argument("--max-bytes", type=int, help="with --sweep-orphans: leave larger datasets")
+    args = parser.parse_args()
+    MAX_IN_FLIGHT_JOBS = args.max_in_flight
+    SHOW_PROGRESS = not args.no_progress
+    PROGRESS_INTERVAL = args.progress_interval
+    if args.plan:
+        plan_migration(args.max_in_flight, args.workers)
+    elif args.sweep_orphans:
+        manifest = load_manifest(args.manifest) if args.manifest else {}
+        projects = manifest.get("projects", []) + args.project
+        sweep_projects(projects or [PROJECT_ID], not args.delete, args.min_age_hours, args.min_bytes, args.max_bytes)
+    elif args.manifest or args.project:
+        manifest = load_manifest(args.manifest) if args.manifest else {}
+        manifest["projects"] = manifest.get("projects", []) + args.project
+        manifest["include"] = manifest.get("include", []) + args.include
+        manifest["exclude"] = manifest.get("exclude", []) + args.exclude
+        migrate_projects(manifest, args.workers)
+    else:
+        migrate_datasets_with_backup(args.workers)
\ No newline at end of file
@@ -1,6 +1,12 @@
 from google.api_core.exceptions import NotFound, Forbidden
 from google.cloud import bigquery
-import time
+
+from client_factory import ClientFactory
+from copy_engine import CopyTask, run_copy_jobs
+from job_tracker import shared_tracker
+from metrics import MigrationMetrics
+from readiness import wait_for_dataset_deleted, wait_for_dataset_ready
+from validation import validate_dataset_copy
 
 # Configuration
 PROJECT_ID = "hrbot-220907"  # Target project for migration
@@ -17,7 +23,7 @@ SERVICE_ACCOUNT_JSON = "/home/kraj/Ti/iLab/pyPro/table-dump-api/poc/location_mig
 import sys
 
 # Test with explicit project
-client = bigquery.Client.from_service_account_json(SERVICE_ACCOUNT_JSON, project=PROJECT_ID)
+client = ClientFactory(SERVICE_ACCOUNT_JSON, project=PROJECT_ID, cached=False).client()
 
 # List datasets to verify access
 datasets = list(client.list_datasets())
@@ -56,18 +62,11 @@ def check_dataset_exists(client, dataset_name, location=None):
 
 
 def migrate_datasets_with_backup():
-    # Initialize clients with explicit credentials AND project ID
+    # Initialize clients with explicit credentials AND project ID, sharing one session
     try:
-        us_client = bigquery.Client.from_service_account_json(
-            SERVICE_ACCOUNT_JSON,
-            project=PROJECT_ID,  # Explicitly set the project
-            location="US"
-        )
-        eu_client = bigquery.Client.from_service_account_json(
-            SERVICE_ACCOUNT_JSON,
-            project=PROJECT_ID,  # Explicitly set the project
-            location="EU"
-        )
+        factory = ClientFactory(SERVICE_ACCOUNT_JSON, project=PROJECT_ID, cached=False)
+        us_client = factory.client("US")
+        eu_client = factory.client("EU")
         print(f"Successfully initialized BigQuery clients for project: {PROJECT_ID}")
 
         # Test connection by listing datasets
@@ -82,6 +81,9 @@ def migrate_datasets_with_backup():
         print(f"Error initializing BigQuery clients: {e}")
         return
 
+    # Step and job timings of the whole run, see metrics.py
+    metrics = MigrationMetrics()
+
     # Process each dataset in the list
     for source_dataset in SOURCE_DATASETS:
         print(f"\n{'=' * 80}")
@@ -147,8 +149,8 @@ def migrate_datasets_with_backup():
             if eu_tables:
                 print(f"Temporary EU dataset has tables. Deleting and recreating...")
                 eu_client.delete_dataset(temp_eu_dataset_ref, delete_contents=True)
-                # Add delay to ensure deletion completes
-                time.sleep(5)
+                # Poll until the deletion is visible instead of sleeping a fixed time
+                wait_for_dataset_deleted(eu_client, temp_eu_dataset_ref)
                 temp_eu_dataset_obj = bigquery.Dataset(temp_eu_dataset_ref)
                 temp_eu_dataset_obj.location = "EU"
                 eu_client.create_dataset(temp_eu_dataset_obj)
@@ -167,53 +169,43 @@ def migrate_datasets_with_backup():
 
         # Step 3: Copy all tables from source to temporary EU dataset
         print("Copying tables to EU location...")
-        successful_copies = 0
+        copy_tasks = []
         for table in tables:
             source_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
             temp_eu_table_id = f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}"
             print(f"Preparing to copy {source_table_id} to {temp_eu_table_id}")
-
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-
-            # Execute the copy job
-            try:
-                copy_job = eu_client.copy_table(
-                    source_table_id,
-                    temp_eu_table_id,
-                    location="US",  # Source data is in US
-                    job_config=job_config
-                )
-
-                print(f"Copying table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully copied to EU")
-                successful_copies += 1
-            except Exception as e:
-                print(f"Error copying table {table.table_id}: {e}")
-                continue
+            copy_tasks.append(CopyTask(table.table_id, source_table_id, temp_eu_table_id))
+
+        # Submit all copies at once; the shared job tracker reports completions
+        with metrics.step(source_dataset, "copy"):
+            copied_tables, failed_tables = run_copy_jobs(
+                eu_client,
+                copy_tasks,
+                step="copy",
+                location="US",  # Source data is in US
+                metrics=metrics
+            )
+        successful_copies = len(copied_tables)
 
         if successful_copies == 0:
             print("No tables were successfully copied. Skipping further steps for this dataset.")
             continue
 
-        # Step 4: Validate the copy
+        # Step 4: Validate every listed table (row counts, sizes and schemas, one metadata query per side);
+        # a table that failed to copy is missing from the copy and stops the migration of the dataset
         print("Validating the copy...")
         try:
-            eu_tables = list(eu_client.list_tables(temp_eu_dataset))
-            if len(eu_tables) != len(tables):
-                print(f"Validation warning: Expected {len(tables)} tables, found {len(eu_tables)}")
-                # Continue anyway, but log warning
-            else:
-                eu_table_ids = [table.table_id for table in eu_tables]
-                if set(table_ids) != set(eu_table_ids):
-                    print(f"Validation warning: Table lists don't match exactly")
-                else:
-                    print("All tables successfully copied and validated")
+            mismatches = validate_dataset_copy(
+                us_client, source_dataset, eu_client, temp_eu_dataset, table_ids, project=PROJECT_ID
+            )
         except Exception as e:
             print(f"Error during validation: {e}")
-            # Continue with migration despite validation error
+            mismatches = {"*": [str(e)]}
+        if mismatches:
+            # Never delete the source (Step 7) when a copy cannot be trusted
+            print(f"Validation failed for {len(mismatches)} tables. Skipping further steps for this dataset.")
+            continue
+        print("All tables successfully copied and validated")
 
         # Step 5: Create backup of original dataset
         backup_dataset_ref = us_client.dataset(backup_dataset)
@@ -232,28 +224,16 @@ def migrate_datasets_with_backup():
 
         # Step 6: Copy all tables to backup dataset
         print("Creating backup of original dataset...")
-        for table in tables:
-            source_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
-            backup_table_id = f"{PROJECT_ID}.{backup_dataset}.{table.table_id}"
-
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-
-            # Execute the copy job
-            try:
-                copy_job = us_client.copy_table(
-                    source_table_id,
-                    backup_table_id,
-                    job_config=job_config
-                )
-
-                print(f"Backing up table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully backed up")
-            except Exception as e:
-                print(f"Error backing up table {table.table_id}: {e}")
-                # Continue with next table
+        backup_tasks = [
+            CopyTask(
+                table.table_id,
+                f"{PROJECT_ID}.{source_dataset}.{table.table_id}",
+                f"{PROJECT_ID}.{backup_dataset}.{table.table_id}"
+            )
+            for table in tables
+        ]
+        with metrics.step(source_dataset, "backup"):
+            run_copy_jobs(us_client, backup_tasks, step="backup", metrics=metrics)
 
         # Step 7: Delete original dataset (only if we have successful copies)
         if successful_copies > 0:
@@ -261,6 +241,8 @@ def migrate_datasets_with_backup():
             try:
                 source_dataset_ref = us_client.dataset(source_dataset)
                 us_client.delete_dataset(source_dataset_ref, delete_contents=True)
+                # The EU dataset in Step 8 reuses this name, so wait until it is released
+                wait_for_dataset_deleted(us_client, source_dataset_ref)
                 print(f"Original dataset '{source_dataset}' deleted")
             except Exception as e:
                 print(f"Error deleting original dataset: {e}")
@@ -278,6 +260,7 @@ def migrate_datasets_with_backup():
                 target_dataset = bigquery.Dataset(target_dataset_ref)
                 target_dataset.location = "EU"
                 eu_client.create_dataset(target_dataset)
+                wait_for_dataset_ready(eu_client, target_dataset_ref)
                 print(f"Target dataset '{source_dataset}' created in EU location")
             except Exception as e:
                 print(f"Error creating target dataset: {e}")
@@ -285,28 +268,16 @@ def migrate_datasets_with_backup():
 
         # Step 9: Copy all tables from temporary to final dataset
         print("Moving tables to final dataset...")
-        for table in tables:
-            temp_eu_table_id = f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}"
-            target_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
-
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-
-            # Execute the copy job
-            try:
-                copy_job = eu_client.copy_table(
-                    temp_eu_table_id,
-                    target_table_id,
-                    job_config=job_config
-                )
-
-                print(f"Moving table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully moved to final dataset")
-            except Exception as e:
-                print(f"Error moving table {table.table_id}: {e}")
-                continue
+        move_tasks = [
+            CopyTask(
+                table.table_id,
+                f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}",
+                f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
+            )
+            for table in tables
+        ]
+        with metrics.step(source_dataset, "move"):
+            run_copy_jobs(eu_client, move_tasks, step="move", metrics=metrics)
 
         # Step 10: Clean up temporary EU dataset
         print(f"Cleaning up temporary EU dataset '{temp_eu_dataset}'...")
@@ -321,6 +292,10 @@ def migrate_datasets_with_backup():
         print(f"New dataset: {source_dataset} (EU location)")
 
     print("\nAll datasets processing completed!")
+    print(shared_tracker().summary())
+    for line in metrics.summary():
+        print(line)
+    metrics.write_prometheus()
 
 
 if __name__ == "__main__":
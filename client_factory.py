@@ -0,0 +1,88 @@
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery
+from google.oauth2 import service_account
+from requests.adapters import HTTPAdapter
+import google.auth
+import threading
+
+from metadata_cache import CachedClient
+
+# Scopes requested for the shared credentials
+BIGQUERY_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Default HTTP connections kept open to the BigQuery API (requests' own default is 10)
+CONNECTION_POOL_SIZE = 64
+
+
+class ClientFactory:
+    """One set of credentials and one pooled HTTP session for every BigQuery client of a run
+
+    The service account file is read once and every client shares the same
+    credentials object, so the access token is refreshed once for all of them.
+    Clients are built per (project, location) on first use, and the session's
+    connection pool is sized to the number of threads that call the API at once.
+    """
+
+    def __init__(self, service_account_json=None, project=None, pool_size=CONNECTION_POOL_SIZE, cached=True):
+        self.service_account_json = service_account_json
+        self.project = project
+        self.pool_size = pool_size
+        self.cached = cached
+        self._credentials = None
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _load_credentials(self):
+        if self.service_account_json:
+            credentials = service_account.Credentials.from_service_account_file(
+                self.service_account_json, scopes=BIGQUERY_SCOPES
+            )
+            return credentials, credentials.project_id
+        # No key file: application default credentials (gcloud login, workload identity, ...)
+        return google.auth.default(scopes=BIGQUERY_SCOPES)
+
+    def session(self):
+        """The shared authorized HTTP session, created on first use"""
+        with self._lock:
+            if self._session is None:
+                credentials, default_project = self._load_credentials()
+                self._credentials = credentials
+                self.project = self.project or default_project
+                session = AuthorizedSession(credentials)
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _build(self, location, project):
+        session = self.session()
+        with self._lock:
+            key = (project or self.project, location)
+            if key not in self._clients:
+                self._clients[key] = bigquery.Client(
+                    project=key[0], credentials=self._credentials, location=location, _http=session
+                )
+            return self._clients[key]
+
+    def client(self, location=None, project=None):
+        """Client for one location; nothing is loaded or connected until it is first used"""
+        client = LazyClient(self, location, project)
+        return CachedClient(client) if self.cached else client
+
+    def locations(self):
+        """(project, location) pairs that actually got a client"""
+        with self._lock:
+            return sorted(self._clients, key=str)
+
+
+class LazyClient:
+    """Stand-in for a bigquery.Client that is only built when an attribute is first read"""
+
+    def __init__(self, factory, location=None, project=None):
+        self._factory = factory
+        self._location = location
+        self._project = project
+
+    def __getattr__(self, name):
+        return getattr(self._factory._build(self._location, self._project), name)
@@ -0,0 +1,356 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import namedtuple
+import hashlib
+import itertools
+import re
+import threading
+import time
+
+from google.api_core.exceptions import BadRequest, Conflict, NotFound
+from google.cloud import bigquery
+
+from job_tracker import shared_tracker
+from rate_control import MAX_THROTTLE_RETRIES, is_throttling_error, shared_controller
+
+# Default number of copy jobs kept in flight at once
+MAX_IN_FLIGHT_JOBS = 20
+
+# One table copy: short table name, fully qualified source and destination, source table type,
+# size (used for metrics only) and write disposition (None means WRITE_EMPTY)
+CopyTask = namedtuple(
+    "CopyTask",
+    ["table_id", "source_table_id", "destination_table_id", "table_type", "num_bytes", "write_disposition"],
+    defaults=["TABLE", 0, None]
+)
+
+# What a successful copy did: the operation of the job that wrote the destination (None when an identical
+# copy was kept), whether bytes were physically transferred (a full copy job ran) and the seconds that job
+# ran, from getting its controller slot to completion (None when no job ran)
+CopyResult = namedtuple("CopyResult", ["operation_type", "transferred", "job_seconds"], defaults=[None])
+
+# Copy job operation types (CopyJobConfig.operation_type)
+OPERATION_COPY = "COPY"
+OPERATION_SNAPSHOT = "SNAPSHOT"
+OPERATION_CLONE = "CLONE"
+
+# Copy modes accepted in the script configuration and the operation each one uses
+COPY_MODES = {
+    "copy": OPERATION_COPY,
+    "snapshot": OPERATION_SNAPSHOT,
+    "clone": OPERATION_CLONE,
+}
+
+# Only standard tables can be snapshotted or cloned; everything else needs a full copy
+ZERO_COPY_TABLE_TYPES = {"TABLE"}
+
+# First part of every deterministic job ID, so the migration's jobs are easy to find in the job history
+JOB_ID_PREFIX = "eu_migration"
+
+# Progress messages per step: (submitted, succeeded, failed)
+STEP_MESSAGES = {
+    "copy": (
+        "Copying table {table}...",
+        "Table {table} successfully copied to EU",
+        "Error copying table {table}: {error}",
+    ),
+    "backup": (
+        "Backing up table {table}...",
+        "Table {table} successfully backed up",
+        "Error backing up table {table}: {error}",
+    ),
+    "move": (
+        "Moving table {table}...",
+        "Table {table} successfully moved to final dataset",
+        "Error moving table {table}: {error}",
+    ),
+}
+
+
+def copy_job_config(operation_type=OPERATION_COPY, write_disposition=None):
+    """Build the copy job configuration used for every table copy"""
+    job_config = bigquery.CopyJobConfig()
+    job_config.write_disposition = write_disposition or bigquery.WriteDisposition.WRITE_EMPTY
+    if operation_type != OPERATION_COPY:
+        job_config.operation_type = operation_type
+    return job_config
+
+
+def operation_for(mode, table_type):
+    """Return the copy operation for a configured mode, using a full copy where zero-copy is not possible"""
+    if mode not in COPY_MODES:
+        raise ValueError(f"Unknown copy mode '{mode}', expected one of {sorted(COPY_MODES)}")
+    if table_type not in ZERO_COPY_TABLE_TYPES:
+        return OPERATION_COPY
+    return COPY_MODES[mode]
+
+
+def job_id_for(run_id, step, task, operation_type=OPERATION_COPY):
+    """Job ID of one table step of a run: the same on every restart, so a rerun finds the jobs it submitted
+
+    Attempts are submitted as <job ID>_1, <job ID>_2, ... (see submit_or_reattach).
+    """
+    key = f"{run_id}|{step}|{operation_type}|{task.source_table_id}|{task.destination_table_id}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    # Job IDs allow letters, digits, _ and -; the table name is only there for people reading the history
+    table = re.sub(r"[^A-Za-z0-9_-]", "_", task.table_id)[:200]
+    return f"{JOB_ID_PREFIX}_{run_id}_{step}_{operation_type.lower()}_{table}_{digest}"
+
+
+def destination_exists(client, task):
+    """True if the destination table (without partition decorator) exists"""
+    return destination_table(client, task) is not None
+
+
+def destination_table(client, task):
+    """The destination table (without partition decorator), None if it does not exist"""
+    try:
+        return client.get_table(task.destination_table_id.split("$")[0])
+    except NotFound:
+        return None
+
+
+def holds_result(client, task, job):
+    """True if the destination still holds what a finished job wrote: it exists and was not recreated since"""
+    destination = destination_table(client, task)
+    if destination is None:
+        return False
+    return destination.created is None or job.ended is None or destination.created <= job.ended
+
+
+def submit_or_reattach(client, task, location, operation_type, job_id=None, log=print):
+    """Submit the copy job of a task, or reattach to the attempt an earlier run already submitted for it"""
+    job_config = copy_job_config(operation_type, task.write_disposition)
+    if job_id is None:
+        return client.copy_table(
+            task.source_table_id, task.destination_table_id, location=location, job_config=job_config
+        )
+    for attempt in itertools.count(1):
+        attempt_id = f"{job_id}_{attempt}"
+        try:
+            return client.copy_table(
+                task.source_table_id, task.destination_table_id, job_id=attempt_id, location=location,
+                job_config=job_config
+            )
+        except Conflict:
+            existing = client.get_job(attempt_id, location=location or getattr(client, "location", None))
+        if existing.state != "DONE":
+            log(f"Reattaching to job {attempt_id} of table {task.table_id}, submitted by an earlier run")
+            return existing
+        if not existing.error_result and holds_result(client, task, existing):
+            log(f"Job {attempt_id} of table {task.table_id} already finished in an earlier run, using its result")
+            return existing
+
+
+def tables_match(source, destination):
+    """True if the destination table already holds the same data as the source
+
+    Compares row count, byte size and schema, and requires the destination to
+    have been written after the source was last modified.
+    """
+    if source.num_rows != destination.num_rows or source.num_bytes != destination.num_bytes:
+        return False
+    if source.modified and destination.modified and destination.modified < source.modified:
+        return False
+    return [field.to_api_repr() for field in source.schema] == [field.to_api_repr() for field in destination.schema]
+
+
+def check_existing_copy(client, task, log=print):
+    """Return True if the destination is already an identical copy; drop it if it differs"""
+    try:
+        destination = client.get_table(task.destination_table_id)
+    except NotFound:
+        return False
+    source = client.get_table(task.source_table_id)
+    if tables_match(source, destination):
+        return True
+    log(f"Table {task.destination_table_id} differs from its source, replacing it")
+    client.delete_table(task.destination_table_id, not_found_ok=True)
+    return False
+
+
+class CopyStats:
+    """Thread-safe count and wall time of finished copy jobs per operation type"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+        self.seconds = {}
+
+    def record(self, operation_type, elapsed):
+        with self._lock:
+            self.counts[operation_type] = self.counts.get(operation_type, 0) + 1
+            self.seconds[operation_type] = self.seconds.get(operation_type, 0.0) + elapsed
+
+    def describe(self):
+        """One line per operation, e.g. 'CLONE: 12 jobs in 8.4s'"""
+        with self._lock:
+            return [
+                f"{operation}: {count} jobs in {self.seconds[operation]:.1f}s"
+                for operation, count in sorted(self.counts.items())
+            ]
+
+
+class CopyReport:
+    """Progress lines, CopyStats and job metrics of one run_copy_job call
+
+    Shared by run_copy_job and the asyncio engine's version of it, which only
+    differ in how they wait for the job: both call unchanged() or
+    submitting(), then succeeded(), falls_back() or failed().
+    """
+
+    def __init__(self, task, step, operation_type=OPERATION_COPY, log=print, stats=None, metrics=None):
+        self.task = task
+        self.step = step
+        self.operation_type = operation_type
+        self.log = log
+        self.stats = stats
+        self.metrics = metrics
+        self.messages = STEP_MESSAGES[step]
+        self.started = time.monotonic()
+        self.submitted_at = None
+        self.retries = 0
+
+    def retried(self):
+        """on_retry callback: one more throttling retry of the job"""
+        self.retries += 1
+
+    def unchanged(self):
+        """The destination is already an identical copy; returns the CopyResult of keeping it"""
+        self.log(f"Table {self.task.table_id} is already up to date in {self.task.destination_table_id}, skipping")
+        if self.stats is not None:
+            self.stats.record("UNCHANGED", time.monotonic() - self.started)
+        return CopyResult(None, False)
+
+    def submitting(self, run_id=None):
+        """The job is about to be submitted; returns its job ID (None lets BigQuery pick one)"""
+        self.log(self.messages[0].format(table=self.task.table_id))
+        return job_id_for(run_id, self.step, self.task, self.operation_type) if run_id else None
+
+    def slot_acquired(self):
+        """on_slot callback: an attempt got its controller slot, so the job's latency starts now"""
+        self.submitted_at = time.monotonic()
+
+    def _job_finished(self, status):
+        if self.metrics is not None and self.submitted_at is not None:
+            self.metrics.job(self.step, self.task, self.operation_type, time.monotonic() - self.submitted_at,
+                             self.retries, status)
+
+    def succeeded(self):
+        """The job succeeded; returns its CopyResult"""
+        self._job_finished("ok")
+        self.log(self.messages[1].format(table=self.task.table_id))
+        if self.stats is not None:
+            self.stats.record(self.operation_type, time.monotonic() - self.started)
+        job_seconds = round(time.monotonic() - self.submitted_at, 3) if self.submitted_at is not None else None
+        return CopyResult(self.operation_type, self.operation_type == OPERATION_COPY, job_seconds)
+
+    def falls_back(self, error):
+        """True if the error rejects a snapshot or clone for this table, which is then retried as a full copy"""
+        if not isinstance(error, BadRequest) or self.operation_type == OPERATION_COPY:
+            return False
+        self._job_finished("failed")
+        elapsed = time.monotonic() - self.started
+        if self.stats is not None:
+            self.stats.record("FALLBACK", elapsed)
+        self.log(f"{self.operation_type.title()} of table {self.task.table_id} rejected after {elapsed:.1f}s "
+                 f"({error}), falling back to a full copy")
+        return True
+
+    def failed(self, error):
+        """The copy failed; returns False"""
+        self._job_finished("failed")
+        self.log(self.messages[2].format(table=self.task.table_id, error=error))
+        return False
+
+
+def submit_job(client, task, location, operation_type, controller, job_id=None, log=print, on_retry=None):
+    """Submit the copy job of a task (or take over an earlier run's, see submit_or_reattach) through the controller"""
+    return controller.call(lambda: submit_or_reattach(client, task, location, operation_type, job_id, log), on_retry)
+
+
+def resubmit_throttled(error, attempt, task, log=print):
+    """True if a finished job failed with rateLimitExceeded or quotaExceeded and may be submitted again"""
+    if not is_throttling_error(error) or attempt == MAX_THROTTLE_RETRIES:
+        return False
+    log(f"Copy of table {task.table_id} was throttled ({error}), resubmitting")
+    return True
+
+
+def submit_and_wait(client, task, location, operation_type, tracker, controller, log=print, on_retry=None,
+                    job_id=None, on_slot=None):
+    """Run one copy job inside a controller slot and return it once it succeeded
+
+    Throttled submissions are retried by the controller; a job that itself
+    fails with rateLimitExceeded or quotaExceeded is resubmitted after a
+    backoff. Any other error is raised. on_retry is called for every retry,
+    on_slot whenever an attempt gets its slot.
+    With job_id, jobs an earlier run submitted are reattached to (see submit_or_reattach).
+    """
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        with controller.slot() as slot:
+            if on_slot is not None:
+                on_slot()
+            copy_job = submit_job(client, task, location, operation_type, controller, job_id, log, on_retry)
+            # A job taken over from an earlier run may already be done
+            finished = copy_job if copy_job.state == "DONE" else tracker.track(client, copy_job).wait()
+            try:
+                return finished.result()
+            except Exception as e:
+                if not resubmit_throttled(e, attempt, task, log):
+                    raise
+                slot["throttled"] = True
+        controller.on_throttled()
+        if on_retry is not None:
+            on_retry()
+        controller.backoff(attempt)
+
+
+def run_copy_job(client, task, step="copy", location=None, log=print, operation_type=OPERATION_COPY,
+                 stats=None, tracker=None, incremental=False, controller=None, metrics=None, run_id=None):
+    """Submit a single copy job and wait for it, return a CopyResult on success and False on failure"""
+    tracker = tracker or shared_tracker()
+    controller = controller or shared_controller()
+    report = CopyReport(task, step, operation_type, log, stats, metrics)
+    try:
+        if incremental and check_existing_copy(client, task, log):
+            return report.unchanged()
+        job_id = report.submitting(run_id)
+        submit_and_wait(
+            client, task, location, operation_type, tracker, controller, log, report.retried, job_id,
+            report.slot_acquired
+        )
+        return report.succeeded()
+    except Exception as e:
+        if not report.falls_back(e):
+            return report.failed(e)
+    return run_copy_job(
+        client, task, step, location, log, stats=stats, tracker=tracker, controller=controller, metrics=metrics,
+        run_id=run_id
+    )
+
+
+def run_copy_jobs(client, tasks, step="copy", location=None,
+                  max_in_flight=MAX_IN_FLIGHT_JOBS, log=print, tracker=None, incremental=False, metrics=None):
+    """Run copy jobs with at most max_in_flight outstanding, return (succeeded, failed) table IDs"""
+    succeeded = []
+    failed = []
+    if not tasks:
+        return succeeded, failed
+
+    # Each worker holds one job; results are collected in completion order
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(tasks)))) as executor:
+        futures = {
+            executor.submit(
+                run_copy_job, client, task, step, location, log,
+                tracker=tracker, incremental=incremental, metrics=metrics
+            ): task
+            for task in tasks
+        }
+        for future in as_completed(futures):
+            task = futures[future]
+            if future.result():
+                succeeded.append(task.table_id)
+            else:
+                failed.append(task.table_id)
+
+    return succeeded, failed
@@ -0,0 +1,123 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+import json
+import re
+
+# Projects listed at once during discovery
+DISCOVERY_WORKERS = 16
+
+# Datasets never picked up by a pattern: the temporary and backup datasets of earlier runs
+DEFAULT_EXCLUDE = ["*_EU", "*_old"]
+
+# Locations a manifest may migrate from; the migration steps copy out of US only
+SOURCE_LOCATIONS = {"US"}
+
+# "project.dataset" or "project:dataset"; dataset IDs never contain either separator, project IDs may
+# ("example.com:proj"), so the name is split at the last one
+DATASET_NAME = re.compile(r"^(?P<project>.+)[.:](?P<dataset>[^.:]+)$")
+
+# One dataset found by discovery, with the location reported by the listing
+DatasetRef = namedtuple("DatasetRef", "project dataset_id location")
+
+
+def load_manifest(path):
+    """Read a discovery manifest (JSON)
+
+    Example: {"projects": ["sales-prod", "hr-prod"], "include": ["sales_*"],
+    "exclude": ["*_tmp"], "datasets": ["hr-prod.payroll"], "location": "US"}.
+    Every key is optional except that projects or datasets must name something;
+    location, if given, must be US.
+    """
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if not manifest.get("projects") and not manifest.get("datasets"):
+        raise ValueError(f"Manifest {path} names no projects and no datasets")
+    if manifest.get("location", "US").upper() not in SOURCE_LOCATIONS:
+        raise ValueError(f"Manifest {path} has location {manifest['location']}, only US datasets can be migrated")
+    for name in manifest.get("datasets", []):
+        split_dataset_name(name)
+    return manifest
+
+
+def split_dataset_name(name):
+    """(project, dataset_id) of a "project.dataset" or "project:dataset" name"""
+    match = DATASET_NAME.match(name)
+    if match is None:
+        raise ValueError(f"Dataset {name} is not of the form project.dataset")
+    return match.group("project"), match.group("dataset")
+
+
+def selected(dataset_id, include=None, exclude=None):
+    """True if dataset_id matches an include pattern (default: all) and no exclude pattern"""
+    if any(fnmatchcase(dataset_id, pattern) for pattern in DEFAULT_EXCLUDE + list(exclude or [])):
+        return False
+    return any(fnmatchcase(dataset_id, pattern) for pattern in include or ["*"])
+
+
+def listing_location(item):
+    """Location of a dataset from its list_datasets item, None if the listing did not include it"""
+    # DatasetListItem has no location attribute, but datasets.list returns the field
+    properties = getattr(item, "_properties", None) or {}
+    return properties.get("location") or getattr(item, "location", None)
+
+
+def list_project_datasets(client, project):
+    """Every dataset of a project with its location, from one paged datasets.list call"""
+    found = []
+    for item in client.list_datasets(project=project):
+        location = listing_location(item)
+        if location is None:
+            # Older listings lack the field; one get_dataset per such dataset
+            location = client.get_dataset(f"{project}.{item.dataset_id}").location
+        found.append(DatasetRef(project, item.dataset_id, location))
+    return found
+
+
+def discover_datasets(client, manifest, max_workers=DISCOVERY_WORKERS, log=print):
+    """Datasets selected by a manifest, listed across all its projects in parallel
+
+    Returns (datasets, skipped): the selected datasets in the manifest's source
+    location, sorted by project and name, and the selected ones found in any
+    other location. Projects that cannot be listed are reported and left out.
+    """
+    source_location = manifest.get("location", "US").upper()
+    explicit = {}
+    for name in manifest.get("datasets", []):
+        project, dataset_id = split_dataset_name(name)
+        explicit.setdefault(project, set()).add(dataset_id)
+    projects = sorted(set(manifest.get("projects", [])) | set(explicit))
+
+    def list_one(project):
+        try:
+            return list_project_datasets(client, project)
+        except Exception as e:
+            log(f"Error listing datasets of project {project}: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(projects) or 1))) as executor:
+        listings = dict(zip(projects, executor.map(list_one, projects)))
+
+    datasets = []
+    skipped = []
+    for project in projects:
+        listed = {ref.dataset_id: ref for ref in listings[project]}
+        for dataset_id in sorted(explicit.get(project, ())):
+            if dataset_id not in listed:
+                log(f"Dataset {project}.{dataset_id} from the manifest was not found")
+        for ref in listings[project]:
+            # Datasets named explicitly are taken as they are; patterns apply to whole projects
+            picked = ref.dataset_id in explicit.get(project, ()) or (
+                project in manifest.get("projects", [])
+                and selected(ref.dataset_id, manifest.get("include"), manifest.get("exclude"))
+            )
+            if not picked:
+                continue
+            if (ref.location or "").upper() == source_location:
+                datasets.append(ref)
+            else:
+                skipped.append(ref)
+
+    log(f"Discovered {len(datasets)} datasets in {source_location} across {len(projects)} projects "
+        f"({len(skipped)} selected datasets are in other locations)")
+    return datasets, skipped
@@ -0,0 +1,639 @@
+from collections import Counter
+from datetime import datetime, timezone
+from google.api_core.exceptions import (
+    BadRequest, Conflict, Forbidden, InternalServerError, NotFound, TooManyRequests
+)
+from google.cloud import bigquery
+import random
+import re
+import threading
+import time
+
+# Fixed time every simulated job takes (submission, scheduling, commit), in seconds
+DEFAULT_JOB_LATENCY = 0.05
+
+# Simulated transfer rate of full copies; snapshots and clones only take the fixed latency
+DEFAULT_BYTES_PER_SECOND = 2 * 1024 ** 3
+
+# Simulated network round trip added to every API call, in seconds
+DEFAULT_API_LATENCY = 0.0
+
+# Job error reasons and the exception result() raises for each
+JOB_ERRORS = {
+    "notFound": NotFound,
+    "duplicate": Conflict,
+    "invalid": BadRequest,
+    "rateLimitExceeded": Forbidden,
+    "backendError": InternalServerError,
+}
+
+# Table types that copy jobs with operation_type SNAPSHOT or CLONE accept
+ZERO_COPY_TABLE_TYPES = {"TABLE"}
+
+# Table types no copy job accepts
+NOT_COPYABLE_TABLE_TYPES = {"VIEW", "MATERIALIZED_VIEW", "EXTERNAL"}
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _operation_type(job_config):
+    """Operation of a copy job config; unset (OPERATION_TYPE_UNSPECIFIED in the library) means COPY"""
+    operation_type = getattr(job_config, "operation_type", None)
+    return "COPY" if operation_type in (None, "OPERATION_TYPE_UNSPECIFIED") else operation_type
+
+
+class FakeDataset:
+    """What get_dataset returns"""
+
+    def __init__(self, project, dataset_id, location, labels=None):
+        self.project = project
+        self.dataset_id = dataset_id
+        self.location = location
+        self.labels = dict(labels or {})
+        self.created = _now()
+        self.modified = self.created
+        self.reference = bigquery.DatasetReference(project, dataset_id)
+        self.full_dataset_id = f"{project}:{dataset_id}"
+
+
+class FakeDatasetListItem:
+    """What list_datasets yields: like DatasetListItem, the location is only in the raw resource"""
+
+    def __init__(self, dataset):
+        self.project = dataset.project
+        self.dataset_id = dataset.dataset_id
+        self.labels = dict(dataset.labels)
+        self._properties = {
+            "datasetReference": {"projectId": dataset.project, "datasetId": dataset.dataset_id},
+            "location": dataset.location,
+        }
+
+
+class FakeTable:
+    """What get_table and list_tables return"""
+
+    def __init__(self, project, dataset_id, table_id, num_rows=0, num_bytes=0, table_type="TABLE", schema=None):
+        self.project = project
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.num_rows = num_rows
+        self.num_bytes = num_bytes
+        self.table_type = table_type
+        self.schema = list(schema) if schema is not None else [bigquery.SchemaField("id", "INTEGER")]
+        self.created = _now()
+        self.modified = self.created
+        self.time_partitioning = None
+        self.range_partitioning = None
+        self.clustering_fields = None
+        self.description = None
+        self.friendly_name = None
+        self.labels = {}
+        self.require_partition_filter = None
+        self.expires = None
+        self.encryption_configuration = None
+        # {partition_id: (num_rows, num_bytes)} of a partitioned table, None for an unpartitioned one
+        self.partitions = None
+        self.reference = bigquery.DatasetReference(project, dataset_id).table(table_id)
+        self.full_table_id = f"{project}:{dataset_id}.{table_id}"
+
+    def copy_to(self, project, dataset_id, table_id):
+        """The table a finished copy job leaves behind"""
+        copy = FakeTable(project, dataset_id, table_id, self.num_rows, self.num_bytes, self.table_type, self.schema)
+        for name in ("time_partitioning", "description", "friendly_name", "require_partition_filter", "expires",
+                     "encryption_configuration"):
+            setattr(copy, name, getattr(self, name))
+        copy.labels = dict(self.labels)
+        copy.partitions = dict(self.partitions) if self.partitions is not None else None
+        return copy
+
+    def set_partition(self, partition_id, num_rows, num_bytes):
+        """Replace one partition and update the table totals"""
+        self.partitions[partition_id] = (num_rows, num_bytes)
+        self.num_rows = sum(rows for rows, _ in self.partitions.values())
+        self.num_bytes = sum(size for _, size in self.partitions.values())
+        self.modified = _now()
+
+
+class FakeRow(dict):
+    """Query result row with attribute access, like bigquery.Row"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakePages(list):
+    """Query rows or listed tables, also readable page by page like the library's iterators"""
+
+    def __init__(self, items, page_size=None):
+        super().__init__(items)
+        self.page_size = page_size
+
+    @property
+    def pages(self):
+        size = self.page_size or len(self) or 1
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+
+class FakeQueryJob:
+    def __init__(self, rows):
+        self.rows = rows
+        self.state = "DONE"
+
+    def result(self, timeout=None, page_size=None):
+        return FakePages(self.rows, page_size)
+
+
+class FakeCopyJob:
+    """A copy job whose state advances with the wall clock
+
+    The job finishes job_latency seconds after submission, plus the time a
+    full copy of the source needs at the backend's transfer rate. Its effect
+    (the destination table, or the error) is applied the first time anyone
+    looks at it after that.
+    """
+
+    job_type = "copy"
+
+    def __init__(self, backend, job_id, project, location, source, destination, job_config, duration, error=None,
+                 partition=None):
+        self.backend = backend
+        self.job_id = job_id
+        self.project = project
+        self.location = location
+        self.source = source
+        self.destination = destination
+        self.job_config = job_config
+        self.partition = partition
+        self.created = _now()
+        self.started = self.created
+        self.ended = None
+        self.error_result = None
+        self.errors = None
+        self._finishes_at = time.monotonic() + duration
+        self._planned_error = error
+        self._state = "RUNNING"
+
+    @property
+    def state(self):
+        self.backend.advance(self)
+        return self._state
+
+    def done(self, retry=None, timeout=None, reload=True):
+        if reload:
+            self.backend.count("jobs.get")
+        return self.state == "DONE"
+
+    def running(self):
+        return self.state == "RUNNING"
+
+    def reload(self, client=None, retry=None, timeout=None):
+        self.backend.count("jobs.get")
+        self.backend.advance(self)
+
+    def exception(self, timeout=None):
+        if self.state != "DONE" or not self.error_result:
+            return None
+        error_class = JOB_ERRORS.get(self.error_result["reason"], InternalServerError)
+        return error_class(self.error_result["message"], errors=[dict(self.error_result)])
+
+    def result(self, retry=None, timeout=None):
+        """Block until the job is done, then return it or raise its error"""
+        if self._state != "DONE":
+            # Like the real client, waiting on a job that is not known to be done costs a status call
+            remaining = self._finishes_at - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+            self.reload()
+        error = self.exception()
+        if error is not None:
+            raise error
+        return self
+
+
+class _JobListing:
+    """list_jobs() result: iterable, with the pages of the real HTTP iterator"""
+
+    def __init__(self, backend, jobs, page_size):
+        self.backend = backend
+        self.jobs = jobs
+        self.page_size = max(1, page_size or 50)
+
+    @property
+    def pages(self):
+        for start in range(0, max(len(self.jobs), 1), self.page_size):
+            if start:
+                self.backend.count("jobs.list")
+            yield self.jobs[start:start + self.page_size]
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class FakeBigQuery:
+    """In-process stand-in for the BigQuery service, shared by any number of FakeClients
+
+    Holds datasets, tables and jobs for every location, counts API calls by
+    method, and injects the failures real runs see: throttled submissions
+    (quota_error_rate), jobs that fail (failure_rate, or always for tables in
+    fail_tables), jobs that hit rate limits (job_quota_error_rate) and a cap
+    on concurrently running jobs per project (concurrent_job_limit).
+    """
+
+    def __init__(self, project="fake-project", job_latency=DEFAULT_JOB_LATENCY,
+                 bytes_per_second=DEFAULT_BYTES_PER_SECOND, api_latency=DEFAULT_API_LATENCY,
+                 quota_error_rate=0.0, job_quota_error_rate=0.0, failure_rate=0.0, fail_tables=(),
+                 concurrent_job_limit=None, seed=0):
+        self.project = project
+        self.job_latency = job_latency
+        self.bytes_per_second = bytes_per_second
+        self.api_latency = api_latency
+        self.quota_error_rate = quota_error_rate
+        self.job_quota_error_rate = job_quota_error_rate
+        self.failure_rate = failure_rate
+        self.fail_tables = set(fail_tables)
+        self.concurrent_job_limit = concurrent_job_limit
+        self.calls = Counter()
+        self.datasets = {}
+        self.tables = {}
+        self.jobs = {}
+        self._random = random.Random(seed)
+        self._job_ids = 0
+        self._lock = threading.RLock()
+
+    def client(self, location=None, project=None):
+        """A client bound to one default location, like bigquery.Client(location=...)"""
+        return FakeClient(self, project or self.project, location)
+
+    def count(self, method):
+        with self._lock:
+            self.calls[method] += 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    def api_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _chance(self, rate):
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    # Seeding helpers; these are not API calls
+
+    def add_dataset(self, dataset_id, location="US", project=None, labels=None):
+        project = project or self.project
+        with self._lock:
+            dataset = FakeDataset(project, dataset_id, location, labels)
+            self.datasets[(project, dataset_id)] = dataset
+            return dataset
+
+    def add_table(self, dataset_id, table_id, num_rows=0, num_bytes=0, table_type="TABLE", schema=None, project=None,
+                  partitions=None):
+        """Add a table; partitions ({partition_id: (num_rows, num_bytes)}) makes it day-partitioned"""
+        project = project or self.project
+        with self._lock:
+            if (project, dataset_id) not in self.datasets:
+                raise NotFound(f"Not found: Dataset {project}:{dataset_id}")
+            table = FakeTable(project, dataset_id, table_id, num_rows, num_bytes, table_type, schema)
+            if partitions is not None:
+                table.time_partitioning = bigquery.TimePartitioning(type_="DAY")
+                table.partitions = {}
+                for partition_id, (partition_rows, partition_bytes) in partitions.items():
+                    table.set_partition(partition_id, partition_rows, partition_bytes)
+            self.tables[(project, dataset_id, table_id)] = table
+            return table
+
+    # Job lifecycle
+
+    def submit_copy(self, project, location, source_key, destination_key, job_config, job_id=None, partition=None):
+        with self._lock:
+            if job_id is not None and job_id in self.jobs:
+                raise Conflict(f"Already Exists: Job {project}:{location}.{job_id}")
+            if self._chance(self.quota_error_rate):
+                raise TooManyRequests("rateLimitExceeded: Exceeded rate limits: too many api requests per user")
+            if self.concurrent_job_limit is not None:
+                running = sum(
+                    1 for job in self.jobs.values()
+                    if job.project == project and job._state == "RUNNING" and time.monotonic() < job._finishes_at
+                )
+                if running >= self.concurrent_job_limit:
+                    raise TooManyRequests("quotaExceeded: Quota exceeded: too many concurrent copy jobs")
+
+            source = self.tables.get(source_key)
+            operation_type = _operation_type(job_config)
+            error = None
+            duration = self.job_latency
+            if source is None:
+                error = ("notFound", f"Not found: Table {source_key[0]}:{source_key[1]}.{source_key[2]}")
+            elif partition is not None and partition not in (source.partitions or {}):
+                error = ("notFound", f"Not found: Partition {source_key[2]}${partition}")
+            elif operation_type in ("SNAPSHOT", "CLONE") and source.table_type not in ZERO_COPY_TABLE_TYPES:
+                error = ("invalid", f"{operation_type.title()} is not supported for {source.table_type} tables")
+            elif source.table_type in NOT_COPYABLE_TABLE_TYPES:
+                error = ("invalid", f"Copying {source.table_type} tables is not supported")
+            else:
+                if operation_type == "COPY" and self.bytes_per_second:
+                    num_bytes = source.partitions[partition][1] if partition is not None else source.num_bytes
+                    duration += num_bytes / self.bytes_per_second
+                if source_key[2] in self.fail_tables or self._chance(self.failure_rate):
+                    error = ("backendError", f"Backend error copying {source_key[2]}")
+                elif self._chance(self.job_quota_error_rate):
+                    error = ("rateLimitExceeded", "Exceeded rate limits: too many table copy operations")
+
+            if job_id is None:
+                self._job_ids += 1
+                job_id = f"job_fake_{self._job_ids:06d}"
+            job = FakeCopyJob(
+                self, job_id, project, location, source_key, destination_key, job_config, duration, error, partition
+            )
+            self.jobs[job_id] = job
+            return job
+
+    def advance(self, job):
+        """Finish a job whose time is up and apply its effect exactly once"""
+        with self._lock:
+            if job._state == "DONE" or time.monotonic() < job._finishes_at:
+                return
+            job._state = "DONE"
+            job.ended = _now()
+            error = job._planned_error or self._copy_effect(job)
+            if error is not None:
+                reason, message = error
+                job.error_result = {"reason": reason, "message": message}
+                job.errors = [dict(job.error_result)]
+
+    def _copy_effect(self, job):
+        project, dataset_id, table_id = job.destination
+        if (project, dataset_id) not in self.datasets:
+            return "notFound", f"Not found: Dataset {project}:{dataset_id}"
+        source = self.tables.get(job.source)
+        if source is None:
+            return "notFound", f"Not found: Table {job.source[0]}:{job.source[1]}.{job.source[2]}"
+        existing = self.tables.get(job.destination)
+        write_disposition = getattr(job.job_config, "write_disposition", None)
+        if job.partition is not None:
+            return self._copy_partition(job, source, existing, write_disposition)
+        if existing is not None and write_disposition in (None, "WRITE_EMPTY") and existing.num_rows:
+            return "duplicate", f"Already Exists: Table {project}:{dataset_id}.{table_id}"
+        copy = source.copy_to(project, dataset_id, table_id)
+        # Like BigQuery, the job creates the table before it ends
+        copy.created = copy.modified = job.ended
+        if _operation_type(job.job_config) == "SNAPSHOT":
+            copy.table_type = "SNAPSHOT"
+        self.tables[job.destination] = copy
+        return None
+
+    def _copy_partition(self, job, source, existing, write_disposition):
+        project, dataset_id, table_id = job.destination
+        if existing is None:
+            existing = source.copy_to(project, dataset_id, table_id)
+            existing.created = job.ended
+            existing.partitions = {}
+            existing.num_rows = existing.num_bytes = 0
+            self.tables[job.destination] = existing
+        elif existing.partitions is None:
+            return "invalid", f"Table {project}:{dataset_id}.{table_id} is not partitioned"
+        if write_disposition in (None, "WRITE_EMPTY") and existing.partitions.get(job.partition, (0, 0))[0]:
+            return "duplicate", f"Already Exists: Partition {table_id}${job.partition}"
+        existing.set_partition(job.partition, *source.partitions[job.partition])
+        return None
+
+    def advance_all(self):
+        with self._lock:
+            for job in list(self.jobs.values()):
+                self.advance(job)
+
+
+class FakeClient:
+    """The subset of bigquery.Client the migration scripts use, backed by a FakeBigQuery
+
+    Covers dataset(), list_datasets, get/create/delete_dataset, list_tables,
+    get/create/delete_table, copy_table (including partition decorators),
+    list_jobs, get_job and the INFORMATION_SCHEMA inventory and partition
+    queries from inventory.py and partition_copy.py.
+    """
+
+    def __init__(self, backend, project, location=None):
+        self.backend = backend
+        self.project = project
+        self.location = location
+
+    # Identifier handling
+
+    def dataset(self, dataset_id, project=None):
+        return bigquery.DatasetReference(project or self.project, dataset_id)
+
+    def _dataset_key(self, dataset):
+        if isinstance(dataset, str):
+            parts = dataset.replace(":", ".").split(".")
+            return (parts[0], parts[1]) if len(parts) == 2 else (self.project, parts[0])
+        return dataset.project, dataset.dataset_id
+
+    def _table_key(self, table):
+        if isinstance(table, str):
+            # Partition decorators are dropped from keys; copy_table passes the partition on its own
+            parts = table.split("$")[0].replace(":", ".").split(".")
+            if len(parts) == 2:
+                parts.insert(0, self.project)
+            return tuple(parts)
+        return table.project, table.dataset_id, table.table_id
+
+    # Datasets
+
+    def list_datasets(self, project=None, max_results=None, page_size=None, retry=None, timeout=None):
+        self.backend.count("datasets.list")
+        project = project or self.project
+        with self.backend._lock:
+            datasets = [dataset for key, dataset in sorted(self.backend.datasets.items()) if key[0] == project]
+        return iter([FakeDatasetListItem(dataset) for dataset in datasets[:max_results or None]])
+
+    def get_dataset(self, dataset_ref, retry=None, timeout=None):
+        self.backend.count("datasets.get")
+        key = self._dataset_key(dataset_ref)
+        with self.backend._lock:
+            dataset = self.backend.datasets.get(key)
+        if dataset is None:
+            raise NotFound(f"Not found: Dataset {key[0]}:{key[1]}")
+        return dataset
+
+    def create_dataset(self, dataset, exists_ok=False, retry=None, timeout=None):
+        self.backend.count("datasets.insert")
+        key = self._dataset_key(dataset)
+        with self.backend._lock:
+            existing = self.backend.datasets.get(key)
+            if existing is not None:
+                if exists_ok:
+                    return existing
+                raise Conflict(f"Already Exists: Dataset {key[0]}:{key[1]}")
+            location = getattr(dataset, "location", None) or self.location or "US"
+            return self.backend.add_dataset(key[1], location, key[0], getattr(dataset, "labels", None))
+
+    def delete_dataset(self, dataset, delete_contents=False, not_found_ok=False, retry=None, timeout=None):
+        self.backend.count("datasets.delete")
+        key = self._dataset_key(dataset)
+        with self.backend._lock:
+            if key not in self.backend.datasets:
+                if not_found_ok:
+                    return
+                raise NotFound(f"Not found: Dataset {key[0]}:{key[1]}")
+            tables = [table_key for table_key in self.backend.tables if table_key[:2] == key]
+            if tables and not delete_contents:
+                raise BadRequest(f"Dataset {key[0]}:{key[1]} is still in use")
+            for table_key in tables:
+                del self.backend.tables[table_key]
+            del self.backend.datasets[key]
+
+    # Tables
+
+    def list_tables(self, dataset, max_results=None, page_size=None, retry=None, timeout=None):
+        self.backend.count("tables.list")
+        key = self._dataset_key(dataset)
+        with self.backend._lock:
+            if key not in self.backend.datasets:
+                raise NotFound(f"Not found: Dataset {key[0]}:{key[1]}")
+            tables = [table for table_key, table in sorted(self.backend.tables.items()) if table_key[:2] == key]
+        return FakePages(tables[:max_results] if max_results else tables, page_size)
+
+    def create_table(self, table, exists_ok=False, retry=None, timeout=None):
+        self.backend.count("tables.insert")
+        key = self._table_key(table)
+        with self.backend._lock:
+            existing = self.backend.tables.get(key)
+            if existing is not None:
+                if exists_ok:
+                    return existing
+                raise Conflict(f"Already Exists: Table {key[0]}:{key[1]}.{key[2]}")
+            if key[:2] not in self.backend.datasets:
+                raise NotFound(f"Not found: Dataset {key[0]}:{key[1]}")
+            created = FakeTable(*key, schema=getattr(table, "schema", None) or None)
+            for name in ("time_partitioning", "description", "friendly_name", "require_partition_filter", "expires",
+                         "encryption_configuration"):
+                setattr(created, name, getattr(table, name, None))
+            created.labels = dict(getattr(table, "labels", None) or {})
+            if created.time_partitioning is not None:
+                created.partitions = {}
+            self.backend.tables[key] = created
+            return created
+
+    def get_table(self, table, retry=None, timeout=None):
+        self.backend.count("tables.get")
+        key = self._table_key(table)
+        with self.backend._lock:
+            found = self.backend.tables.get(key)
+        if found is None:
+            raise NotFound(f"Not found: Table {key[0]}:{key[1]}.{key[2]}")
+        return found
+
+    def delete_table(self, table, not_found_ok=False, retry=None, timeout=None):
+        self.backend.count("tables.delete")
+        key = self._table_key(table)
+        with self.backend._lock:
+            if self.backend.tables.pop(key, None) is None and not not_found_ok:
+                raise NotFound(f"Not found: Table {key[0]}:{key[1]}.{key[2]}")
+
+    # Jobs
+
+    def copy_table(self, sources, destination, job_id=None, job_id_prefix=None, location=None,
+                   project=None, job_config=None, retry=None, timeout=None):
+        self.backend.count("jobs.insert")
+        if isinstance(sources, (list, tuple)):
+            sources = sources[0]
+        return self.backend.submit_copy(
+            project or self.project,
+            location or self.location,
+            self._table_key(sources),
+            self._table_key(destination),
+            job_config,
+            job_id,
+            sources.split("$")[1] if isinstance(sources, str) and "$" in sources else None
+        )
+
+    def get_job(self, job_id, project=None, location=None, retry=None, timeout=None):
+        self.backend.count("jobs.get")
+        with self.backend._lock:
+            job = self.backend.jobs.get(job_id)
+        if job is None:
+            raise NotFound(f"Not found: Job {project or self.project}:{job_id}")
+        return job
+
+    def list_jobs(self, project=None, max_results=None, page_token=None, all_users=None, state_filter=None,
+                  min_creation_time=None, max_creation_time=None, page_size=None, retry=None, timeout=None):
+        self.backend.count("jobs.list")
+        project = project or self.project
+        self.backend.advance_all()
+        with self.backend._lock:
+            jobs = [
+                job for job in self.backend.jobs.values()
+                if job.project == project and (min_creation_time is None or job.created >= min_creation_time)
+            ]
+        jobs.sort(key=lambda job: job.created, reverse=True)
+        if state_filter:
+            jobs = [job for job in jobs if job.state.lower() == state_filter.lower()]
+        return _JobListing(self.backend, jobs[:max_results] if max_results else jobs, page_size)
+
+    def query(self, query, job_config=None, location=None, project=None, retry=None, timeout=None, job_id=None):
+        """Answer the inventory and partition queries; anything else is rejected"""
+        self.backend.count("jobs.query")
+        region = re.search(r"`([^`.]+)\.region-(\w+)\.INFORMATION_SCHEMA\.TABLES`", query)
+        if region:
+            project, location = region.group(1), region.group(2).upper()
+            names = set()
+            for parameter in getattr(job_config, "query_parameters", None) or []:
+                if parameter.name == "datasets":
+                    names = set(parameter.values)
+            with self.backend._lock:
+                keys = [
+                    key for key, dataset in self.backend.datasets.items()
+                    if key[0] == project and key[1] in names and dataset.location.upper() == location
+                ]
+            return FakeQueryJob([row for key in sorted(keys) for row in self._inventory_rows(key, columns=False)])
+
+        partitions = re.search(r"`([^`.]+)\.([^`.]+)\.INFORMATION_SCHEMA\.PARTITIONS`", query)
+        if partitions:
+            names = [parameter.value for parameter in getattr(job_config, "query_parameters", None) or []
+                     if parameter.name == "table_name"]
+            with self.backend._lock:
+                table = self.backend.tables.get((partitions.group(1), partitions.group(2), names[0] if names else None))
+                items = sorted((table.partitions or {}).items()) if table is not None else []
+            return FakeQueryJob([
+                FakeRow(partition_id=partition_id, num_rows=num_rows, num_bytes=num_bytes)
+                for partition_id, (num_rows, num_bytes) in items
+            ])
+
+        dataset = re.search(r"`([^`.]+)\.([^`.]+)\.INFORMATION_SCHEMA\.TABLES`", query)
+        if dataset:
+            key = (dataset.group(1), dataset.group(2))
+            with self.backend._lock:
+                if key not in self.backend.datasets:
+                    raise NotFound(f"Not found: Dataset {key[0]}:{key[1]}")
+            return FakeQueryJob(self._inventory_rows(key))
+        raise BadRequest("The fake BigQuery client only answers inventory queries")
+
+    def _inventory_rows(self, dataset_key, columns=True):
+        types = {"TABLE": "BASE TABLE", "MATERIALIZED_VIEW": "MATERIALIZED VIEW"}
+        with self.backend._lock:
+            tables = [table for key, table in sorted(self.backend.tables.items()) if key[:2] == dataset_key]
+        rows = [
+            FakeRow(
+                dataset_id=table.dataset_id,
+                table_id=table.table_id,
+                table_type=types.get(table.table_type, table.table_type),
+                num_bytes=table.num_bytes,
+                num_rows=table.num_rows,
+                partitioning="_PARTITIONTIME" if table.partitions is not None else None,
+                last_modified=table.modified,
+            )
+            for table in tables
+        ]
+        if columns:
+            # The region inventory query does not select the column list
+            for row, table in zip(rows, tables):
+                row["columns"] = ", ".join(f"{field.name} {field.field_type} YES" for field in table.schema)
+        return rows
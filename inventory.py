@@ -0,0 +1,117 @@
+from collections import namedtuple
+from google.cloud import bigquery
+
+# Every table of one dataset with its type, size, row count, partitioning column,
+# last modification and column list. __TABLES__ holds the storage statistics.
+DATASET_INVENTORY_QUERY = """
+SELECT
+  t.table_schema AS dataset_id,
+  t.table_name AS table_id,
+  t.table_type,
+  s.size_bytes AS num_bytes,
+  s.row_count AS num_rows,
+  c.partitioning,
+  TIMESTAMP_MILLIS(s.last_modified_time) AS last_modified,
+  c.columns
+FROM `{project}.{dataset}.INFORMATION_SCHEMA.TABLES` AS t
+LEFT JOIN `{project}.{dataset}.__TABLES__` AS s
+  ON s.table_id = t.table_name
+LEFT JOIN (
+  SELECT
+    table_name,
+    MAX(IF(is_partitioning_column = 'YES', column_name, NULL)) AS partitioning,
+    STRING_AGG(CONCAT(column_name, ' ', data_type, ' ', is_nullable), ', ' ORDER BY ordinal_position) AS columns
+  FROM `{project}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+  GROUP BY table_name
+) AS c
+  ON c.table_name = t.table_name
+"""
+
+# The same for every dataset of a project in one region, without the column list (the migration only
+# needs sizes and the partitioning column up front); TABLE_STORAGE replaces __TABLES__
+REGION_INVENTORY_QUERY = """
+SELECT
+  t.table_schema AS dataset_id,
+  t.table_name AS table_id,
+  t.table_type,
+  s.total_logical_bytes AS num_bytes,
+  s.total_rows AS num_rows,
+  c.partitioning,
+  s.storage_last_modified_time AS last_modified
+FROM `{project}.region-{region}.INFORMATION_SCHEMA.TABLES` AS t
+LEFT JOIN `{project}.region-{region}.INFORMATION_SCHEMA.TABLE_STORAGE` AS s
+  ON s.table_schema = t.table_schema AND s.table_name = t.table_name AND NOT s.deleted
+LEFT JOIN (
+  SELECT
+    table_schema,
+    table_name,
+    MAX(IF(is_partitioning_column = 'YES', column_name, NULL)) AS partitioning
+  FROM `{project}.region-{region}.INFORMATION_SCHEMA.COLUMNS`
+  WHERE is_partitioning_column = 'YES'
+  GROUP BY table_schema, table_name
+) AS c
+  ON c.table_schema = t.table_schema AND c.table_name = t.table_name
+WHERE t.table_schema IN UNNEST(@datasets)
+"""
+
+# INFORMATION_SCHEMA table types, spelled the way TableListItem.table_type spells them
+TABLE_TYPES = {
+    "BASE TABLE": "TABLE",
+    "CLONE": "TABLE",
+    "MATERIALIZED VIEW": "MATERIALIZED_VIEW",
+}
+
+# One table as seen by the inventory
+TableInfo = namedtuple(
+    "TableInfo",
+    ["dataset_id", "table_id", "table_type", "num_bytes", "num_rows", "partitioning", "last_modified", "columns"]
+)
+
+
+def _table_info(row):
+    return TableInfo(
+        row.dataset_id,
+        row.table_id,
+        TABLE_TYPES.get(row.table_type, row.table_type),
+        row.num_bytes or 0,
+        row.num_rows or 0,
+        row.partitioning,
+        row.last_modified,
+        getattr(row, "columns", None) or "",
+    )
+
+
+def dataset_inventory(client, project, dataset, location=None):
+    """Every table of a dataset with its size and metadata, from a single query"""
+    query = DATASET_INVENTORY_QUERY.format(project=project, dataset=dataset)
+    rows = client.query(query, location=location).result()
+    return sorted((_table_info(row) for row in rows), key=lambda table: table.table_id)
+
+
+def dataset_inventory_pages(client, project, dataset, location=None, page_size=None):
+    """The same tables one result page at a time, as lists of TableInfo in no particular order
+
+    The query runs (and fails) before this returns; each further page is only
+    fetched when the caller gets to it.
+    """
+    query = DATASET_INVENTORY_QUERY.format(project=project, dataset=dataset)
+    rows = client.query(query, location=location).result(page_size=page_size)
+    return ([_table_info(row) for row in page] for page in rows.pages)
+
+
+def region_inventory(client, project, region, datasets):
+    """Tables of several datasets in one region from a single query, as {dataset_id: [TableInfo, ...]}
+
+    Datasets without tables are absent from the result; columns is empty.
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter("datasets", "STRING", list(datasets))]
+    )
+    query = REGION_INVENTORY_QUERY.format(project=project, region=region.lower())
+    rows = client.query(query, job_config=job_config, location=region).result()
+    inventories = {}
+    for row in rows:
+        inventories.setdefault(row.dataset_id, []).append(_table_info(row))
+    for tables in inventories.values():
+        tables.sort(key=lambda table: table.table_id)
+    return inventories
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta, timezone
+import threading
+import time
+
+# Seconds between two status refreshes of all outstanding jobs
+POLL_INTERVAL = 2.0
+
+# Job states listed on each refresh; finished jobs are never listed, so the listing stays small
+UNFINISHED_STATES = ("pending", "running")
+
+# Page size used when listing jobs (the API maximum)
+LIST_PAGE_SIZE = 1000
+
+
+class TrackedJob:
+    """Handle for one watched job, returned by JobTracker.track()"""
+
+    def __init__(self, client, job, callback):
+        self.client = client
+        self.job = job
+        self.callback = callback
+        self.finished = None
+        self.event = threading.Event()
+        self.submitted = datetime.now(timezone.utc)
+
+    def wait(self, timeout=None):
+        """Block until the job finishes and return it (call result() on it to raise job errors)"""
+        if not self.event.wait(timeout):
+            raise TimeoutError(f"Job {self.job.job_id} did not finish within {timeout}s")
+        return self.finished
+
+
+class JobTracker:
+    """Watch all outstanding BigQuery jobs together instead of polling each one
+
+    Every POLL_INTERVAL seconds the tracker lists the pending and running jobs
+    of each project and updates every tracked job from those listings, so the
+    number of status calls grows with elapsed time rather than with the number
+    of jobs. A tracked job that drops out of the listings is reloaded on its
+    own to pick up its final state.
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.api_calls = 0
+        self._lock = threading.Lock()
+        self._outstanding = {}
+        self._states = {}
+        self._done = 0
+        self._failed = 0
+        self._thread = None
+
+    def track(self, client, job, callback=None):
+        """Start watching a submitted job; callback(finished_job) runs when it completes"""
+        entry = TrackedJob(client, job, callback)
+        with self._lock:
+            self._outstanding[job.job_id] = entry
+            self._states[job.job_id] = job.state or "PENDING"
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll_loop, name="job-tracker", daemon=True)
+                self._thread.start()
+        return entry
+
+    def counts(self):
+        """Number of tracked jobs per state: pending, running, done and failed"""
+        with self._lock:
+            states = list(self._states.values())
+            return {
+                "pending": sum(1 for state in states if state == "PENDING"),
+                "running": sum(1 for state in states if state == "RUNNING"),
+                "done": self._done,
+                "failed": self._failed,
+            }
+
+    def summary(self):
+        """Human readable totals for the end-of-run report"""
+        counts = self.counts()
+        return (
+            f"Jobs: {counts['pending']} pending, {counts['running']} running, "
+            f"{counts['done']} done, {counts['failed']} failed "
+            f"({self.api_calls} status API calls)"
+        )
+
+    def _poll_loop(self):
+        while True:
+            with self._lock:
+                if not self._outstanding:
+                    self._thread = None
+                    return
+                entries = list(self._outstanding.values())
+            try:
+                self._refresh(entries)
+            except Exception as e:
+                print(f"Job tracker refresh failed, retrying: {e}")
+            time.sleep(self.poll_interval)
+
+    def _refresh(self, entries):
+        # One listing per project and unfinished state covers every outstanding job of that project
+        by_project = {}
+        for entry in entries:
+            by_project.setdefault(entry.job.project, []).append(entry)
+
+        for project, project_entries in by_project.items():
+            wanted = {entry.job.job_id: entry for entry in project_entries}
+            oldest = min(entry.job.created or entry.submitted for entry in project_entries)
+            client = project_entries[0].client
+            for state in UNFINISHED_STATES:
+                listing = client.list_jobs(
+                    project=project,
+                    state_filter=state,
+                    min_creation_time=oldest - timedelta(minutes=1),
+                    page_size=LIST_PAGE_SIZE
+                )
+                for page in listing.pages:
+                    self.api_calls += 1
+                    for listed in page:
+                        entry = wanted.pop(listed.job_id, None)
+                        if entry is not None:
+                            self._update(entry, listed)
+
+            # Jobs missing from both listings have most likely finished, so each is reloaded once on its own
+            for entry in wanted.values():
+                self.api_calls += 1
+                try:
+                    entry.job.reload()
+                except Exception as e:
+                    print(f"Reloading job {entry.job.job_id} failed, retrying: {e}")
+                    continue
+                self._update(entry, entry.job)
+
+    def _update(self, entry, job):
+        with self._lock:
+            self._states[entry.job.job_id] = job.state
+            if job.state != "DONE":
+                return
+            del self._outstanding[entry.job.job_id]
+            del self._states[entry.job.job_id]
+            if job.error_result:
+                self._failed += 1
+            else:
+                self._done += 1
+        entry.finished = job
+        entry.event.set()
+        if entry.callback is not None:
+            try:
+                entry.callback(job)
+            except Exception as e:
+                print(f"Completion callback for job {job.job_id} failed: {e}")
+
+
+_shared_tracker = None
+_shared_tracker_lock = threading.Lock()
+
+
+def shared_tracker():
+    """Process-wide tracker used by the copy engine unless one is passed explicitly"""
+    global _shared_tracker
+    with _shared_tracker_lock:
+        if _shared_tracker is None:
+            _shared_tracker = JobTracker()
+        return _shared_tracker
@@ -0,0 +1,177 @@
+from google.api_core.exceptions import NotFound
+import threading
+import time
+
+# Seconds a cached dataset or table lookup stays valid
+METADATA_TTL = 300
+
+# Lookups kept at most; beyond that the ones closest to expiry are dropped first
+MAX_CACHE_ENTRIES = 50000
+
+
+class MetadataCache:
+    """Process-wide TTL cache of dataset and table metadata, shared by every client
+
+    Lookups that raised NotFound are cached as well, so probing the same
+    missing dataset through the US and the EU client costs one round trip.
+    Expired entries are dropped whenever a lookup is stored and the cache
+    never holds more than max_entries, so memory stays flat on long runs.
+    """
+
+    def __init__(self, ttl=METADATA_TTL, max_entries=MAX_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._volatile = set()
+
+    def lookup(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss or after expiry"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                value, error = entry[1], entry[2]
+                if error is not None:
+                    raise error
+                return value
+            self.misses += 1
+
+        try:
+            value = loader()
+        except NotFound as e:
+            self._store(key, None, e)
+            raise
+        self._store(key, value, None)
+        return value
+
+    def _store(self, key, value, error):
+        now = time.monotonic()
+        with self._lock:
+            # Entries are kept in insertion order, which with one TTL is also expiry order
+            self._entries.pop(key, None)
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][0] > now and len(self._entries) < self.max_entries:
+                    break
+                del self._entries[oldest]
+            dataset_key = key[1]
+            if dataset_key not in self._volatile:
+                self._entries[key] = (now + self.ttl, value, error)
+
+    def invalidate_dataset(self, dataset_key):
+        """Forget a dataset, its table listing and every table in it"""
+        with self._lock:
+            self._entries = {key: entry for key, entry in self._entries.items() if key[1] != dataset_key}
+
+    def invalidate_table(self, dataset_key, table_key):
+        """Forget one table and the listing of the dataset that holds it"""
+        with self._lock:
+            self._entries.pop(("table", dataset_key, table_key), None)
+            self._entries.pop(("tables", dataset_key, None), None)
+
+    def mark_volatile(self, dataset_key):
+        """Stop caching a dataset whose tables are being written by jobs of this process"""
+        with self._lock:
+            # Every copy into the dataset lands here; only the first one has cached entries to drop
+            if dataset_key in self._volatile:
+                return
+            self._volatile.add(dataset_key)
+        self.invalidate_dataset(dataset_key)
+
+    def summary(self):
+        return f"Metadata cache: {self.hits} hits, {self.misses} misses"
+
+
+class CachedClient:
+    """bigquery.Client wrapper that answers repeated metadata lookups from a shared cache
+
+    get_dataset, list_tables and get_table are cached; create_dataset,
+    delete_dataset, delete_table and copy_table invalidate what they change.
+    Datasets that receive copy jobs are never cached, because their tables
+    appear as the jobs finish. Everything else is passed to the wrapped client.
+    """
+
+    def __init__(self, client, cache=None):
+        self._client = client
+        self.cache = cache or shared_cache()
+
+    @property
+    def uncached(self):
+        """The wrapped client, for callers that must always see live metadata"""
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _dataset_key(self, dataset):
+        if isinstance(dataset, str):
+            return dataset if "." in dataset else f"{self._client.project}.{dataset}"
+        return f"{dataset.project}.{dataset.dataset_id}"
+
+    def _table_keys(self, table):
+        if isinstance(table, str):
+            parts = table.split(".")
+            if len(parts) == 2:
+                parts.insert(0, self._client.project)
+            dataset_key = ".".join(parts[:-1])
+            return dataset_key, f"{dataset_key}.{parts[-1]}"
+        dataset_key = f"{table.project}.{table.dataset_id}"
+        return dataset_key, f"{dataset_key}.{table.table_id}"
+
+    def get_dataset(self, dataset_ref, **kwargs):
+        dataset_key = self._dataset_key(dataset_ref)
+        return self.cache.lookup(
+            ("dataset", dataset_key, None),
+            lambda: self._client.get_dataset(dataset_ref, **kwargs)
+        )
+
+    def list_tables(self, dataset, **kwargs):
+        dataset_key = self._dataset_key(dataset)
+        return list(self.cache.lookup(
+            ("tables", dataset_key, None),
+            lambda: list(self._client.list_tables(dataset, **kwargs))
+        ))
+
+    def get_table(self, table, **kwargs):
+        dataset_key, table_key = self._table_keys(table)
+        return self.cache.lookup(
+            ("table", dataset_key, table_key),
+            lambda: self._client.get_table(table, **kwargs)
+        )
+
+    def create_dataset(self, dataset, *args, **kwargs):
+        self.cache.invalidate_dataset(self._dataset_key(dataset))
+        return self._client.create_dataset(dataset, *args, **kwargs)
+
+    def delete_dataset(self, dataset, *args, **kwargs):
+        try:
+            return self._client.delete_dataset(dataset, *args, **kwargs)
+        finally:
+            self.cache.invalidate_dataset(self._dataset_key(dataset))
+
+    def delete_table(self, table, *args, **kwargs):
+        try:
+            return self._client.delete_table(table, *args, **kwargs)
+        finally:
+            self.cache.invalidate_table(*self._table_keys(table))
+
+    def copy_table(self, sources, destination, *args, **kwargs):
+        self.cache.mark_volatile(self._table_keys(destination)[0])
+        return self._client.copy_table(sources, destination, *args, **kwargs)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def shared_cache():
+    """Process-wide cache shared by every CachedClient"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = MetadataCache()
+        return _shared_cache
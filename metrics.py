@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import math
+import os
+import threading
+import time
+
+# Default output files, relative to the working directory of the run
+METRICS_PATH = "migration_metrics.jsonl"
+PROMETHEUS_PATH = "migration_metrics.prom"
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = "bq_migration"
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers, None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{str(value)}"' for name, value in labels.items())
+
+
+class MigrationMetrics:
+    """Timing, volume and retry samples of a run, streamed to a JSON-lines file
+
+    Two kinds of records are written: "step" records (one per dataset step or
+    table step, with start and end time, bytes and rows) and "job" records
+    (one per copy job, with operation, latency and throttling retries; the
+    latency runs from the moment the job got its controller slot).
+    write_prometheus() exports the totals in Prometheus text format, e.g. for
+    the node_exporter textfile collector.
+    """
+
+    def __init__(self, path=METRICS_PATH, prometheus_path=PROMETHEUS_PATH):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self.steps = []
+        self.jobs = []
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if record["kind"] == "step":
+                self.steps.append(record)
+            else:
+                self.jobs.append(record)
+            if self.path:
+                with open(self.path, "a") as metrics_file:
+                    metrics_file.write(line + "\n")
+
+    @contextmanager
+    def step(self, dataset, step, table=None, num_bytes=0, num_rows=0):
+        """Time one step; the yielded record can be updated, e.g. status="failed" for a soft failure"""
+        record = {
+            "kind": "step",
+            "dataset": dataset,
+            "step": step,
+            "table": table,
+            "bytes": num_bytes,
+            "rows": num_rows,
+            "status": "ok",
+            "start": time.time(),
+        }
+        try:
+            yield record
+        except Exception:
+            record["status"] = "failed"
+            raise
+        finally:
+            record["end"] = time.time()
+            record["seconds"] = round(record["end"] - record["start"], 3)
+            self._write(record)
+
+    def job(self, step, task, operation_type, latency, retries=0, status="ok"):
+        """Record one finished (or failed) copy job"""
+        self._write({
+            "kind": "job",
+            "time": datetime.now(timezone.utc).isoformat(),
+            "step": step,
+            "table": task.table_id,
+            "source": task.source_table_id,
+            "destination": task.destination_table_id,
+            "operation": operation_type,
+            "bytes": task.num_bytes,
+            "latency": round(latency, 3),
+            "retries": retries,
+            "status": status,
+        })
+
+    def _run_totals(self):
+        with self._lock:
+            jobs = list(self.jobs)
+            steps = list(self.steps)
+        latencies = [job["latency"] for job in jobs if job["status"] == "ok"]
+        # Only full copies move bytes; snapshots and clones are metadata operations
+        copied_bytes = sum(job["bytes"] for job in jobs if job["status"] == "ok" and job["operation"] == "COPY")
+        elapsed = max(time.time() - self.started, 1e-9)
+        return jobs, steps, latencies, copied_bytes, elapsed
+
+    def summary(self):
+        """Run-level summary lines: job latency percentiles, retries and aggregate throughput"""
+        jobs, steps, latencies, copied_bytes, elapsed = self._run_totals()
+        lines = [f"Metrics: {len(jobs)} jobs, {sum(job['retries'] for job in jobs)} retries, "
+                 f"{sum(1 for job in jobs if job['status'] != 'ok')} failed"]
+        if latencies:
+            lines.append(f"Job latency: p50 {percentile(latencies, 0.5):.1f}s, p95 {percentile(latencies, 0.95):.1f}s, "
+                         f"max {max(latencies):.1f}s")
+        lines.append(f"Throughput: {copied_bytes / 1024 ** 3:.2f} GiB copied in {elapsed:.0f}s "
+                     f"({copied_bytes / elapsed / 1024 ** 2:.1f} MiB/s)")
+        return lines
+
+    def write_prometheus(self, path=None):
+        """Write the run totals in Prometheus text format, replacing the file atomically"""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        jobs, steps, latencies, copied_bytes, elapsed = self._run_totals()
+
+        step_totals = {}
+        for record in steps:
+            key = (record["dataset"], record["step"], record["status"])
+            seconds, count, num_bytes, rows = step_totals.get(key, (0.0, 0, 0, 0))
+            step_totals[key] = (seconds + record["seconds"], count + 1, num_bytes + record["bytes"], rows + record["rows"])
+
+        p = METRIC_PREFIX
+        lines = []
+        step_metrics = (
+            ("step_seconds", "Summed duration of migration steps", "gauge"),
+            ("steps_total", "Migration steps run", "counter"),
+            ("step_bytes_total", "Table bytes handled by migration steps", "counter"),
+            ("step_rows_total", "Table rows handled by migration steps", "counter"),
+        )
+        for index, (name, description, metric_type) in enumerate(step_metrics):
+            lines += [f"# HELP {p}_{name} {description}", f"# TYPE {p}_{name} {metric_type}"]
+            for (dataset, step, status), values in sorted(step_totals.items()):
+                value = f"{values[index]:.3f}" if index == 0 else values[index]
+                lines.append(f"{p}_{name}{{{_labels(dataset=dataset, step=step, status=status)}}} {value}")
+
+        lines += [f"# HELP {p}_job_latency_seconds Latency of successful copy jobs",
+                  f"# TYPE {p}_job_latency_seconds summary"]
+        for fraction in (0.5, 0.95):
+            if latencies:
+                lines.append(f'{p}_job_latency_seconds{{quantile="{fraction}"}} {percentile(latencies, fraction):.3f}')
+        lines.append(f"{p}_job_latency_seconds_sum {sum(latencies):.3f}")
+        lines.append(f"{p}_job_latency_seconds_count {len(latencies)}")
+        lines += [
+            f"# HELP {p}_job_retries_total Throttled copy job submissions that were retried",
+            f"# TYPE {p}_job_retries_total counter",
+            f"{p}_job_retries_total {sum(job['retries'] for job in jobs)}",
+            f"# HELP {p}_jobs_failed_total Copy jobs that failed",
+            f"# TYPE {p}_jobs_failed_total counter",
+            f"{p}_jobs_failed_total {sum(1 for job in jobs if job['status'] != 'ok')}",
+            f"# HELP {p}_copied_bytes_total Bytes physically copied by full copy jobs",
+            f"# TYPE {p}_copied_bytes_total counter",
+            f"{p}_copied_bytes_total {copied_bytes}",
+            f"# HELP {p}_throughput_bytes_per_second Copied bytes over the run's wall-clock time",
+            f"# TYPE {p}_throughput_bytes_per_second gauge",
+            f"{p}_throughput_bytes_per_second {copied_bytes / elapsed:.1f}",
+            f"# HELP {p}_run_seconds Wall-clock time of the run so far",
+            f"# TYPE {p}_run_seconds gauge",
+            f"{p}_run_seconds {elapsed:.3f}",
+        ]
+
+        # Write next to the target and rename, so a scraper never reads half a file
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as prometheus_file:
+            prometheus_file.write("\n".join(lines) + "\n")
+        os.replace(temporary, path)
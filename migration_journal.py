@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+import json
+import os
+import threading
+import uuid
+
+# Default journal file, relative to the working directory of the run
+JOURNAL_PATH = "migration_journal.jsonl"
+
+
+class MigrationJournal:
+    """Append-only JSON-lines record of completed migration work
+
+    Every line marks one step as completed for a dataset, optionally for a
+    single table, e.g. {"dataset": "sales", "step": "copy", "table": "orders"}.
+    The file is replayed on start-up so a rerun can skip work that already
+    finished and resume at the first incomplete table. A "discard" line undoes
+    earlier steps whose results no longer exist, e.g. after a sweep deleted them.
+    """
+
+    DISCARD = "discard"
+
+    # Step of the line that names the migration run, written once per journal file
+    RUN = "run"
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._entries = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run that died mid-write can leave a truncated last line
+                    continue
+                self._apply(entry)
+
+    def _apply(self, entry):
+        if entry["step"] == self.DISCARD:
+            steps = set(entry.get("steps", []))
+            tables = set(entry["tables"]) if entry.get("tables") is not None else None
+            for key in [
+                key for key in self._entries
+                if key[0] == entry["dataset"] and key[1] in steps and (tables is None or key[2] in tables)
+            ]:
+                del self._entries[key]
+        else:
+            self._entries[self._key(entry["dataset"], entry["step"], entry.get("table"))] = entry
+
+    @staticmethod
+    def _key(dataset, step, table=None):
+        return dataset, step, table
+
+    def is_done(self, dataset, step, table=None):
+        """True if the step was recorded as completed"""
+        with self._lock:
+            return self._key(dataset, step, table) in self._entries
+
+    def get(self, dataset, step, table=None):
+        """Return the recorded entry for a completed step, or None"""
+        with self._lock:
+            return self._entries.get(self._key(dataset, step, table))
+
+    def entries(self, dataset=None, step=None):
+        """All recorded entries, optionally filtered by dataset and step"""
+        with self._lock:
+            return [
+                entry for entry in self._entries.values()
+                if (dataset is None or entry["dataset"] == dataset) and (step is None or entry["step"] == step)
+            ]
+
+    def record(self, dataset, step, table=None, **details):
+        """Durably mark a step as completed"""
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "dataset": dataset,
+            "step": step,
+            "table": table,
+        }
+        entry.update(details)
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            with open(self.path, "a") as journal_file:
+                journal_file.write(line + "\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self._apply(entry)
+        return entry
+
+    def run_id(self):
+        """ID of the migration this journal belongs to: created by the first run, kept by every restart"""
+        with self._run_lock:
+            entry = self.get(None, self.RUN)
+            if entry is None:
+                run_id = f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}_{uuid.uuid4().hex[:8]}"
+                entry = self.record(None, self.RUN, run_id=run_id)
+            return entry["run_id"]
+
+    def discard(self, dataset, steps, tables=None):
+        """Durably forget every recorded entry of the given steps of a dataset, so a rerun repeats them
+
+        With tables, only the entries of those tables are forgotten.
+        """
+        if tables is None:
+            return self.record(dataset, self.DISCARD, steps=list(steps))
+        return self.record(dataset, self.DISCARD, steps=list(steps), tables=list(tables))
@@ -0,0 +1,101 @@
+from collections import namedtuple
+from google.cloud import bigquery
+
+from copy_engine import OPERATION_COPY, CopyTask, check_existing_copy, run_copy_job
+
+# Partitioned tables at least this large are copied with one job per partition
+PARTITION_COPY_MIN_BYTES = 100 * 1024 ** 3
+
+# Further attempts for a partition whose copy job failed (throttling is retried by the controller)
+PARTITION_RETRIES = 2
+
+# Partitions a copy job cannot address with a decorator
+UNCOPYABLE_PARTITIONS = {"__STREAMING_UNPARTITIONED__"}
+
+# Partitions of one table with their sizes
+PARTITIONS_QUERY = """
+SELECT partition_id, total_rows AS num_rows, total_logical_bytes AS num_bytes
+FROM `{project}.{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+WHERE table_name = @table_name AND partition_id IS NOT NULL
+"""
+
+# Table properties a copy job carries over to its destination, set by hand on a destination created up front
+TABLE_PROPERTIES = (
+    "description", "friendly_name", "labels", "require_partition_filter", "expires", "encryption_configuration"
+)
+
+Partition = namedtuple("Partition", ["partition_id", "num_rows", "num_bytes"])
+
+
+def should_split(table, operation_type, min_bytes=None):
+    """True if a table is copied partition by partition: a full copy of a large partitioned table"""
+    if min_bytes is None:
+        min_bytes = PARTITION_COPY_MIN_BYTES
+    return (
+        operation_type == OPERATION_COPY
+        and table.table_type == "TABLE"
+        and bool(getattr(table, "partitioning", None))
+        and table.num_bytes >= min_bytes
+    )
+
+
+def list_partitions(client, table_id, location=None):
+    """Partitions of a table ("project.dataset.table") with their sizes, largest first"""
+    project, dataset, table_name = table_id.split(".")
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ScalarQueryParameter("table_name", "STRING", table_name)]
+    )
+    query = PARTITIONS_QUERY.format(project=project, dataset=dataset)
+    rows = client.query(query, job_config=job_config, location=location).result()
+    partitions = [
+        Partition(row.partition_id, row.num_rows or 0, row.num_bytes or 0)
+        for row in rows
+        if row.partition_id not in UNCOPYABLE_PARTITIONS
+    ]
+    return sorted(partitions, key=lambda partition: partition.num_bytes, reverse=True)
+
+
+def partition_task(task, partition):
+    """CopyTask for one partition; WRITE_TRUNCATE lets a retry replace what a failed attempt left"""
+    return CopyTask(
+        f"{task.table_id}${partition.partition_id}",
+        f"{task.source_table_id}${partition.partition_id}",
+        f"{task.destination_table_id}${partition.partition_id}",
+        task.table_type,
+        partition.num_bytes,
+        bigquery.WriteDisposition.WRITE_TRUNCATE
+    )
+
+
+def prepare_destination(client, task, incremental=False, log=print):
+    """Create the empty destination table with the source's schema, partitioning, clustering and properties
+
+    Returns False when incremental is set and the destination is already an
+    identical copy, True when the partitions still have to be copied.
+    """
+    if incremental and check_existing_copy(client, task, log):
+        log(f"Table {task.table_id} is already up to date in {task.destination_table_id}, skipping")
+        return False
+    source = client.get_table(task.source_table_id)
+    destination = bigquery.Table(task.destination_table_id, schema=source.schema)
+    destination.time_partitioning = source.time_partitioning
+    destination.range_partitioning = source.range_partitioning
+    destination.clustering_fields = source.clustering_fields
+    for name in TABLE_PROPERTIES:
+        value = getattr(source, name, None)
+        if value is not None:
+            setattr(destination, name, value)
+    client.create_table(destination, exists_ok=True)
+    return True
+
+
+def copy_partition(client, task, step="copy", location=None, log=print, stats=None, metrics=None,
+                   retries=PARTITION_RETRIES, run_id=None):
+    """Copy one partition, resubmitting a failed job up to retries times; the CopyResult, or False on failure"""
+    for attempt in range(retries + 1):
+        result = run_copy_job(client, task, step, location, log, stats=stats, metrics=metrics, run_id=run_id)
+        if result:
+            return result
+        if attempt < retries:
+            log(f"Retrying copy of partition {task.table_id} ({attempt + 1}/{retries})")
+    return False
@@ -0,0 +1,73 @@
+from copy_engine import OPERATION_COPY, operation_for
+from scheduling import ESTIMATED_JOB_OVERHEAD, estimate_job_seconds, lpt_makespan
+
+# Journal steps that run one copy job per table
+TABLE_STEPS = ("copy", "backup", "move")
+
+
+def past_throughput(journal):
+    """Per-job transfer rate of each table step measured in earlier runs, as {step: bytes_per_second}
+
+    Table sizes come from the journaled inventories, job times from the
+    job_seconds recorded with every completed table step: the time the job
+    itself ran, without the wait for a submission slot. Only full copy jobs
+    that transferred the table count: snapshots, clones and tables kept by
+    an incremental run take seconds whatever their size. Steps journaled
+    without their operation type or job time (by older runs) are left out too.
+    """
+    sizes = {}
+    for entry in journal.entries(step="inventory"):
+        for table in entry.get("tables", []):
+            if len(table) >= 3:
+                sizes[(entry["dataset"], table[0])] = table[2]
+
+    rates = {}
+    for step in TABLE_STEPS:
+        total_bytes = 0
+        total_seconds = 0.0
+        jobs = 0
+        for entry in journal.entries(step=step):
+            if entry.get("operation_type") != OPERATION_COPY or not entry.get("transferred"):
+                continue
+            num_bytes = sizes.get((entry["dataset"], entry["table"]))
+            if not num_bytes or entry.get("job_seconds") is None:
+                continue
+            total_bytes += num_bytes
+            total_seconds += entry["job_seconds"]
+            jobs += 1
+        # Take the fixed per-job cost out, but never credit more than 90% of the time to it
+        transfer_seconds = max(total_seconds - jobs * ESTIMATED_JOB_OVERHEAD, total_seconds * 0.1)
+        if total_bytes and transfer_seconds:
+            rates[step] = total_bytes / transfer_seconds
+    return rates
+
+
+def plan_step(tables, mode, rate=None, partitions=None):
+    """Jobs, bytes physically copied and predicted job durations for one table step
+
+    partitions(table, operation_type) returns the partitions still to copy of
+    a table copied one job per partition, or None for a table copied in one job.
+    """
+    durations = []
+    copied_bytes = 0
+    for table in tables:
+        operation_type = operation_for(mode, table.table_type)
+        pending = partitions(table, operation_type) if partitions is not None else None
+        if pending is not None:
+            copied_bytes += sum(partition.num_bytes for partition in pending)
+            durations.extend(estimate_job_seconds(partition.num_bytes, operation_type, rate) for partition in pending)
+        elif operation_type == OPERATION_COPY:
+            copied_bytes += table.num_bytes
+            durations.append(estimate_job_seconds(table.num_bytes, operation_type, rate))
+        else:
+            # Snapshots and clones are metadata operations whatever the table size
+            durations.append(estimate_job_seconds(table.num_bytes, operation_type))
+    return {"jobs": len(durations), "bytes": copied_bytes, "durations": durations}
+
+
+def plan_dataset_seconds(copy_plan, backup_plan, move_plan, slots):
+    """Predicted wall-clock time of one dataset: copies and backups share the slots, moves follow"""
+    return (
+        lpt_makespan(copy_plan["durations"] + backup_plan["durations"], slots)
+        + lpt_makespan(move_plan["durations"], slots)
+    )
@@ -0,0 +1,251 @@
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import sys
+import threading
+import time
+
+from scheduling import format_duration
+
+# Seconds between redraws of the live view on a terminal
+LIVE_INTERVAL = 1.0
+
+# Seconds between progress lines when output goes to a log file (no terminal)
+LOG_INTERVAL = 60.0
+
+# Copies finished within this many seconds make up the current throughput
+THROUGHPUT_WINDOW = 300.0
+
+# Per-table steps counted by the progress view, with their labels
+TABLE_STEPS = [("copy", "copy"), ("backup", "backup"), ("move", "move")]
+
+
+def format_bytes(num_bytes):
+    """Byte count with a binary unit, e.g. 1.50 GiB"""
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if abs(num_bytes) < 1024 or unit == "TiB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.2f} {unit}"
+        num_bytes /= 1024
+
+
+class RunProgress:
+    """How far a run is: datasets, tables per step and bytes copied to EU
+
+    The migration reports listed tables, finished table steps and finished
+    datasets; lines() turns that into a few lines of text with the current
+    throughput (bytes of the Step 3 copies finished in the last
+    THROUGHPUT_WINDOW seconds) and an ETA for the bytes still to copy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self, datasets=()):
+        """Begin a run over the given datasets"""
+        with self._lock:
+            self.started = time.monotonic()
+            self.datasets = list(datasets)
+            self.listed = {}
+            self.finished = {}
+            self.planned = {step: 0 for step, _ in TABLE_STEPS}
+            self.done = {step: 0 for step, _ in TABLE_STEPS}
+            self.failed = {step: 0 for step, _ in TABLE_STEPS}
+            self.listed_bytes = 0
+            self.copied_bytes = 0
+            self._copied = {}
+            self._copies = deque()
+
+    def tables_listed(self, dataset, tables):
+        """More tables of a dataset were listed; each needs a copy, a backup and a move"""
+        with self._lock:
+            count, num_bytes = self.listed.get(dataset, (0, 0))
+            added = sum(table.num_bytes for table in tables)
+            self.listed[dataset] = (count + len(tables), num_bytes + added)
+            for step in self.planned:
+                self.planned[step] += len(tables)
+            self.listed_bytes += added
+
+    def table_step_finished(self, dataset, step, table, entry=None, ok=True, resumed=False):
+        """One table finished one step; partition steps ("table$partition") are not counted
+
+        Steps a previous run completed (resumed) count as done but not towards the throughput.
+        """
+        if step not in self.planned or table is None or "$" in table:
+            return
+        with self._lock:
+            if not ok:
+                self.failed[step] += 1
+                return
+            self.done[step] += 1
+            if step == "copy" and entry is not None:
+                self.copied_bytes += entry.num_bytes
+                self._copied[dataset] = self._copied.get(dataset, 0) + entry.num_bytes
+                if not resumed:
+                    self._copies.append((time.monotonic(), entry.num_bytes))
+
+    def dataset_finished(self, summary):
+        """One dataset reached its end, whatever the outcome; what it did not copy is no longer expected"""
+        dataset = summary["dataset"]
+        with self._lock:
+            self.finished[dataset] = summary["status"]
+            _, listed_bytes = self.listed.get(dataset, (0, 0))
+            self.listed_bytes -= max(0, listed_bytes - self._copied.get(dataset, 0))
+
+    def throughput(self, now=None):
+        """Bytes per second copied to EU over the last THROUGHPUT_WINDOW seconds (or since the start)"""
+        now = now or time.monotonic()
+        with self._lock:
+            while self._copies and self._copies[0][0] < now - THROUGHPUT_WINDOW:
+                self._copies.popleft()
+            window = min(THROUGHPUT_WINDOW, now - self.started)
+            recent = sum(num_bytes for _, num_bytes in self._copies)
+        return recent / window if window > 0 else 0.0
+
+    def remaining_bytes(self):
+        """Bytes still to copy; datasets not listed yet are assumed to be as big as the average listed one"""
+        with self._lock:
+            remaining = max(0, self.listed_bytes - self.copied_bytes)
+            pending = [dataset for dataset in self.datasets if dataset not in self.listed and dataset not in self.finished]
+            if pending and self.listed:
+                remaining += len(pending) * self.listed_bytes / len(self.listed)
+        return remaining
+
+    def lines(self):
+        """The current progress as a few lines of text"""
+        now = time.monotonic()
+        throughput = self.throughput(now)
+        remaining = self.remaining_bytes()
+        with self._lock:
+            statuses = list(self.finished.values())
+            in_progress = sum(1 for dataset in self.listed if dataset not in self.finished)
+            lines = [
+                f"Progress after {format_duration(now - self.started)}: "
+                f"{len(self.finished)}/{len(self.datasets)} datasets done "
+                f"({statuses.count('migrated')} migrated, {statuses.count('skipped')} skipped, "
+                f"{statuses.count('failed')} failed), {in_progress} in progress",
+                "Tables: " + ", ".join(
+                    f"{label} {self.done[step]}/{self.planned[step]}"
+                    + (f" ({self.failed[step]} failed)" if self.failed[step] else "")
+                    for step, label in TABLE_STEPS
+                ),
+            ]
+            copied = self.copied_bytes
+        if throughput > 0:
+            eta = format_duration(remaining / throughput) if remaining else "0s"
+        else:
+            eta = "unknown"
+        lines.append(f"Copied: {format_bytes(copied)} of {format_bytes(copied + remaining)}, "
+                     f"{format_bytes(throughput)}/s, ETA {eta}")
+        return lines
+
+
+class ProgressDisplay:
+    """Show a RunProgress while a run goes on
+
+    On a terminal the progress stays below the log output and is redrawn in
+    place every LIVE_INTERVAL seconds; log lines printed through paused() go
+    above it. Without a terminal (e.g. in a job scheduler's log) one
+    timestamped progress line is written every LOG_INTERVAL seconds instead.
+    """
+
+    def __init__(self, progress, interval=None, stream=None, live=None):
+        self.progress = progress
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty() if live is None else live
+        self.interval = interval or (LIVE_INTERVAL if self.live else LOG_INTERVAL)
+        self._lock = threading.Lock()
+        self._drawn = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _clear(self):
+        if self._drawn:
+            # Cursor to the start of the first progress line, then erase to the end of the screen
+            self.stream.write(f"\x1b[{self._drawn}F\x1b[J")
+            self._drawn = 0
+
+    def _draw(self):
+        lines = self.progress.lines()
+        self.stream.write("\n".join(lines) + "\n")
+        self._drawn = len(lines)
+
+    def refresh(self):
+        """Redraw the live view, or write one progress line"""
+        with self._lock:
+            if self.live:
+                self._clear()
+                self._draw()
+            else:
+                self.stream.write(f"{datetime.now():%Y-%m-%d %H:%M:%S} {' | '.join(self.progress.lines())}\n")
+            self.stream.flush()
+
+    @contextmanager
+    def paused(self):
+        """Take the live view off the screen while the caller prints"""
+        with self._lock:
+            running = self.live and self._thread is not None
+            if running:
+                self._clear()
+            try:
+                yield
+            finally:
+                if running:
+                    self._draw()
+                    self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def start(self):
+        """Show progress until stop()"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="progress-display", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop updating and leave the final progress on the screen (or in the log)"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            self._thread = None
+            self._clear()
+        self.refresh()
+
+
+_shared_progress = None
+_shared_progress_lock = threading.Lock()
+_display = None
+
+
+def shared_progress():
+    """Process-wide progress of the current run, fed by the migration steps"""
+    global _shared_progress
+    with _shared_progress_lock:
+        if _shared_progress is None:
+            _shared_progress = RunProgress()
+        return _shared_progress
+
+
+def show_progress(interval=None, stream=None):
+    """Start displaying shared_progress(); returns the display, stop() it at the end of the run"""
+    global _display
+    display = ProgressDisplay(shared_progress(), interval, stream)
+    _display = display
+    return display.start()
+
+
+@contextmanager
+def progress_paused():
+    """Print without garbling the live view, if one is shown"""
+    display = _display
+    if display is None:
+        yield
+    else:
+        with display.paused():
+            yield
@@ -1,6 +1,12 @@
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 
+from client_factory import ClientFactory
+from copy_engine import CopyTask, run_copy_jobs
+from job_tracker import shared_tracker
+from metrics import MigrationMetrics
+from validation import validate_dataset_copy
+
 # Configuration
 PROJECT_ID = "ti-is-datti-prodenv"
 SOURCE_DATASETS = [
@@ -13,13 +19,13 @@ SERVICE_ACCOUNT_JSON = "/root/jsonfiles/ti-dba-prod-01.json"
 
 
 def migrate_datasets_with_backup():
-    # Initialize clients with explicit credentials
-    us_client = bigquery.Client.from_service_account_json(
-        SERVICE_ACCOUNT_JSON, location="US"
-    )
-    eu_client = bigquery.Client.from_service_account_json(
-        SERVICE_ACCOUNT_JSON, location="EU"
-    )
+    # Initialize clients with explicit credentials, loaded once and shared by both clients
+    factory = ClientFactory(SERVICE_ACCOUNT_JSON, cached=False)
+    us_client = factory.client("US")
+    eu_client = factory.client("EU")
+
+    # Step and job timings of the whole run, see metrics.py
+    metrics = MigrationMetrics()
 
     # Process each dataset in the list
     for source_dataset in SOURCE_DATASETS:
@@ -80,42 +86,31 @@ def migrate_datasets_with_backup():
 
         # Step 3: Copy all tables from source to temporary EU dataset
         print("Copying tables to EU location...")
+        copy_tasks = []
         for table in tables:
             source_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
             temp_eu_table_id = f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}"
             print(f"Preparing to copy {source_table_id} to {temp_eu_table_id}")
-
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-
-            # Execute the copy job
-            try:
-                copy_job = eu_client.copy_table(
-                    source_table_id,
-                    temp_eu_table_id,
-                    location="US",  # Source data is in US
-                    job_config=job_config
-                )
-
-                print(f"Copying table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully copied to EU")
-            except Exception as e:
-                print(f"Error copying table {table.table_id}: {e}")
-                continue  # Skip to next table
-
-        # Step 4: Validate the copy
+            copy_tasks.append(CopyTask(table.table_id, source_table_id, temp_eu_table_id))
+
+        # Submit all copies at once; the shared job tracker reports completions
+        with metrics.step(source_dataset, "copy"):
+            run_copy_jobs(
+                eu_client,
+                copy_tasks,
+                step="copy",
+                location="US",  # Source data is in US
+                metrics=metrics
+            )
+
+        # Step 4: Validate the copy (row counts, sizes and schemas, one metadata query per side)
         print("Validating the copy...")
         try:
-            eu_tables = list(eu_client.list_tables(temp_eu_dataset))
-            if len(eu_tables) != len(tables):
-                print(f"Validation failed: Expected {len(tables)} tables, found {len(eu_tables)}")
-                continue  # Skip to next dataset
-
-            eu_table_ids = [table.table_id for table in eu_tables]
-            if set(table_ids) != set(eu_table_ids):
-                print(f"Validation failed: Table lists don't match")
+            mismatches = validate_dataset_copy(
+                us_client, source_dataset, eu_client, temp_eu_dataset, table_ids, project=PROJECT_ID
+            )
+            if mismatches:
+                print(f"Validation failed for {len(mismatches)} tables")
                 continue  # Skip to next dataset
 
             print("All tables successfully copied and validated")
@@ -136,28 +131,16 @@ def migrate_datasets_with_backup():
 
         # Step 6: Copy all tables to backup dataset
         print("Creating backup of original dataset...")
-        for table in tables:
-            source_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
-            backup_table_id = f"{PROJECT_ID}.{backup_dataset}.{table.table_id}"
-
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-
-            # Execute the copy job
-            try:
-                copy_job = us_client.copy_table(
-                    source_table_id,
-                    backup_table_id,
-                    job_config=job_config
-                )
-
-                print(f"Backing up table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully backed up")
-            except Exception as e:
-                print(f"Error backing up table {table.table_id}: {e}")
-                continue  # Skip to next table
+        backup_tasks = [
+            CopyTask(
+                table.table_id,
+                f"{PROJECT_ID}.{source_dataset}.{table.table_id}",
+                f"{PROJECT_ID}.{backup_dataset}.{table.table_id}"
+            )
+            for table in tables
+        ]
+        with metrics.step(source_dataset, "backup"):
+            run_copy_jobs(us_client, backup_tasks, step="backup", metrics=metrics)
 
         # Step 7: Delete original dataset
         print(f"Deleting original dataset '{source_dataset}'...")
@@ -181,28 +164,16 @@ def migrate_datasets_with_backup():
 
         # Step 9: Copy all tables from temporary to final dataset
         print("Moving tables to final dataset...")
-        for table in tables:
-            temp_eu_table_id = f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}"
-            target_table_id = f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
-
-            # Configure the copy job
-            job_config = bigquery.CopyJobConfig()
-            job_config.write_disposition = bigquery.WriteDisposition.WRITE_EMPTY
-
-            # Execute the copy job
-            try:
-                copy_job = eu_client.copy_table(
-                    temp_eu_table_id,
-                    target_table_id,
-                    job_config=job_config
-                )
-
-                print(f"Moving table {table.table_id}...")
-                copy_job.result()  # Wait for completion
-                print(f"Table {table.table_id} successfully moved to final dataset")
-            except Exception as e:
-                print(f"Error moving table {table.table_id}: {e}")
-                continue  # Skip to next table
+        move_tasks = [
+            CopyTask(
+                table.table_id,
+                f"{PROJECT_ID}.{temp_eu_dataset}.{table.table_id}",
+                f"{PROJECT_ID}.{source_dataset}.{table.table_id}"
+            )
+            for table in tables
+        ]
+        with metrics.step(source_dataset, "move"):
+            run_copy_jobs(eu_client, move_tasks, step="move", metrics=metrics)
 
         # Step 10: Clean up temporary EU dataset
         print(f"Cleaning up temporary EU dataset '{temp_eu_dataset}'...")
@@ -217,6 +188,10 @@ def migrate_datasets_with_backup():
         print(f"New dataset: {source_dataset} (EU location)")
 
     print("\nAll datasets processing completed!")
+    print(shared_tracker().summary())
+    for line in metrics.summary():
+        print(line)
+    metrics.write_prometheus()
 
 
 if __name__ == "__main__":
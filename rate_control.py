@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from google.api_core.exceptions import TooManyRequests
+import random
+import threading
+import time
+
+# Average copy job submissions per second, and how many may be sent in a burst
+SUBMIT_RATE = 5.0
+SUBMIT_BURST = 10
+
+# Bounds and starting size of the adaptive window of jobs in flight (whole process)
+MIN_WINDOW = 2
+MAX_WINDOW = 200
+INITIAL_WINDOW = 20
+
+# The window only grows while the smoothed submission latency stays under this multiple of the best seen
+LATENCY_TOLERANCE = 2.0
+
+# Throttled submissions are retried this many times, backing off exponentially from BACKOFF_BASE
+MAX_THROTTLE_RETRIES = 8
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Error reasons BigQuery uses for rate limits and quota exhaustion
+THROTTLE_REASONS = {"rateLimitExceeded", "quotaExceeded"}
+
+
+def is_throttling_error(error):
+    """True for 429s and rateLimitExceeded / quotaExceeded errors, including failed job results"""
+    if isinstance(error, TooManyRequests):
+        return True
+    for detail in getattr(error, "errors", None) or []:
+        if isinstance(detail, dict) and detail.get("reason") in THROTTLE_REASONS:
+            return True
+    message = str(error)
+    return any(reason in message for reason in THROTTLE_REASONS)
+
+
+class TokenBucket:
+    """Classic token bucket: take() blocks until a token is available"""
+
+    def __init__(self, rate=SUBMIT_RATE, burst=SUBMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SubmissionController:
+    """Token bucket plus an AIMD window that decides how many copy jobs may run at once
+
+    Every finished job that was not throttled grows the window by roughly one
+    slot per window's worth of jobs, as long as the latency of submission calls
+    stays healthy (job run time depends on table size, so it is not used). A
+    throttling error halves the window (at most once per BACKOFF_BASE seconds)
+    and the throttled call is retried after an exponential backoff instead of
+    failing.
+    """
+
+    def __init__(self, rate=SUBMIT_RATE, burst=SUBMIT_BURST, initial_window=INITIAL_WINDOW,
+                 min_window=MIN_WINDOW, max_window=MAX_WINDOW):
+        self.bucket = TokenBucket(rate, burst)
+        self.min_window = min_window
+        self.max_window = max_window
+        self.window = float(initial_window)
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._latency = None
+        self._best_latency = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Hold one window slot for the lifetime of a job; yields a dict to flag throttling"""
+        with self._cond:
+            while self.in_flight >= int(self.window):
+                self._cond.wait()
+            self.in_flight += 1
+        outcome = {"throttled": False}
+        try:
+            yield outcome
+        finally:
+            self.release(outcome["throttled"])
+
+    def try_acquire(self):
+        """Take a window slot without waiting; True if one was free (pair with release())"""
+        with self._cond:
+            if self.in_flight >= int(self.window):
+                return False
+            self.in_flight += 1
+            return True
+
+    def free_slots(self):
+        with self._cond:
+            return max(0, int(self.window) - self.in_flight)
+
+    def release(self, throttled=False):
+        """Give a slot back; a throttled job shrinks the window, any other grows it"""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self._decrease()
+            else:
+                self._increase()
+            self._cond.notify_all()
+
+    def call(self, fn, on_retry=None):
+        """Run an API call at the bucket's rate, retrying it while BigQuery throttles
+
+        on_retry, if given, is called before every retry.
+        """
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            self.bucket.take()
+            started = time.monotonic()
+            try:
+                result = fn()
+                self._observe(time.monotonic() - started)
+                return result
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == MAX_THROTTLE_RETRIES:
+                    raise
+                self.on_throttled()
+                if on_retry is not None:
+                    on_retry()
+                self.backoff(attempt)
+
+    def on_throttled(self):
+        """Record a throttling error outside of a slot and shrink the window"""
+        with self._cond:
+            self.throttled += 1
+            self.retries += 1
+            self._decrease()
+
+    def backoff(self, attempt):
+        """Sleep before retry number attempt + 1, with full jitter"""
+        time.sleep(self.backoff_delay(attempt))
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def _observe(self, latency):
+        with self._cond:
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+            if self._best_latency is None or self._latency < self._best_latency:
+                self._best_latency = self._latency
+
+    def _increase(self):
+        if self._latency is None or self._latency <= self._best_latency * LATENCY_TOLERANCE:
+            self.window = min(self.max_window, self.window + 1.0 / self.window)
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= BACKOFF_BASE:
+            self.window = max(self.min_window, self.window / 2)
+            self._last_decrease = now
+
+    def summary(self):
+        return (
+            f"Submission control: window {int(self.window)}, "
+            f"{self.throttled} throttling errors, {self.retries} transparent retries"
+        )
+
+
+_shared_controller = None
+_shared_controller_lock = threading.Lock()
+
+
+def shared_controller():
+    """Process-wide controller; BigQuery quotas apply per project, not per dataset"""
+    global _shared_controller
+    with _shared_controller_lock:
+        if _shared_controller is None:
+            _shared_controller = SubmissionController()
+        return _shared_controller
@@ -0,0 +1,63 @@
+from google.api_core.exceptions import NotFound
+import time
+
+# Exponential backoff used while waiting for a dataset to disappear or become usable
+INITIAL_DELAY = 0.5
+MAX_DELAY = 8.0
+BACKOFF_FACTOR = 2.0
+
+# Seconds to keep polling before giving up
+DEFAULT_DEADLINE = 120.0
+
+
+def wait_until(check, description, deadline=DEFAULT_DEADLINE, initial_delay=INITIAL_DELAY,
+               max_delay=MAX_DELAY, log=print):
+    """Call check() until it returns True, backing off exponentially; raise TimeoutError at the deadline
+
+    The first check happens immediately, so an operation that is already
+    complete costs no waiting at all.
+    """
+    started = time.monotonic()
+    delay = initial_delay
+    attempts = 0
+    while True:
+        attempts += 1
+        if check():
+            if attempts > 1:
+                log(f"{description} after {time.monotonic() - started:.1f}s")
+            return
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            raise TimeoutError(f"Timed out after {deadline:.0f}s waiting until {description.lower()}")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * BACKOFF_FACTOR, max_delay)
+
+
+def _dataset_exists(client, dataset_ref):
+    # Always ask BigQuery itself, never a metadata cache in front of it
+    client = getattr(client, "uncached", client)
+    try:
+        client.get_dataset(dataset_ref)
+        return True
+    except NotFound:
+        return False
+
+
+def wait_for_dataset_deleted(client, dataset_ref, deadline=DEFAULT_DEADLINE, log=print):
+    """Wait until a deleted dataset is really gone and its name can be reused"""
+    wait_until(
+        lambda: not _dataset_exists(client, dataset_ref),
+        f"Dataset '{dataset_ref.dataset_id}' is gone",
+        deadline=deadline,
+        log=log
+    )
+
+
+def wait_for_dataset_ready(client, dataset_ref, deadline=DEFAULT_DEADLINE, log=print):
+    """Wait until a newly created dataset can be read back"""
+    wait_until(
+        lambda: _dataset_exists(client, dataset_ref),
+        f"Dataset '{dataset_ref.dataset_id}' is ready",
+        deadline=deadline,
+        log=log
+    )
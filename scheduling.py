@@ -0,0 +1,46 @@
+import heapq
+
+# Rough transfer rates used to predict how long a copy job takes, per copy operation
+ESTIMATED_BYTES_PER_SECOND = {
+    "COPY": 200 * 1024 ** 2,
+}
+
+# Fixed cost of every job (submission, scheduling, commit), in seconds
+ESTIMATED_JOB_OVERHEAD = 5.0
+
+
+def largest_first(tables):
+    """Tables ordered by size, biggest first, so the longest jobs start earliest"""
+    return sorted(tables, key=lambda table: (table.num_bytes or 0, table.num_rows or 0), reverse=True)
+
+
+def estimate_job_seconds(num_bytes, operation_type="COPY", bytes_per_second=None):
+    """Predicted duration of one copy job; snapshots and clones do not depend on size"""
+    rate = bytes_per_second or ESTIMATED_BYTES_PER_SECOND.get(operation_type)
+    if not rate:
+        return ESTIMATED_JOB_OVERHEAD
+    return ESTIMATED_JOB_OVERHEAD + (num_bytes or 0) / rate
+
+
+def lpt_makespan(durations, slots):
+    """Makespan of the longest-processing-time-first schedule of durations over parallel slots"""
+    slots = max(1, min(slots, len(durations)))
+    if not durations:
+        return 0.0
+    loads = [0.0] * slots
+    for duration in sorted(durations, reverse=True):
+        # The least loaded slot takes the next longest job
+        heapq.heapreplace(loads, loads[0] + duration)
+    return max(loads)
+
+
+def format_duration(seconds):
+    """Compact h/m/s rendering for reports"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
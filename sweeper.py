@@ -0,0 +1,164 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from discovery import list_project_datasets
+from inventory import dataset_inventory
+
+# Suffixes of the temporary EU datasets and the US backup datasets a migration creates
+TEMP_SUFFIX = "_EU"
+BACKUP_SUFFIX = "_old"
+
+# Label put on every dataset the migration creates; its value is the dataset's role
+MIGRATION_LABEL = "eu_migration"
+
+# Journaled steps whose results live in a temp or backup dataset; a sweep makes a rerun repeat them
+SWEPT_STEPS = {
+    "temp": ["prepare_temp", "copy", "validate"],
+    "backup": ["prepare_backup", "backup"],
+}
+
+# Datasets inspected or deleted at once by the sweep
+SWEEP_WORKERS = 8
+
+# Leftovers changed more recently than this are left alone, they may belong to a running migration
+SWEEP_MIN_AGE_HOURS = 24
+
+# A leftover dataset found by the sweep and what the sweep decided about it
+Leftover = namedtuple(
+    "Leftover", "project dataset_id role source location num_bytes last_modified orphaned reason"
+)
+
+
+def migration_labels(role):
+    """Labels for a dataset the migration creates, role being temp or backup"""
+    return {MIGRATION_LABEL: role}
+
+
+def leftover_role(dataset_id):
+    """("temp" or "backup", source dataset) for a migration dataset name, None for any other name"""
+    if dataset_id.endswith(TEMP_SUFFIX):
+        return "temp", dataset_id[:-len(TEMP_SUFFIX)]
+    if dataset_id.endswith(BACKUP_SUFFIX):
+        return "backup", dataset_id[:-len(BACKUP_SUFFIX)]
+    return None
+
+
+def orphan_reason(role, source, locations, journal, labelled):
+    """(orphaned, reason) for one temp or backup dataset
+
+    A temporary dataset is an orphan once its source is still in US (the run
+    stopped before Step 7; a rerun copies again) or already in EU with the
+    migration finished. A backup is an orphan only while its source is still
+    in US, i.e. it is the partial backup of a run that never deleted the source.
+    Anything that may hold the only copy of some data is kept.
+    """
+    if not labelled and not journal.entries(dataset=source):
+        return False, "not created by the migration (no label, not in the journal)"
+    source_location = (locations.get(source) or "").upper()
+    source_deleted = journal.is_done(source, "delete_source")
+    if role == "temp":
+        if source_deleted and not journal.is_done(source, "complete"):
+            return False, f"holds the copies still to be moved into {source}"
+        if not source_location:
+            return False, f"source dataset {source} is gone, this may be the only copy"
+        if source_location == "US":
+            return True, f"migration of {source} did not finish, a rerun copies again"
+        if not journal.is_done(source, "complete"):
+            return False, f"{source} is in {source_location} but its migration is not recorded as complete"
+        return True, f"{source} is already migrated"
+    if source_location == "US" and not source_deleted:
+        return True, f"partial backup, {source} was never migrated"
+    return False, f"backup of the migrated dataset {source}"
+
+
+def inspect_leftover(client, ref, role, source, locations, journal):
+    """Size, last change and verdict of one temp or backup dataset"""
+    dataset = client.get_dataset(f"{ref.project}.{ref.dataset_id}")
+    labelled = MIGRATION_LABEL in (dataset.labels or {})
+    tables = dataset_inventory(client, ref.project, ref.dataset_id, location=ref.location)
+    # Adding tables does not touch the dataset's own modification time
+    changes = [dataset.modified] + [table.last_modified for table in tables if table.last_modified]
+    last_modified = max(change for change in changes if change is not None)
+    orphaned, reason = orphan_reason(role, source, locations, journal, labelled)
+    return Leftover(
+        ref.project, ref.dataset_id, role, source, ref.location, sum(table.num_bytes for table in tables),
+        last_modified, orphaned, reason
+    )
+
+
+def apply_thresholds(leftover, min_age_hours, min_bytes, max_bytes, now):
+    """The leftover, kept (with the reason) if it is too recent, too small or too large to sweep"""
+    if not leftover.orphaned:
+        return leftover
+    age_hours = (now - leftover.last_modified).total_seconds() / 3600
+    if age_hours < min_age_hours:
+        return leftover._replace(orphaned=False, reason=f"changed {age_hours:.1f}h ago (minimum {min_age_hours}h)")
+    if leftover.num_bytes < min_bytes:
+        return leftover._replace(orphaned=False, reason=f"smaller than {min_bytes} bytes")
+    if max_bytes is not None and leftover.num_bytes > max_bytes:
+        return leftover._replace(orphaned=False, reason=f"larger than {max_bytes} bytes")
+    return leftover
+
+
+def sweep_orphans(client, journal, project, dry_run=True, min_age_hours=SWEEP_MIN_AGE_HOURS, min_bytes=0,
+                  max_bytes=None, max_workers=SWEEP_WORKERS, log=print):
+    """Find the temp and backup datasets failed runs left in a project and delete the orphaned ones
+
+    Candidates are found by name (<dataset>_EU, <dataset>_old) and must carry
+    the migration label or belong to a dataset in the journal. With dry_run
+    (the default) nothing is deleted, the verdicts are only listed. The
+    journal forgets the steps whose results a deleted dataset held. Returns
+    every leftover found, with orphaned set on the ones that were (or would
+    be) deleted.
+    """
+    refs = list_project_datasets(client, project)
+    locations = {ref.dataset_id: ref.location for ref in refs}
+    candidates = []
+    for ref in refs:
+        role = leftover_role(ref.dataset_id)
+        if role:
+            candidates.append((ref,) + role)
+    log(f"Found {len(candidates)} temp and backup datasets among {len(refs)} datasets of project {project}")
+    if not candidates:
+        return []
+
+    def inspect(candidate):
+        ref, role, source = candidate
+        try:
+            return inspect_leftover(client, ref, role, source, locations, journal)
+        except Exception as e:
+            return Leftover(ref.project, ref.dataset_id, role, source, ref.location, 0, None, False,
+                            f"could not be inspected: {e}")
+
+    workers = max(1, min(max_workers, len(candidates)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        leftovers = list(executor.map(inspect, candidates))
+    now = datetime.now(timezone.utc)
+    leftovers = [apply_thresholds(leftover, min_age_hours, min_bytes, max_bytes, now) for leftover in leftovers]
+
+    for leftover in leftovers:
+        verdict = "orphaned" if leftover.orphaned else "kept"
+        log(f"  {leftover.dataset_id} ({leftover.role}, {leftover.location}, "
+            f"{leftover.num_bytes / 1024 ** 3:.2f} GiB): {verdict} - {leftover.reason}")
+    orphans = [leftover for leftover in leftovers if leftover.orphaned]
+    total_bytes = sum(leftover.num_bytes for leftover in orphans)
+    if dry_run:
+        log(f"Dry run: {len(orphans)} orphaned datasets ({total_bytes / 1024 ** 3:.2f} GiB) would be deleted")
+        return leftovers
+
+    def delete(leftover):
+        try:
+            client.delete_dataset(f"{leftover.project}.{leftover.dataset_id}", delete_contents=True, not_found_ok=True)
+            journal.discard(leftover.source, SWEPT_STEPS[leftover.role])
+            log(f"Deleted orphaned dataset {leftover.dataset_id}")
+            return True
+        except Exception as e:
+            log(f"Error deleting orphaned dataset {leftover.dataset_id}: {e}")
+            return False
+
+    if orphans:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(orphans)))) as executor:
+            deleted = sum(executor.map(delete, orphans))
+        log(f"Deleted {deleted} of {len(orphans)} orphaned datasets ({total_bytes / 1024 ** 3:.2f} GiB)")
+    return leftovers
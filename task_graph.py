@@ -0,0 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import heapq
+import itertools
+import threading
+import time
+
+# Seconds the scheduler waits for a running task before it looks for newly added tasks
+ADDED_TASK_POLL = 0.2
+
+
+class TaskGraph:
+    """Run named tasks on a thread pool as soon as all of their dependencies have finished
+
+    When more tasks are ready than there are workers, the ones with the
+    highest priority start first (ties keep registration order). A running
+    task may add further tasks, e.g. while it discovers work page by page;
+    they start as soon as their dependencies are done. Dependencies given as
+    `requires` must also succeed: a task that returns False reports a soft
+    failure, and tasks requiring it are skipped like the dependents of a task
+    that raised.
+    """
+
+    def __init__(self, max_workers=8, log=print):
+        self.max_workers = max(1, max_workers)
+        self.log = log
+        self.tasks = {}
+        self.dependencies = {}
+        self.priorities = {}
+        self.required = {}
+        self.results = {}
+        self.failed = {}
+        self.skipped = set()
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._added = None
+
+    def add(self, name, fn, after=(), priority=0, requires=()):
+        """Register a task; every dependency (after and requires) must already be registered"""
+        with self._lock:
+            if name in self.tasks:
+                raise ValueError(f"Task '{name}' is already registered")
+            for dependency in list(after) + list(requires):
+                if dependency not in self.tasks:
+                    raise ValueError(f"Task '{name}' depends on unknown task '{dependency}'")
+            self.tasks[name] = fn
+            self.dependencies[name] = list(after) + list(requires)
+            self.required[name] = set(requires)
+            self.priorities[name] = priority
+            if self._added is not None:
+                # Added while run() is executing; the scheduler picks it up
+                self._added.append(name)
+        return name
+
+    def _timed(self, name):
+        started = time.monotonic()
+        try:
+            return self.tasks[name]()
+        finally:
+            self.timings[name] = (started, time.monotonic())
+
+    def span(self, names):
+        """Wall-clock seconds from the first start to the last end of the given tasks"""
+        timings = [self.timings[name] for name in names if name in self.timings]
+        if not timings:
+            return 0.0
+        return max(end for _, end in timings) - min(start for start, _ in timings)
+
+    def run(self):
+        """Execute every task and return the results of the ones that succeeded
+
+        A task that raises is recorded in `failed`; everything that depends on it,
+        directly or indirectly, is recorded in `skipped` and never runs. The
+        same happens to the tasks that require a task which returned False.
+        """
+        with self._lock:
+            self._added = list(self.tasks)
+        waiting = {}
+        dependents = {}
+
+        order = itertools.count()
+        ready = []
+        running = {}
+
+        def make_ready(name):
+            heapq.heappush(ready, (-self.priorities[name], next(order), name))
+
+        def finished(name):
+            return name in self.results or name in self.failed or name in self.skipped
+
+        def broken(name):
+            # The first dependency that raised, was skipped or (if required) returned False
+            for dependency in self.dependencies[name]:
+                if dependency in self.failed or dependency in self.skipped:
+                    return dependency
+                if dependency in self.required[name] and self.results.get(dependency) is False:
+                    return dependency
+            return None
+
+        def schedule_added():
+            with self._lock:
+                added, self._added = self._added, []
+            for name in added:
+                dependents[name] = []
+                waiting[name] = {dep for dep in self.dependencies[name] if not finished(dep)}
+                for dependency in waiting[name]:
+                    dependents[dependency].append(name)
+            for name in added:
+                if waiting[name]:
+                    continue
+                dependency = broken(name)
+                if dependency:
+                    self.skipped.add(name)
+                    self.log(f"Skipping {name}: dependency {dependency} did not complete")
+                    release(name)
+                else:
+                    make_ready(name)
+
+        def release(finished):
+            # Unlock tasks whose last dependency just finished; skip the ones that lost a dependency
+            pending = [finished]
+            while pending:
+                name = pending.pop()
+                for child in dependents[name]:
+                    waiting[child].discard(name)
+                    if waiting[child]:
+                        continue
+                    dependency = broken(child)
+                    if dependency:
+                        self.skipped.add(child)
+                        self.log(f"Skipping {child}: dependency {dependency} did not complete")
+                        pending.append(child)
+                    else:
+                        make_ready(child)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                schedule_added()
+                if not ready and not running:
+                    break
+                # Only hand the pool as many tasks as it can start, so priorities are honoured
+                while ready and len(running) < self.max_workers:
+                    _, _, name = heapq.heappop(ready)
+                    running[executor.submit(self._timed, name)] = name
+
+                done, _ = wait(running, timeout=ADDED_TASK_POLL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        self.failed[name] = e
+                        self.log(f"Task {name} failed: {e}")
+                    release(name)
+
+        with self._lock:
+            self._added = None
+        return self.results
@@ -0,0 +1,339 @@
+from contextlib import redirect_stdout
+import argparse
+import asyncio
+import io
+import json
+import time
+
+from google.cloud import bigquery
+import pytest
+
+import async_engine
+import benchmark
+import bulk_data_opt
+import partition_copy
+import rate_control
+from copy_engine import OPERATION_CLONE, CopyReport, CopyTask, copy_job_config, job_id_for, run_copy_job
+from discovery import load_manifest, split_dataset_name
+from fake_bigquery import FakeBigQuery
+from metadata_cache import CachedClient, MetadataCache
+from metrics import MigrationMetrics
+from migration_journal import MigrationJournal
+from planner import past_throughput, plan_step
+from rate_control import SubmissionController, TokenBucket
+from sweeper import migration_labels, sweep_orphans
+
+PROJECT = bulk_data_opt.PROJECT_ID
+
+
+@pytest.fixture(autouse=True)
+def isolated_run(tmp_path, monkeypatch):
+    """Journal and metrics in a temporary directory, fast polling and no progress output"""
+    for name in ("SOURCE_DATASETS", "MAX_IN_FLIGHT_JOBS", "INCREMENTAL_COPY"):
+        monkeypatch.setattr(bulk_data_opt, name, getattr(bulk_data_opt, name))
+    monkeypatch.setattr(bulk_data_opt, "MIGRATION_JOURNAL", str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(bulk_data_opt, "MIGRATION_METRICS", str(tmp_path / "metrics.jsonl"))
+    monkeypatch.setattr(bulk_data_opt, "PROMETHEUS_METRICS", str(tmp_path / "metrics.prom"))
+    monkeypatch.setattr(bulk_data_opt, "SHOW_PROGRESS", False)
+    benchmark.reset_shared_state(0.01)
+
+
+def estate(tables, **options):
+    backend = FakeBigQuery(project=PROJECT, job_latency=0.01, **options)
+    backend.add_dataset("ds", "US")
+    for table_id in tables:
+        backend.add_table("ds", table_id, num_rows=10, num_bytes=1000)
+    return backend
+
+
+def migrate(backend, engine="threads"):
+    bulk_data_opt.SOURCE_DATASETS = ["ds"]
+    benchmark.reset_shared_state(0.01)
+    clients = (CachedClient(backend.client("US")), CachedClient(backend.client("EU")))
+    with redirect_stdout(io.StringIO()):
+        if engine == "async":
+            summaries = asyncio.run(async_engine.migrate_datasets_async(clients=clients))
+        else:
+            summaries = bulk_data_opt.migrate_datasets_with_backup(1, clients=clients)
+    return summaries[0]
+
+
+def tables_in(backend, dataset_id):
+    return sorted(key[2] for key in backend.tables if key[:2] == (PROJECT, dataset_id))
+
+
+def test_benchmark_passes_thresholds():
+    argv = ["--datasets", "2", "--tables", "5", "--in-flight", "5", "--workers", "1", "--engine", "both",
+            "--max-calls-per-table", "100", "--min-datasets-per-hour", "1"]
+    with redirect_stdout(io.StringIO()):
+        assert benchmark.main(argv) == 0
+
+
+def test_benchmark_fails_when_tables_fail():
+    argv = ["--datasets", "2", "--tables", "5", "--in-flight", "5", "--workers", "1", "--failure-rate", "1"]
+    with redirect_stdout(io.StringIO()):
+        assert benchmark.main(argv) == 1
+
+
+def test_benchmark_counts_failed_tables(monkeypatch):
+    def migrate_with_failures(workers, clients=None):
+        return [{"dataset": dataset_id, "status": "migrated", "failed_tables": ["table_0000"]}
+                for dataset_id in bulk_data_opt.SOURCE_DATASETS]
+
+    monkeypatch.setattr(bulk_data_opt, "migrate_datasets_with_backup", migrate_with_failures)
+    args = argparse.Namespace(
+        datasets=2, tables=1, median_table_bytes=1000, job_latency=0.01, api_latency=0.0, quota_error_rate=0.0,
+        failure_rate=0.0, concurrent_job_limit=None, seed=0, poll_interval=0.01, max_calls_per_table=None,
+        min_datasets_per_hour=None
+    )
+    journal_path = bulk_data_opt.MIGRATION_JOURNAL
+    result = benchmark.run_configuration(args, 5, 1)
+    assert result["migrated"] == 0
+    assert bulk_data_opt.MIGRATION_JOURNAL == journal_path
+    assert benchmark.check_thresholds([result], args)
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_resume_from_journal(engine):
+    backend = estate(["t0", "t1", "t2"], fail_tables=["t1"])
+    summary = migrate(backend, engine)
+    assert summary["status"] == "failed"
+    assert tables_in(backend, "ds") == ["t0", "t1", "t2"]
+
+    backend.fail_tables.clear()
+    backend.calls.clear()
+    summary = migrate(backend, engine)
+    assert summary["status"] == "migrated"
+    assert tables_in(backend, "ds") == ["t0", "t1", "t2"]
+    assert backend.datasets[(PROJECT, "ds")].location == "EU"
+
+
+@pytest.mark.parametrize("engine", ["threads", "async"])
+def test_resume_after_crash_between_delete_and_journal(engine, monkeypatch):
+    delete_source_dataset = bulk_data_opt.delete_source_dataset
+
+    def delete_then_crash(us_client, source_dataset, log=print):
+        delete_source_dataset(us_client, source_dataset, log)
+        raise RuntimeError("killed before Step 7 was journaled")
+
+    backend = estate(["t0", "t1"])
+    with monkeypatch.context() as patch:
+        patch.setattr(bulk_data_opt, "delete_source_dataset", delete_then_crash)
+        patch.setattr(async_engine, "delete_source_dataset", delete_then_crash)
+        assert migrate(backend, engine)["status"] == "failed"
+    assert (PROJECT, "ds") not in backend.datasets
+
+    summary = migrate(backend, engine)
+    assert summary["status"] == "migrated"
+    assert tables_in(backend, "ds") == ["t0", "t1"]
+    assert backend.datasets[(PROJECT, "ds")].location == "EU"
+
+
+def test_truncated_copy_keeps_source():
+    backend = estate(["t0", "t1"])
+    copy_effect = backend._copy_effect
+
+    def truncating_copy(job):
+        error = copy_effect(job)
+        if job.destination[1:] == ("ds_EU", "t1"):
+            backend.tables[job.destination].num_rows -= 1
+        return error
+
+    backend._copy_effect = truncating_copy
+    summary = migrate(backend)
+    assert summary["status"] == "failed"
+    assert summary["detail"].startswith("validate failed")
+    assert backend.datasets[(PROJECT, "ds")].location == "US"
+    assert tables_in(backend, "ds") == ["t0", "t1"]
+
+
+def test_throttled_jobs_are_retried_not_failed(monkeypatch):
+    monkeypatch.setattr(rate_control, "BACKOFF_BASE", 0.01)
+    backend = estate([f"t{index}" for index in range(6)], quota_error_rate=0.3, job_quota_error_rate=0.3)
+    summary = migrate(backend)
+    assert summary["status"] == "migrated"
+    assert summary["failed_tables"] == []
+    assert rate_control.shared_controller().throttled > 0
+
+
+def test_window_halves_on_throttling():
+    controller = SubmissionController(initial_window=20)
+    with controller.slot() as slot:
+        slot["throttled"] = True
+    assert controller.window == 10
+    # At most one decrease per BACKOFF_BASE seconds, so a burst of throttling is not punished twice
+    controller.on_throttled()
+    assert controller.window == 10
+    with controller.slot():
+        pass
+    assert controller.window == pytest.approx(10.1)
+    assert controller.throttled == 1
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=20, burst=2)
+    started = time.monotonic()
+    for _ in range(4):
+        bucket.take()
+    assert 0.08 <= time.monotonic() - started < 0.5
+
+
+def test_rejected_clone_falls_back_to_full_copy():
+    backend = estate([])
+    backend.add_dataset("ds_old", "US")
+    backend.add_table("ds", "snap", num_rows=10, num_bytes=1000, table_type="SNAPSHOT")
+    task = CopyTask("snap", f"{PROJECT}.ds.snap", f"{PROJECT}.ds_old.snap", "TABLE", 1000)
+    result = run_copy_job(backend.client("US"), task, "backup", operation_type=OPERATION_CLONE,
+                          log=lambda message: None)
+    assert result.operation_type == "COPY" and result.transferred
+    assert backend.tables[(PROJECT, "ds_old", "snap")].num_rows == 10
+
+
+def test_slow_source_release_does_not_stop_migration(monkeypatch):
+    def never_released(client, dataset_ref, deadline=None, log=print):
+        raise TimeoutError(f"Timed out waiting until dataset '{dataset_ref.dataset_id}' is gone")
+
+    monkeypatch.setattr(bulk_data_opt, "wait_for_dataset_deleted", never_released)
+    backend = estate(["t0", "t1"])
+    summary = migrate(backend)
+    assert summary["status"] == "migrated"
+    assert tables_in(backend, "ds") == ["t0", "t1"]
+
+
+def test_resume_copies_only_missing_partitions(monkeypatch):
+    monkeypatch.setattr(partition_copy, "PARTITION_COPY_MIN_BYTES", 0)
+    backend = estate(["small"])
+    backend.add_table("ds", "big", partitions={f"2024010{day}": (100, 1000) for day in range(1, 6)})
+    submit_copy = backend.submit_copy
+    failing = {"20240103"}
+    copied = []
+
+    def submit(project, location, source_key, destination_key, job_config, job_id=None, partition=None):
+        job = submit_copy(project, location, source_key, destination_key, job_config, job_id, partition)
+        if destination_key[1] == "ds_EU" and partition is not None:
+            copied.append(partition)
+            if partition in failing:
+                job._planned_error = ("backendError", "Backend error copying big")
+        return job
+
+    backend.submit_copy = submit
+    assert migrate(backend)["status"] == "failed"
+    assert "20240101" in copied
+
+    failing.clear()
+    copied.clear()
+    summary = migrate(backend)
+    assert summary["status"] == "migrated"
+    assert copied == ["20240103"]
+    assert backend.tables[(PROJECT, "ds", "big")].num_rows == 500
+
+
+def test_manifest_locations_and_domain_scoped_projects(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"datasets": ["example.com:proj.sales", "hr-prod:payroll"], "location": "us"}))
+    manifest = load_manifest(str(path))
+    assert [split_dataset_name(name) for name in manifest["datasets"]] == [
+        ("example.com:proj", "sales"), ("hr-prod", "payroll")
+    ]
+    path.write_text(json.dumps({"projects": ["sales-prod"], "location": "asia-northeast1"}))
+    with pytest.raises(ValueError):
+        load_manifest(str(path))
+
+
+def test_throughput_uses_job_time_not_queueing():
+    journal = MigrationJournal(bulk_data_opt.MIGRATION_JOURNAL)
+    journal.record("ds", "inventory", tables=[["t0", "TABLE", 10 * 1024 ** 3], ["t1", "TABLE", 10 * 1024 ** 3]])
+    journal.record("ds", "copy", "t0", seconds=600.0, operation_type="COPY", transferred=True, job_seconds=100.0)
+    # Journaled by an older run, without the job's own time
+    journal.record("ds", "copy", "t1", seconds=600.0, operation_type="COPY", transferred=True)
+    rate = past_throughput(journal)["copy"]
+    assert 10 * 1024 ** 3 / 100.0 <= rate <= 10 * 1024 ** 3 / 60.0
+
+
+def test_plan_counts_one_job_per_partition():
+    big = bulk_data_opt.TableEntry("big", "TABLE", 3000, 300, "day")
+    small = bulk_data_opt.TableEntry("small", "TABLE", 1000, 10)
+    pending = [partition_copy.Partition("20240102", 100, 1000), partition_copy.Partition("20240103", 100, 1000)]
+
+    def partitions(table, operation_type):
+        return pending if partition_copy.should_split(table, operation_type, min_bytes=2000) else None
+
+    plan = plan_step([big, small], "copy", partitions=partitions)
+    assert plan["jobs"] == 3
+    assert plan["bytes"] == 3000
+    assert plan_step([big, small], "copy")["jobs"] == 2
+
+
+def test_metadata_cache_drops_expired_and_excess_entries():
+    cache = MetadataCache(ttl=0.05, max_entries=3)
+    for index in range(5):
+        cache.lookup(("table", "p.ds", f"p.ds.t{index}"), lambda: index)
+    assert len(cache._entries) == 3
+    time.sleep(0.1)
+    cache.lookup(("dataset", "p.ds", None), lambda: "ds")
+    assert list(cache._entries) == [("dataset", "p.ds", None)]
+
+
+def test_job_latency_excludes_time_queued_for_a_slot(tmp_path):
+    metrics = MigrationMetrics(str(tmp_path / "metrics.jsonl"), str(tmp_path / "metrics.prom"))
+    report = CopyReport(CopyTask("t0", "p.ds.t0", "p.ds_EU.t0"), "copy", log=lambda message: None, metrics=metrics)
+    report.submitting()
+    time.sleep(0.2)
+    report.slot_acquired()
+    report.succeeded()
+    assert metrics.jobs[0]["latency"] < 0.1
+
+
+def test_partitioned_copy_keeps_table_properties(monkeypatch):
+    monkeypatch.setattr(partition_copy, "PARTITION_COPY_MIN_BYTES", 0)
+    backend = estate([])
+    backend.add_table("ds", "big", partitions={f"2024010{day}": (100, 1000) for day in range(1, 4)})
+    source = backend.tables[(PROJECT, "ds", "big")]
+    source.description = "Daily orders"
+    source.labels = {"team": "sales"}
+    source.require_partition_filter = True
+    source.encryption_configuration = bigquery.EncryptionConfiguration("projects/p/locations/eu/keyRings/r/cryptoKeys/k")
+
+    assert migrate(backend)["status"] == "migrated"
+    final = backend.tables[(PROJECT, "ds", "big")]
+    assert final.num_rows == 300
+    assert (final.description, final.labels, final.require_partition_filter) == ("Daily orders", {"team": "sales"}, True)
+    assert final.encryption_configuration.kms_key_name.endswith("cryptoKeys/k")
+
+
+def test_reattach_to_running_job():
+    backend = estate(["t0", "t1"])
+    backend.add_dataset("ds_EU", "EU")
+    journal = MigrationJournal(bulk_data_opt.MIGRATION_JOURNAL)
+    run_id = journal.run_id()
+    journal.record("ds", "prepare_temp")
+    task = CopyTask("t0", f"{PROJECT}.ds.t0", f"{PROJECT}.ds_EU.t0", "TABLE", 1000)
+    job_id = job_id_for(run_id, "copy", task) + "_1"
+    running = backend.submit_copy(PROJECT, "US", (PROJECT, "ds", "t0"), (PROJECT, "ds_EU", "t0"), copy_job_config(),
+                                  job_id)
+    running._finishes_at = time.monotonic() + 0.5
+
+    summary = migrate(backend)
+    assert summary["status"] == "migrated"
+    assert running.state == "DONE"
+    assert not any(job.startswith(job_id[:-2]) and job != job_id for job in backend.jobs)
+    assert tables_in(backend, "ds") == ["t0", "t1"]
+
+
+def test_sweep_keeps_temp_of_unfinished_migration():
+    backend = FakeBigQuery(project=PROJECT)
+    backend.add_dataset("ds", "EU")
+    backend.add_dataset("ds_EU", "EU", labels=migration_labels("temp"))
+    for table_id in ("t0", "t1"):
+        backend.add_table("ds_EU", table_id, num_rows=10, num_bytes=1000)
+    journal = MigrationJournal(bulk_data_opt.MIGRATION_JOURNAL)
+    client = backend.client("EU")
+
+    leftovers = sweep_orphans(client, journal, PROJECT, dry_run=False, min_age_hours=0, log=lambda message: None)
+    assert [leftover.orphaned for leftover in leftovers] == [False]
+    assert tables_in(backend, "ds_EU") == ["t0", "t1"]
+
+    journal.record("ds", "complete")
+    leftovers = sweep_orphans(client, journal, PROJECT, dry_run=False, min_age_hours=0, log=lambda message: None)
+    assert [leftover.orphaned for leftover in leftovers] == [True]
+    assert (PROJECT, "ds_EU") not in backend.datasets
@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+from inventory import dataset_inventory
+
+# What Step 4 compares between a source table and its copy
+TableFingerprint = namedtuple("TableFingerprint", ["row_count", "size_bytes", "columns"])
+
+
+def dataset_fingerprints(client, project, dataset, location=None):
+    """Fingerprint of every table in a dataset, keyed by table ID, from a single inventory query"""
+    return {
+        table.table_id: TableFingerprint(table.num_rows, table.num_bytes, table.columns)
+        for table in dataset_inventory(client, project, dataset, location)
+    }
+
+
+def compare_fingerprints(source, destination, table_ids):
+    """Differences between source tables and their copies, as {table_id: [problem, ...]}"""
+    mismatches = {}
+    for table_id in table_ids:
+        expected = source.get(table_id)
+        actual = destination.get(table_id)
+        problems = []
+        if expected is None:
+            problems.append("missing from the source dataset")
+        elif actual is None:
+            problems.append("missing from the copy")
+        else:
+            if expected.row_count != actual.row_count:
+                problems.append(f"{actual.row_count} rows, expected {expected.row_count}")
+            if expected.size_bytes != actual.size_bytes:
+                problems.append(f"{actual.size_bytes} bytes, expected {expected.size_bytes}")
+            if expected.columns != actual.columns:
+                problems.append("schema differs")
+        if problems:
+            mismatches[table_id] = problems
+    return mismatches
+
+
+def validate_dataset_copy(source_client, source_dataset, copy_client, copy_dataset, table_ids,
+                          project=None, source_location="US", copy_location="EU", log=print):
+    """Compare tables with their copies using one query per side; return the mismatches per table"""
+    source = dataset_fingerprints(source_client, project or source_client.project, source_dataset, source_location)
+    destination = dataset_fingerprints(copy_client, project or copy_client.project, copy_dataset, copy_location)
+    mismatches = compare_fingerprints(source, destination, table_ids)
+    for table_id, problems in sorted(mismatches.items()):
+        log(f"Validation failed for table {table_id}: {'; '.join(problems)}")
+    return mismatches